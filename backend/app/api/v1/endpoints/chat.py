@@ -1,10 +1,14 @@
-from fastapi import APIRouter, HTTPException
-from app.services.llm_service import llm_service
-from app.services.intent_service import intent_detector
-from app.services.mcp_service import mcp_service
-from app.services.planner_service import planner_service
-from pydantic import BaseModel
-from typing import List, Optional, Any
+from fastapi import APIRouter, Depends, Header, HTTPException, WebSocket, WebSocketDisconnect
+from fastapi.responses import StreamingResponse
+from app.core.config import settings
+from app.db.supabase_auth import get_current_user, get_current_user_optional
+from app.services.agent_service import agent_service
+from app.services.chat_job_service import chat_jobs, describe, run_chat_job
+from app.services.job_queue import Job
+from app.services.session_history_service import SessionNotFound, session_history, session_scope
+from pydantic import BaseModel, ValidationError
+from typing import Dict, List, Optional, Any
+import asyncio
 import json
 
 router = APIRouter()
@@ -19,134 +23,243 @@ class ChatResponse(BaseModel):
     intent: str
     actions: List[str] = []
 
-@router.post("/", response_model=ChatResponse)
-async def chat(request: ChatRequest):
-    # 1. Intent Detection
+async def _load_history(request: ChatRequest, user) -> Optional[List[dict]]:
+    """
+    Client-sent history if any; otherwise, for an authenticated caller with
+    a session_id, the history kept server-side (the new exchange is
+    appended after the run).
+    """
+    if not _server_side(request, user):
+        return request.history
     try:
-        intent_data = await intent_detector.detect(request.message)
-    except Exception as e:
-        intent_data = {"intent": "CHAT", "reason": f"Detector Error: {str(e)}"}
-    
-    intent = intent_data.get("intent", "CHAT")
-
-    # 2. Planning (Phase 7)
-    plan_data = None
-    if intent in ["TASK", "HYBRID"]:
+        return await session_history.load(request.session_id, user.id)
+    except SessionNotFound:
+        raise HTTPException(status_code=404, detail="Session not found")
+
+def _server_side(request: ChatRequest, user) -> bool:
+    return bool(user and request.session_id and not request.history)
+
+def _user_id(user) -> Optional[str]:
+    return user.id if user else None
+
+@router.post("/", response_model=ChatResponse)
+async def chat(request: ChatRequest, user = Depends(get_current_user_optional)):
+    history = await _load_history(request, user)
+    result = await agent_service.run_to_completion(request.message, history,
+                                                  session_scope(_user_id(user), request.session_id), _user_id(user))
+    if _server_side(request, user):
+        await session_history.append(request.session_id, user.id, request.message, result["response"])
+
+    return ChatResponse(
+        response=result["response"],
+        intent=result["intent"],
+        actions=result["actions"]
+    )
+
+@router.post("/stream")
+async def chat_stream(request: ChatRequest, user = Depends(get_current_user_optional)):
+    """
+    Server-Sent Events variant of the chat endpoint.
+
+    Emits `intent`, `plan`, `token` (LLM deltas as they arrive), `tool_start`,
+    `tool_end` and a closing `final` event with the same fields as ChatResponse.
+    """
+    history = await _load_history(request, user)
+
+    async def event_stream():
         try:
-            plan_data = await planner_service.generate_plan(request.message)
+            async for event in agent_service.run(request.message, history, stream_tokens=True,
+                                                   session_id=session_scope(_user_id(user), request.session_id),
+                                                   user_id=_user_id(user)):
+                if event["type"] == "final" and _server_side(request, user):
+                    await session_history.append(request.session_id, user.id, request.message, event["response"])
+                yield f"event: {event['type']}\ndata: {json.dumps(event, default=str)}\n\n"
         except Exception as e:
-            print(f"Planning failed: {e}")
-            plan_data = {"reasoning": "Direct execution due to planning failure.", "steps": [request.message]}
-
-    # Audit logging removed (was SQLite-based)
-
-    # 4. History Handling (from request only - Supabase handles persistence)
-    conversation_history = request.history.copy() if request.history else []
-    
-    # Inject Plan if available
-    context_instruction = llm_service.system_instruction
-    if plan_data:
-        context_instruction += f"\n\nCURRENT TASK PLAN:\n{json.dumps(plan_data['steps'], indent=2)}"
-
-    # Add user message
-    conversation_history.append({"role": "user", "parts": [{"text": request.message}]})
-    
-    actions_taken = []
-    final_response = ""
-    max_iterations = 12
-    tool_defs = mcp_service.get_tool_definitions()
-    print(f"DEBUG TOOLS: {json.dumps(tool_defs, indent=2)}")
-
-    for i in range(max_iterations):
-        try:
-            # Ask LLM
-            llm_raw = await llm_service.get_raw_response(
-                user_input="", 
-                history=conversation_history,
-                tools=tool_defs
-            )
-
-            choice = llm_raw["choices"][0]
-            message = choice["message"]
-            
-            # Record assistant msg
-            assistant_parts = []
-            if message.get("content"):
-                assistant_parts.append({"text": message["content"]})
-            
-            tool_calls = message.get("tool_calls", [])
-            for tc in tool_calls:
-                # Wrap argument parsing in safety
-                try:
-                    args = json.loads(tc["function"]["arguments"])
-                except:
-                    args = {"raw": tc["function"]["arguments"]}
-                    
-                assistant_parts.append({
-                    "function_call": {
-                        "id": tc["id"],
-                        "name": tc["function"]["name"],
-                        "args": args
-                    }
-                })
-
-            conversation_history.append({"role": "model", "parts": assistant_parts})
-
-            if tool_calls:
-                for tc in tool_calls:
-                    fn_name = tc["function"]["name"]
-                    tc_id = tc["id"]
-                    
-                    try:
-                        fn_args = json.loads(tc["function"]["arguments"])
-                    except:
-                        fn_args = {}
-
-                    actions_taken.append(f"Action: {fn_name}")
-
-                    # Execute tool with safety
-                    try:
-                        tool_result = await mcp_service.execute_tool(fn_name, fn_args)
-                    except Exception as tool_err:
-                        tool_result = f"Error executing tool: {str(tool_err)}"
-                        print(f"Tool Error: {tool_err}")
-
-                    # Add result
-                    conversation_history.append({
-                        "role": "tool", 
-                        "parts": [{
-                            "function_response": {
-                                "id": tc_id,
-                                "name": fn_name,
-                                "response": {"result": tool_result}
-                            }
-                        }]
-                    })
-            else:
-                final_response = message.get("content") or "I've completed the task as requested."
+            print(f"Chat Stream Error: {e}")
+            yield f"event: error\ndata: {json.dumps({'type': 'error', 'detail': str(e)})}\n\n"
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+def _get_job(job_id: str, user) -> Job:
+    job = chat_jobs.get(job_id)
+    if not job or job.owner_id != _user_id(user):
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+@router.post("/jobs")
+async def create_chat_job(request: ChatRequest, user = Depends(get_current_user_optional)):
+    """
+    Job mode for long-running requests: returns a job id at once and runs
+    the agent loop in the background. Poll /jobs/{job_id} or stream
+    /jobs/{job_id}/stream for its events and result.
+    """
+    history = await _load_history(request, user)
+    try:
+        job = chat_jobs.submit(
+            run_chat_job,
+            kind="chat",
+            owner_id=_user_id(user),
+            message=request.message,
+            history=history,
+            session_id=request.session_id,
+            server_side_history=_server_side(request, user)
+        )
+    except asyncio.QueueFull:
+        raise HTTPException(status_code=503, detail="Chat job queue is full, please retry shortly")
+    return {"job_id": job.id, "status": job.status}
+
+@router.get("/jobs/{job_id}")
+async def get_chat_job(job_id: str, after: int = -1, user = Depends(get_current_user_optional)):
+    """Status, result, and the events after the `after` seq (-1 for all)"""
+    job = _get_job(job_id, user)
+    return {**describe(job), "new_events": job.events_after(after)}
+
+@router.get("/jobs/{job_id}/stream")
+async def stream_chat_job(
+    job_id: str,
+    after: int = -1,
+    last_event_id: Optional[str] = Header(None),
+    user = Depends(get_current_user_optional)
+):
+    """
+    Server-Sent Events for a chat job: replays the events after `after`
+    (or the Last-Event-ID a reconnecting EventSource sends), then follows
+    the job until it finishes. Each event's SSE id is its seq.
+    """
+    job = _get_job(job_id, user)
+    if last_event_id and last_event_id.lstrip("-").isdigit():
+        after = int(last_event_id)
+
+    async def event_stream():
+        seq = after
+        while True:
+            for event in job.events_after(seq):
+                seq = event["seq"]
+                yield f"id: {seq}\nevent: {event['type']}\ndata: {json.dumps(event, default=str)}\n\n"
+            if job.done:
+                if job.status == "failed":
+                    yield f"event: error\ndata: {json.dumps({'type': 'error', 'detail': job.error})}\n\n"
                 break
-        except Exception as e:
-            print(f"Agent Loop Error: {e}")
-            final_response = f"I encountered an internal error: {str(e)}. Please check my process log."
-            break
-    
-    if not final_response:
-        # If we hit the limit, try one last call to synthesize what we have
-        try:
-            conversation_history.append({"role": "user", "parts": [{"text": "You have reached your maximum action limit. Please provide a concise summary of what you have accomplished or found so far based on the tool results above."}]})
-            llm_raw = await llm_service.get_raw_response(
-                user_input="", 
-                history=conversation_history,
-                tools=tool_defs
-            )
-            final_response = llm_raw["choices"][0]["message"].get("content") or "I've reached my process limit. Please check the logs for the data gathered."
-        except:
-            final_response = "I ran out of reasoning steps (max iterations reached). Here is what I found so far. Check the log for details."
-
-    # Logging removed (was SQLite-based)
+            if job.events_after(seq):
+                continue
+            if not await job.wait(settings.CHAT_JOB_HEARTBEAT_SECONDS):
+                yield ": keep-alive\n\n"
 
-    return ChatResponse(
-        response=final_response,
-        intent=intent,
-        actions=actions_taken
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
     )
+
+@router.websocket("/ws")
+async def chat_ws(websocket: WebSocket, token: Optional[str] = None):
+    """
+    Persistent chat transport. The connection authenticates once (an
+    Authorization header or ?token=; neither means anonymous, as with the
+    HTTP endpoints) and then carries any number of concurrent sessions.
+
+    Client messages:
+        {"type": "chat", "request_id", "message", "session_id"?, "history"?}
+        {"type": "cancel", "request_id"}
+        {"type": "ping"}
+
+    Server messages are the /stream events (intent, plan, token, tool_start,
+    tool_end, final) tagged with request_id and session_id, plus `error`,
+    `cancelled` and `pong`. Turns of one session run in order; different
+    sessions run concurrently. Disconnecting cancels the running requests.
+    """
+    authorization = websocket.headers.get("authorization") or (f"Bearer {token}" if token else None)
+    user = None
+    if authorization:
+        try:
+            user = await get_current_user(authorization)
+        except HTTPException:
+            await websocket.close(code=4401)
+            return
+    await websocket.accept()
+
+    send_lock = asyncio.Lock()
+    runs: Dict[str, asyncio.Task] = {}
+    session_locks: Dict[str, asyncio.Lock] = {}
+
+    async def send(payload: Dict[str, Any]):
+        async with send_lock:
+            try:
+                await websocket.send_text(json.dumps(payload, default=str))
+            except Exception:
+                # Disconnected; the receive loop cleans up
+                pass
+
+    async def run(request_id: str, request: ChatRequest):
+        tags = {"request_id": request_id, "session_id": request.session_id}
+        lock = session_locks.setdefault(request.session_id, asyncio.Lock()) if request.session_id else None
+        try:
+            if lock:
+                await lock.acquire()
+            try:
+                history = await _load_history(request, user)
+                async for event in agent_service.run(request.message, history, stream_tokens=True,
+                                                       session_id=session_scope(_user_id(user), request.session_id),
+                                                       user_id=_user_id(user)):
+                    if event["type"] == "final" and _server_side(request, user):
+                        await session_history.append(request.session_id, user.id, request.message, event["response"])
+                    await send({**event, **tags})
+            finally:
+                if lock:
+                    lock.release()
+        except HTTPException as e:
+            await send({"type": "error", "detail": e.detail, **tags})
+        except asyncio.CancelledError:
+            await send({"type": "cancelled", **tags})
+        except Exception as e:
+            print(f"Chat WebSocket Error: {e}")
+            await send({"type": "error", "detail": str(e), **tags})
+        finally:
+            runs.pop(request_id, None)
+
+    try:
+        while True:
+            try:
+                data = json.loads(await websocket.receive_text())
+            except ValueError:
+                await send({"type": "error", "detail": "Messages must be JSON objects"})
+                continue
+            if not isinstance(data, dict):
+                await send({"type": "error", "detail": "Messages must be JSON objects"})
+                continue
+            kind, request_id = data.get("type"), data.get("request_id")
+
+            if kind == "ping":
+                await send({"type": "pong"})
+            elif kind == "cancel":
+                task = runs.get(request_id)
+                if task:
+                    task.cancel()
+            elif kind == "chat":
+                if not request_id or request_id in runs:
+                    await send({"type": "error", "request_id": request_id, "detail": "A unique request_id is required"})
+                    continue
+                if len(runs) >= settings.CHAT_WS_MAX_CONCURRENT_RUNS:
+                    await send({"type": "error", "request_id": request_id, "detail": "Too many concurrent requests on this connection"})
+                    continue
+                try:
+                    request = ChatRequest(
+                        message=data.get("message"),
+                        session_id=data.get("session_id"),
+                        history=data.get("history") or []
+                    )
+                except ValidationError as e:
+                    await send({"type": "error", "request_id": request_id, "detail": str(e)})
+                    continue
+                runs[request_id] = asyncio.create_task(run(request_id, request))
+            else:
+                await send({"type": "error", "request_id": request_id, "detail": f"Unknown message type: {kind}"})
+    except WebSocketDisconnect:
+        pass
+    finally:
+        for task in list(runs.values()):
+            task.cancel()
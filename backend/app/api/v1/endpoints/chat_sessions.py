@@ -13,6 +13,8 @@ Provides endpoints for:
 from fastapi import APIRouter, Depends, HTTPException
 from app.db.supabase_auth import get_current_user, get_current_user_optional
 from app.db.supabase_client import supabase_client
+from app.services.session_history_service import session_history, session_scope
+from app.services.tool_memo_service import tool_memo
 from app.schemas.chat_sessions import (
     ChatSession,
     ChatSessionWithMessages,
@@ -172,7 +174,9 @@ async def delete_session(
         
         if not response.data:
             raise HTTPException(status_code=404, detail="Session not found")
-        
+
+        tool_memo.clear_session(session_scope(user.id, session_id))
+        session_history.forget(session_id)
         return {"message": "Session deleted successfully"}
         
     except HTTPException:
@@ -217,6 +221,9 @@ async def add_message(
         supabase_client.client.rpc('increment_message_count', {
             'session_id': session_id
         }).execute()
+
+        # Written outside the chat endpoint: reload the history on next use
+        session_history.forget(session_id)
         
         return {
             "message": "Message added successfully",
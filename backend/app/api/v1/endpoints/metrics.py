@@ -0,0 +1,10 @@
+from fastapi import APIRouter, Depends
+from app.core.metrics import metrics
+from app.db.supabase_auth import get_current_user
+
+router = APIRouter()
+
+@router.get("/")
+async def get_metrics(user = Depends(get_current_user)):
+    """Snapshot of process-wide counters, observations and gauges (authenticated users only)."""
+    return metrics.snapshot()
@@ -0,0 +1,32 @@
+from fastapi import APIRouter, Depends, HTTPException
+from pydantic import BaseModel
+from app.db.supabase_auth import get_current_user
+from app.services.plan_cache_service import plan_cache
+
+router = APIRouter()
+
+class TemplateCreate(BaseModel):
+    name: str
+    request: str
+
+@router.get("/templates")
+async def list_templates(user = Depends(get_current_user)):
+    """List your plan templates (stale ones were built for a different tool set)."""
+    return plan_cache.list_templates(user.id)
+
+@router.post("/templates")
+async def promote_template(template: TemplateCreate, user = Depends(get_current_user)):
+    """Promote your validated cached plan for a request to a named template."""
+    try:
+        return plan_cache.promote(template.request, template.name, user.id)
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=str(e).strip("'\""))
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+@router.delete("/templates/{name}")
+async def delete_template(name: str, user = Depends(get_current_user)):
+    """Delete one of your plan templates."""
+    if not plan_cache.delete_template(name, user.id):
+        raise HTTPException(status_code=404, detail="Template not found")
+    return {"message": "Template deleted"}
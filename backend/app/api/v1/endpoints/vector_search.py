@@ -1,12 +1,13 @@
-from fastapi import APIRouter, HTTPException, Depends, UploadFile, File
+from fastapi import APIRouter, HTTPException, Depends
 from pydantic import BaseModel
-from typing import List, Optional
+from typing import List
 from app.db.supabase_client import supabase_client
 from app.db.supabase_auth import get_current_user
 from app.services.embedding_service import embedding_service
-from app.services.document_processor import document_chunker
+from app.services.search_cache_service import search_cache
+from app.services.document_pipeline_service import document_jobs, process_document_job
+import asyncio
 import logging
-import uuid
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
@@ -40,22 +41,30 @@ async def semantic_search(
         threshold: Minimum similarity score (0-1)
     """
     try:
-        # Generate embedding for query
-        query_embedding = await embedding_service.generate_query_embedding(request.query)
-        
-        # Search using Supabase RPC function
-        response = supabase_client.client.rpc(
-            'search_document_chunks',
-            {
-                'query_embedding': query_embedding,
-                'match_threshold': request.threshold,
-                'match_count': request.limit,
-                'filter_user_id': user.id
-            }
-        ).execute()
+        rows = search_cache.get_results(user.id, request.query, request.threshold, request.limit)
+        
+        if rows is None:
+            # Generate embedding for query (reused across thresholds/limits)
+            query_embedding = search_cache.get_embedding(user.id, request.query)
+            if query_embedding is None:
+                query_embedding = await embedding_service.generate_query_embedding(request.query)
+                search_cache.set_embedding(user.id, request.query, query_embedding)
+            
+            # Search using Supabase RPC function
+            response = supabase_client.client.rpc(
+                'search_document_chunks',
+                {
+                    'query_embedding': query_embedding,
+                    'match_threshold': request.threshold,
+                    'match_count': request.limit,
+                    'filter_user_id': user.id
+                }
+            ).execute()
+            rows = response.data
+            search_cache.set_results(user.id, request.query, request.threshold, request.limit, rows)
         
         results = []
-        for row in response.data:
+        for row in rows:
             results.append(SearchResult(
                 document_id=row['document_id'],
                 chunk_content=row['content'],
@@ -71,19 +80,21 @@ async def semantic_search(
         raise HTTPException(status_code=500, detail=f"Search failed: {str(e)}")
 
 
-@router.post("/documents/{document_id}/process")
+@router.post("/documents/{document_id}/process", status_code=202)
 async def process_document(
     document_id: str,
     user = Depends(get_current_user)
 ):
     """
-    Process a document: chunk it and generate embeddings
+    Queue a document for processing: chunk it and generate embeddings
     
-    This endpoint:
+    Returns a job id immediately. A background worker then:
     1. Retrieves document from storage
     2. Chunks the text
     3. Generates embeddings
     4. Stores chunks in database
+    
+    Poll GET /documents/jobs/{job_id} for progress.
     """
     try:
         # Get document record
@@ -98,73 +109,50 @@ async def process_document(
         
         document = doc_response.data[0]
         
-        # Update status to processing
         await supabase_client.update_document(
             document_id=document_id,
-            status="processing"
-        )
-        
-        # Download file from storage
-        file_data = await supabase_client.download_file(
-            bucket="user-uploads",
-            file_path=document['storage_path']
-        )
-        
-        # Extract text (assuming text file for now)
-        # TODO: Add PDF, DOCX extraction
-        text_content = file_data.decode('utf-8')
-        
-        # Chunk the document
-        chunks = document_chunker.chunk_text(
-            text=text_content,
-            metadata={
-                "filename": document['filename'],
-                "document_id": document_id
-            }
+            status="queued"
         )
         
-        # Generate embeddings for all chunks
-        chunk_texts = [chunk['content'] for chunk in chunks]
-        embeddings = await embedding_service.generate_embeddings_batch(chunk_texts)
-        
-        # Store chunks in database
-        for i, (chunk, embedding) in enumerate(zip(chunks, embeddings)):
-            await supabase_client.client.table("document_chunks").insert({
-                "document_id": document_id,
-                "chunk_index": i,
-                "content": chunk['content'],
-                "embedding": embedding,
-                "metadata": chunk['metadata']
-            }).execute()
-        
-        # Update document status
-        await supabase_client.update_document(
-            document_id=document_id,
-            status="indexed",
-            processed_at=supabase_client.client.sql("NOW()")
+        job = document_jobs.submit(
+            process_document_job,
+            kind="process_document",
+            owner_id=user.id,
+            document=document
         )
         
-        logger.info(f"Processed document {document_id}: {len(chunks)} chunks")
-        
         return {
-            "message": "Document processed successfully",
+            "message": "Document queued for processing",
             "document_id": document_id,
-            "chunks_created": len(chunks)
+            "job_id": job.id,
+            "status": job.status
         }
         
+    except HTTPException:
+        raise
+    except asyncio.QueueFull:
+        raise HTTPException(status_code=503, detail="Processing queue is full, please retry shortly")
     except Exception as e:
-        logger.error(f"Document processing error: {e}")
-        
-        # Update status to failed
-        await supabase_client.update_document(
-            document_id=document_id,
-            status="failed",
-            error_message=str(e)
-        )
-        
+        logger.error(f"Error queueing document {document_id}: {e}")
         raise HTTPException(status_code=500, detail=f"Processing failed: {str(e)}")
 
 
+@router.get("/documents/jobs/{job_id}")
+async def get_processing_job(
+    job_id: str,
+    user = Depends(get_current_user)
+):
+    """Get status and progress (chunks embedded/stored) of a processing job"""
+    job = document_jobs.get(job_id)
+    if not job or job.owner_id != user.id:
+        raise HTTPException(status_code=404, detail="Job not found")
+    
+    data = job.to_dict()
+    # The full document row is an implementation detail of the job
+    data["metadata"] = {"document_id": job.metadata["document"]["id"]}
+    return data
+
+
 @router.get("/documents/{document_id}/chunks")
 async def get_document_chunks(
     document_id: str,
@@ -13,10 +13,138 @@ class Settings(BaseSettings):
     GOOGLE_API_KEY: Optional[str] = None
     GROQ_API_KEY: Optional[str] = None
     OPENAI_API_KEY: Optional[str] = None
+    # Comma-separated key pools (merged with the single keys above)
+    GOOGLE_API_KEYS: Optional[str] = None
+    GROQ_API_KEYS: Optional[str] = None
+    OPENAI_API_KEYS: Optional[str] = None
 
     PRIMARY_LLM: str = "Gemini"
     PRIMARY_MODEL: str = "gemini-2.5-flash"
 
+    # Embeddings: "gemini", "local" (e5 via VectorStoreService) or "stub"
+    EMBEDDING_BACKEND: str = "gemini"
+    # Size of the chunks.embedding column and the match RPC; the backend's
+    # vectors must match it (local e5-large-v2 is 1024: migrate first)
+    EMBEDDING_DIMENSION: int = 768
+    # Chunks embedded and upserted per request in the document pipeline
+    CHUNK_UPSERT_BATCH_SIZE: int = 100
+    # Background document processing
+    DOCUMENT_JOB_WORKERS: int = 2
+    DOCUMENT_JOB_QUEUE_SIZE: int = 100
+    DOCUMENT_BATCH_RETRIES: int = 3
+    PARSER_PROCESS_WORKERS: int = 2
+    # Background chat jobs (long-running agent requests)
+    CHAT_JOB_WORKERS: int = 4
+    CHAT_JOB_QUEUE_SIZE: int = 100
+    CHAT_JOB_MAX_FINISHED: int = 200
+    CHAT_JOB_HEARTBEAT_SECONDS: float = 15.0
+    # Per-user semantic search cache
+    SEARCH_CACHE_TTL_SECONDS: int = 300
+    SEARCH_CACHE_MAX_ENTRIES: int = 128
+    SEARCH_CACHE_MAX_USERS: int = 1000
+
+    # Shared HTTP client pool (limits apply per upstream host)
+    HTTP_MAX_CONNECTIONS_PER_HOST: int = 20
+    HTTP_MAX_KEEPALIVE_PER_HOST: int = 10
+    HTTP_KEEPALIVE_EXPIRY_SECONDS: float = 60.0
+
+    # Deterministic LLM response cache (optional on-disk tier)
+    LLM_CACHE_ENABLED: bool = True
+    LLM_CACHE_SIZE: int = 512
+    LLM_CACHE_TTL_SECONDS: int = 3600
+    LLM_CACHE_DISK_DIR: Optional[str] = None
+
+    # Provider routing: health tracking and circuit breakers
+    LLM_HEALTH_EWMA_ALPHA: float = 0.3
+    LLM_BREAKER_FAILURE_THRESHOLD: int = 3
+    LLM_BREAKER_OPEN_SECONDS: float = 30.0
+    LLM_DEFAULT_LATENCY_SECONDS: float = 2.0
+    LLM_PRIMARY_PREFERENCE: float = 1.5
+    LLM_CONNECT_TIMEOUT_SECONDS: float = 3.0
+
+    # Hedged requests (interactive chat): after the primary's p-th percentile
+    # latency, race the next healthy provider. Budget caps hedges per request.
+    LLM_HEDGING_ENABLED: bool = False
+    LLM_HEDGE_PERCENTILE: float = 95.0
+    LLM_HEDGE_MIN_DELAY_SECONDS: float = 0.5
+    LLM_HEDGE_BUDGET_RATIO: float = 0.05
+    # Per-key provider quotas (requests / tokens per minute)
+    GEMINI_KEY_RPM: int = 10
+    GEMINI_KEY_TPM: int = 250000
+    GROQ_KEY_RPM: int = 30
+    GROQ_KEY_TPM: int = 8000
+    OPENAI_KEY_RPM: int = 500
+    OPENAI_KEY_TPM: int = 30000
+    KEY_POOL_MAX_WAIT_SECONDS: float = 2.0
+    KEY_POOL_COMPLETION_TOKENS: int = 512
+    # Share of each key's request/token budget only intent and planner calls may use
+    KEY_POOL_PRIORITY_RESERVE: float = 0.2
+
+    # LLM context window (history sent per call, excluding system prompt and tools)
+    CONTEXT_TOKEN_BUDGET: int = 6000
+    CONTEXT_TOOL_RESULT_MAX_CHARS: int = 1500
+    CONTEXT_FULL_TOOL_GROUPS: int = 2
+    CONTEXT_SUMMARY_MAX_CHARS: int = 2000
+
+    # Tool results already seen by the model are sent as a preview plus a handle
+    TOOL_RESULT_REFS_ENABLED: bool = True
+    TOOL_RESULT_REF_MIN_CHARS: int = 800
+    TOOL_RESULT_PREVIEW_CHARS: int = 300
+    TOOL_RESULT_EXPAND_MAX_CHARS: int = 4000
+    TOOL_RESULT_STORE_SIZE: int = 256
+    TOOL_RESULT_STORE_TTL_SECONDS: int = 3600
+
+    # Agent routing: "staged" (intent, then planner) or, opt-in, "combined"
+    # (first LLM call also returns intent/plan)
+    AGENT_ROUTING_MODE: str = "staged"
+
+    # Plan cache and templates
+    PLAN_CACHE_ENABLED: bool = True
+    PLAN_CACHE_SIZE: int = 512
+    PLAN_CACHE_TTL_SECONDS: int = 7 * 24 * 3600
+    PLAN_CACHE_SIMILARITY: float = 0.8
+    PLAN_CACHE_HISTORY_TURNS: int = 4
+    PLAN_TEMPLATES_PATH: str = "agent_data/plan_templates.json"
+
+    # Tool execution: concurrent read-only calls within one model message
+    TOOL_PARALLEL_EXECUTION: bool = True
+    TOOL_DEFAULT_CONCURRENCY: int = 4
+
+    # Session-scoped memoization of read-only tool results (per-tool TTLs in tool_memo_service)
+    TOOL_MEMO_ENABLED: bool = True
+    TOOL_MEMO_SIZE: int = 1024
+
+    # Agent loop budget and stall detection
+    AGENT_CHAT_ITERATIONS: int = 3
+    AGENT_MIN_TASK_ITERATIONS: int = 4
+    AGENT_ITERATIONS_PER_STEP: int = 2
+    AGENT_STALL_ITERATIONS: int = 2
+
+    # Local intent classifier in front of the remote IntentDetector
+    INTENT_LOCAL_ENABLED: bool = True
+    INTENT_LOCAL_CONFIDENCE: float = 0.95
+    INTENT_LOCAL_MIN_EXAMPLES: int = 200
+    # Learned counts of hashed features (no messages), so the model and the
+    # MIN_EXAMPLES gate survive restarts; "" keeps the model in memory only
+    INTENT_MODEL_PATH: str = "agent_data/intent_model.json"
+    # Persisting decisions stores user messages in plaintext, so it is opt-in
+    INTENT_LOG_ENABLED: bool = False
+    INTENT_LOG_PATH: str = "agent_data/intent_log.jsonl"
+    INTENT_LOG_MAX_BYTES: int = 5_000_000
+
+    # Tool routing (subset of tool schemas sent per request)
+    TOOL_ROUTER_ENABLED: bool = True
+    TOOL_ROUTER_TOP_K: int = 6
+    TOOL_ROUTER_EMBED_TIMEOUT_SECONDS: float = 1.5
+
+    # Server-side chat history (chat_messages) with a write-through LRU of hot sessions
+    SESSION_HISTORY_CACHE_SIZE: int = 512
+    SESSION_HISTORY_CACHE_TTL_SECONDS: int = 3600
+    SESSION_HISTORY_MAX_MESSAGES: int = 40
+
+    # Chat WebSocket: concurrent requests allowed per connection
+    CHAT_WS_MAX_CONCURRENT_RUNS: int = 4
+
     # Communication
     ENABLE_TELEGRAM: bool = False
     TELEGRAM_BOT_TOKEN: Optional[str] = None
@@ -0,0 +1,105 @@
+"""
+Shared HTTP client pool
+
+One keep-alive httpx.AsyncClient per upstream host (Gemini, Groq, OpenAI,
+Tavily, LinkedIn, ...), opened on app startup and closed on shutdown, so
+repeated calls reuse TCP+TLS connections instead of handshaking per call.
+
+Each client has its own connection limits, which makes the limits per host.
+HTTP/2 is used when the `h2` package is installed.
+"""
+
+import asyncio
+import logging
+from typing import Dict, Optional, Tuple
+from urllib.parse import urlsplit
+
+import httpx
+
+from app.core.config import settings
+from app.core.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+try:
+    import h2  # noqa: F401
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+
+class HTTPClientPool:
+    def __init__(self):
+        # Clients are bound to the event loop they were created on, so they
+        # are keyed by (loop, host). The app loop is the common case; other
+        # loops (scheduler threads) get their own clients.
+        self._clients: Dict[Tuple[int, str], httpx.AsyncClient] = {}
+        self._stats: Dict[str, Dict[str, int]] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    async def startup(self):
+        self._loop = asyncio.get_running_loop()
+        if not HTTP2_AVAILABLE:
+            logger.warning("h2 not installed; shared HTTP clients will use HTTP/1.1")
+        logger.info("Shared HTTP client pool started")
+
+    async def shutdown(self):
+        loop = asyncio.get_running_loop()
+        for (loop_id, host), client in list(self._clients.items()):
+            if loop_id == id(loop):
+                await client.aclose()
+        self._clients.clear()
+        logger.info("Shared HTTP client pool closed")
+
+    def client_for(self, url: str) -> httpx.AsyncClient:
+        """Return the shared client for the host of `url`"""
+        host = urlsplit(url).netloc
+        loop = asyncio.get_running_loop()
+        key = (id(loop), host)
+        client = self._clients.get(key)
+        if client is None or client.is_closed:
+            if self._loop is not None and loop is not self._loop:
+                logger.debug(f"Creating HTTP client for {host} on a non-app event loop")
+            client = self._create_client(host)
+            self._clients[key] = client
+        return client
+
+    async def request(self, method: str, url: str, **kwargs) -> httpx.Response:
+        """Send a request through the shared client for the host of `url` itself"""
+        return await self.client_for(url).request(method, url, **kwargs)
+
+    def _create_client(self, host: str) -> httpx.AsyncClient:
+        stats = self._stats.setdefault(host, {"requests": 0, "connections_opened": 0})
+
+        async def trace(event_name: str, info: dict):
+            if event_name == "connection.connect_tcp.complete":
+                stats["connections_opened"] += 1
+                metrics.incr("http.connections_opened")
+
+        async def on_request(request: httpx.Request):
+            stats["requests"] += 1
+            metrics.incr("http.requests")
+            request.extensions["trace"] = trace
+
+        return httpx.AsyncClient(
+            http2=HTTP2_AVAILABLE,
+            limits=httpx.Limits(
+                max_connections=settings.HTTP_MAX_CONNECTIONS_PER_HOST,
+                max_keepalive_connections=settings.HTTP_MAX_KEEPALIVE_PER_HOST,
+                keepalive_expiry=settings.HTTP_KEEPALIVE_EXPIRY_SECONDS,
+            ),
+            event_hooks={"request": [on_request]},
+        )
+
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        """Per-host request and connection counts; reuse = 1 - opened/requests"""
+        result = {}
+        for host, stats in self._stats.items():
+            requests = stats["requests"]
+            reuse = 1 - stats["connections_opened"] / requests if requests else 0.0
+            result[host] = {**stats, "connection_reuse_ratio": round(reuse, 3)}
+        return result
+
+
+http_pool = HTTPClientPool()
+metrics.register_gauge("http.hosts", http_pool.stats)
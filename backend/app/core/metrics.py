@@ -0,0 +1,58 @@
+"""
+Process-wide metrics registry
+
+Services record counters and observations here; GET /api/v1/metrics
+returns a snapshot. Gauges are callables evaluated at snapshot time.
+"""
+
+import threading
+from typing import Any, Callable, Dict
+
+
+class Metrics:
+    def __init__(self):
+        self._counters: Dict[str, float] = {}
+        self._observations: Dict[str, Dict[str, float]] = {}
+        self._gauges: Dict[str, Callable[[], Any]] = {}
+        self._lock = threading.Lock()
+
+    def incr(self, name: str, value: float = 1):
+        """Increment a counter"""
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def observe(self, name: str, value: float):
+        """Record one sample of a distribution (count/sum/min/max/avg)"""
+        with self._lock:
+            stats = self._observations.get(name)
+            if stats is None:
+                stats = self._observations[name] = {"count": 0, "sum": 0.0, "min": value, "max": value}
+            stats["count"] += 1
+            stats["sum"] += value
+            stats["min"] = min(stats["min"], value)
+            stats["max"] = max(stats["max"], value)
+
+    def register_gauge(self, name: str, fn: Callable[[], Any]):
+        """Expose a value computed on demand (e.g. pool or cache stats)"""
+        self._gauges[name] = fn
+
+    def get(self, name: str, default: float = 0) -> float:
+        return self._counters.get(name, default)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            counters = dict(self._counters)
+            observations = {
+                name: {**stats, "avg": stats["sum"] / stats["count"] if stats["count"] else 0.0}
+                for name, stats in self._observations.items()
+            }
+        gauges = {}
+        for name, fn in self._gauges.items():
+            try:
+                gauges[name] = fn()
+            except Exception as e:
+                gauges[name] = f"error: {e}"
+        return {"counters": counters, "observations": observations, "gauges": gauges}
+
+
+metrics = Metrics()
@@ -0,0 +1,44 @@
+"""
+Singleflight
+Collapses concurrent identical async calls into one upstream call.
+
+The first caller for a key starts the call; callers arriving while it is
+in flight await the same task and receive the same result (or exception).
+Nothing is cached once the call finishes; pair with a cache for that.
+
+Results are shared objects, so callers must not mutate them.
+"""
+
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable, Tuple
+
+from app.core.metrics import metrics
+
+
+class SingleFlight:
+    def __init__(self, name: str):
+        self.name = name
+        self._calls: Dict[Tuple[int, Hashable], asyncio.Task] = {}
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Runs fn() unless a call for `key` is already in flight. The shared
+        call is shielded: a caller being cancelled does not cancel it for
+        the others.
+        """
+        # Tasks belong to one event loop; threads running their own loop
+        # (e.g. the Telegram bot) get separate flights
+        flight_key = (id(asyncio.get_running_loop()), key)
+        task = self._calls.get(flight_key)
+        if task is not None:
+            metrics.incr(f"singleflight.{self.name}.shared")
+            return await asyncio.shield(task)
+
+        task = asyncio.ensure_future(fn())
+        self._calls[flight_key] = task
+        task.add_done_callback(lambda _: self._calls.pop(flight_key, None))
+        metrics.incr(f"singleflight.{self.name}.calls")
+        return await asyncio.shield(task)
+
+    def __len__(self) -> int:
+        return len(self._calls)
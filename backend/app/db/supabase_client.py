@@ -1,8 +1,12 @@
 import os
+import asyncio
+import httpx
 from supabase import create_client, Client
 from dotenv import load_dotenv
-from typing import Optional
+from typing import BinaryIO, Dict, List, Optional
+from urllib.parse import quote
 import logging
+from app.core.http_client import http_pool
 
 # Load environment variables
 load_dotenv()
@@ -15,6 +19,8 @@ class SupabaseClient:
     """
     _instance: Optional['SupabaseClient'] = None
     _client: Optional[Client] = None
+    _url: Optional[str] = None
+    _key: Optional[str] = None
     
     def __new__(cls):
         if cls._instance is None:
@@ -40,6 +46,8 @@ class SupabaseClient:
         
         try:
             self._client = create_client(supabase_url, supabase_key)
+            self._url = supabase_url.rstrip("/")
+            self._key = supabase_key
             logger.info("Supabase client initialized successfully with service role key")
         except Exception as e:
             logger.error(f"Failed to initialize Supabase client: {e}")
@@ -222,6 +230,40 @@ class SupabaseClient:
             logger.error(f"Error updating document: {e}")
             raise
     
+    # ==================== DOCUMENT CHUNKS ====================
+    
+    async def upsert_document_chunks(self, rows: List[Dict]):
+        """
+        Insert a batch of chunks in a single request.
+        Idempotent on (document_id, chunk_index), so retried batches overwrite
+        instead of duplicating. Runs in a worker thread so callers can overlap
+        it with embedding generation.
+        """
+        try:
+            query = self.client.table("document_chunks").upsert(
+                rows, on_conflict="document_id,chunk_index"
+            )
+            response = await asyncio.to_thread(query.execute)
+            return response.data
+        except Exception as e:
+            logger.error(f"Error upserting document chunks: {e}")
+            raise
+    
+    async def delete_document_chunks_from(self, document_id: str, start_index: int):
+        """Delete chunks at or beyond start_index (left over from a longer previous run)"""
+        try:
+            query = (
+                self.client.table("document_chunks")
+                .delete()
+                .eq("document_id", document_id)
+                .gte("chunk_index", start_index)
+            )
+            response = await asyncio.to_thread(query.execute)
+            return response.data
+        except Exception as e:
+            logger.error(f"Error deleting document chunks: {e}")
+            raise
+    
     # ==================== AUDIT LOGS ====================
     
     async def create_audit_log(self, user_id: str, action_type: str, description: str = None, **kwargs):
@@ -264,6 +306,30 @@ class SupabaseClient:
             logger.error(f"Error downloading file: {e}")
             raise
     
+    async def download_file_to(self, bucket: str, file_path: str, destination: BinaryIO,
+                               chunk_size: int = 1024 * 1024) -> int:
+        """
+        Stream a file from Supabase Storage into a writable file object
+        without holding the whole body in memory. Returns bytes written.
+        """
+        self.client  # Raises if credentials are missing
+        url = f"{self._url}/storage/v1/object/{quote(bucket)}/{quote(file_path)}"
+        headers = {"apikey": self._key, "Authorization": f"Bearer {self._key}"}
+        
+        try:
+            written = 0
+            client = http_pool.client_for(url)
+            async with client.stream("GET", url, headers=headers, timeout=httpx.Timeout(30.0, read=120.0)) as response:
+                response.raise_for_status()
+                async for chunk in response.aiter_bytes(chunk_size):
+                    destination.write(chunk)
+                    written += len(chunk)
+            destination.flush()
+            return written
+        except Exception as e:
+            logger.error(f"Error streaming file: {e}")
+            raise
+    
     async def delete_file(self, bucket: str, file_path: str):
         """Delete file from Supabase Storage"""
         try:
@@ -0,0 +1,439 @@
+"""
+Agent Service
+The EDITH agent loop: intent detection, planning, then LLM <-> tool
+iterations until the model answers without calling tools.
+
+Routing (AGENT_ROUTING_MODE):
+- staged (default): the local intent classifier, IntentDetector when it is
+  unsure, then PlannerService for TASK/HYBRID. Planning starts alongside a
+  remote intent call only when the local model leans towards TASK/HYBRID.
+- combined (opt-in): no separate intent/planner calls; the first LLM call
+  also reports intent and plan on a leading ROUTE line, next to its first
+  answer or tool calls.
+
+The loop is an async generator of events so the same code serves the
+blocking chat endpoint, the SSE stream and any other transport:
+
+- intent:     {"intent", "reason"}
+- plan:       {"steps", "reasoning"}
+- token:      {"text"}                      (only when stream_tokens=True)
+- tool_start: {"id", "name", "args"}
+- tool_end:   {"id", "name", "result"}
+- final:      {"response", "intent", "actions"}
+"""
+
+import asyncio
+import json
+import logging
+import uuid
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+from app.core.config import settings
+from app.core.metrics import metrics
+from app.services.context_builder import RollingSummary
+from app.services.intent_classifier import intent_classifier
+from app.services.intent_service import intent_detector
+from app.services.llm_service import llm_service
+from app.services.mcp_service import is_error_result, mcp_service
+from app.services.plan_cache_service import plan_cache
+from app.services.planner_service import planner_service
+from app.services.tool_router import REQUEST_TOOLS, tool_router
+from app.services.tool_scheduler import tool_scheduler
+
+logger = logging.getLogger(__name__)
+
+# Tool results are forwarded to clients as previews; the LLM sees them in full
+TOOL_EVENT_PREVIEW_CHARS = 500
+
+REPEAT_NUDGE = (
+    "[Note: {name} was already called with these exact arguments for this request; "
+    "this is the same result. Use it, or try a different approach.]"
+)
+
+ROUTE_PREFIX = "ROUTE:"
+ROUTING_INSTRUCTION = (
+    "Begin this reply with exactly one line: "
+    'ROUTE: {"intent": "CHAT" | "TASK" | "HYBRID", "steps": ["..."]} '
+    "(CHAT: conversation needing no tools; TASK: needs tools; HYBRID: both. "
+    "Give up to 6 short plan steps for TASK/HYBRID, [] for CHAT). "
+    "Then, in this same reply, answer directly or call the tools needed for the first step."
+)
+
+
+class AgentService:
+    def __init__(self, max_iterations: int = 12):
+        self.max_iterations = max_iterations
+
+    async def run(
+        self,
+        message: str,
+        history: Optional[List[Dict[str, Any]]] = None,
+        stream_tokens: bool = False,
+        session_id: Optional[str] = None,
+        user_id: Optional[str] = None
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Runs the agent loop for one user message, yielding events.
+        `session_id` scopes tool result memoization across turns; `user_id`
+        and the history scope the plan cache. Stored tool results are scoped
+        to the session, or to this run when there is none.
+        """
+        combined = settings.AGENT_ROUTING_MODE == "combined"
+        intent, plan_data = None, None
+
+        # Known requests (cached plans and templates) need no routing at all
+        cached_plan = plan_cache.get(message, user_id, history)
+        if cached_plan is not None:
+            combined = False
+            intent, plan_data = cached_plan["intent"], cached_plan["plan"]
+            yield {"type": "intent", "intent": intent, "reason": f"Plan cache ({cached_plan['source']})"}
+            yield {"type": "plan", "steps": plan_data.get("steps", []), "reasoning": plan_data.get("reasoning")}
+
+        # 1-2. Intent Detection and Planning (Phase 7), unless the first LLM call routes
+        elif not combined:
+            intent_data, plan_data = await self._route_staged(message, user_id, history)
+            intent = intent_data.get("intent", "CHAT")
+            yield {"type": "intent", "intent": intent, "reason": intent_data.get("reason")}
+            if plan_data:
+                yield {"type": "plan", "steps": plan_data.get("steps", []), "reasoning": plan_data.get("reasoning")}
+
+        # 3. History Handling (from request only - Supabase handles persistence)
+        conversation_history = list(history) if history else []
+        conversation_history.append({"role": "user", "parts": [{"text": message}]})
+
+        actions_taken = []
+        final_response = ""
+        completed = False
+        tool_errors = 0
+        active_tools = await tool_router.select(message, intent or "TASK", plan_data.get("steps", []) if plan_data else [])
+        tool_defs = tool_router.definitions(active_tools)
+
+        # Repeated (tool, args) pairs reuse the earlier result until a side effect runs
+        memo: Dict[tuple, asyncio.Future] = {}
+        state = {"epoch": 0, "repeats": 0}
+        stalled_iterations = 0
+        stop_reason = "limit"
+        llm_calls = 0
+        # Turns evicted from the prompt are summarized once, not on every call
+        summary_state = RollingSummary()
+        result_scope = session_id or f"run:{uuid.uuid4().hex}"
+
+        for i in range(self.max_iterations):
+            if intent is not None and i >= self._iteration_budget(intent, plan_data):
+                break
+            try:
+                # Ask LLM (the first call also routes in combined mode)
+                routing = combined and i == 0
+                llm_raw = None
+                llm_calls += 1
+                async for event in self._ask_llm(conversation_history, tool_defs, stream_tokens, routing, plan_data,
+                                                 summary_state, result_scope):
+                    if event["type"] == "response":
+                        llm_raw = event["response"]
+                    else:
+                        yield event
+
+                choice = llm_raw["choices"][0]
+                message_data = choice["message"]
+                content = message_data.get("content")
+                tool_calls = message_data.get("tool_calls", [])
+
+                if routing:
+                    route, content = self._parse_route(content)
+                    intent = route.get("intent") if route.get("intent") in ("CHAT", "TASK", "HYBRID") else ("TASK" if tool_calls else "CHAT")
+                    yield {"type": "intent", "intent": intent,
+                           "reason": "Routed by the first LLM call" if route else "Inferred from the first LLM response"}
+                    if intent in ("TASK", "HYBRID") and route.get("steps"):
+                        plan_data = {"steps": route["steps"], "reasoning": "Planned by the first LLM call"}
+                        plan_cache.set(message, plan_data, intent, user_id, history)
+                        yield {"type": "plan", "steps": plan_data["steps"], "reasoning": plan_data["reasoning"]}
+
+                # Record assistant msg
+                assistant_parts = []
+                if content:
+                    assistant_parts.append({"text": content})
+
+                for tc in tool_calls:
+                    # Wrap argument parsing in safety
+                    try:
+                        args = json.loads(tc["function"]["arguments"])
+                    except:
+                        args = {"raw": tc["function"]["arguments"]}
+
+                    assistant_parts.append({
+                        "function_call": {
+                            "id": tc["id"],
+                            "name": tc["function"]["name"],
+                            "args": args
+                        }
+                    })
+
+                conversation_history.append({"role": "model", "parts": assistant_parts})
+
+                if tool_calls:
+                    calls = []
+                    for tc in tool_calls:
+                        try:
+                            fn_args = json.loads(tc["function"]["arguments"])
+                        except:
+                            fn_args = {}
+                        calls.append({"id": tc["id"], "name": tc["function"]["name"], "args": fn_args})
+
+                    async def run_tool(fn_name: str, fn_args: Dict[str, Any]) -> Any:
+                        if fn_name == REQUEST_TOOLS:
+                            added = tool_router.expand(active_tools, fn_args.get("tools"))
+                            return f"Loaded tools: {', '.join(added)}" if added else "No new tools loaded; they are already available or unknown."
+                        if fn_name not in active_tools:
+                            # Model called a known tool it was not offered; keep it from now on
+                            tool_router.expand(active_tools, [fn_name])
+                        try:
+                            return await mcp_service.execute_tool(fn_name, fn_args, session_id, result_scope)
+                        finally:
+                            if mcp_service.is_side_effecting(fn_name):
+                                # The world changed; earlier results may be stale
+                                state["epoch"] += 1
+
+                    async def execute(fn_name: str, fn_args: Dict[str, Any]) -> Any:
+                        key = (state["epoch"], fn_name, json.dumps(fn_args, sort_keys=True, default=str))
+                        previous = memo.get(key)
+                        if previous is None:
+                            previous = memo[key] = asyncio.ensure_future(run_tool(fn_name, fn_args))
+                            return await previous
+                        state["repeats"] += 1
+                        metrics.incr("agent.repeated_tool_calls")
+                        return f"{await previous}\n\n{REPEAT_NUDGE.format(name=fn_name)}"
+
+                    # Read-only calls run concurrently; side effects stay serialized and in order
+                    repeats_before = state["repeats"]
+                    tool_results = {}
+                    async for kind, index, tool_result in tool_scheduler.run(calls, execute):
+                        call = calls[index]
+                        if kind == "start":
+                            actions_taken.append(f"Action: {call['name']}")
+                            yield {"type": "tool_start", "id": call["id"], "name": call["name"], "args": call["args"]}
+                        else:
+                            tool_results[index] = tool_result
+                            if is_error_result(tool_result):
+                                tool_errors += 1
+                            yield {"type": "tool_end", "id": call["id"], "name": call["name"],
+                                   "result": str(tool_result)[:TOOL_EVENT_PREVIEW_CHARS]}
+
+                    # Add results in call order
+                    for index, call in enumerate(calls):
+                        conversation_history.append({
+                            "role": "tool",
+                            "parts": [{
+                                "function_response": {
+                                    "id": call["id"],
+                                    "name": call["name"],
+                                    "response": {"result": tool_results[index]}
+                                }
+                            }]
+                        })
+                    tool_defs = tool_router.definitions(active_tools)
+
+                    # Nothing but repeats: the loop is not making progress
+                    if state["repeats"] - repeats_before == len(calls):
+                        stalled_iterations += 1
+                    else:
+                        stalled_iterations = 0
+                    if stalled_iterations >= settings.AGENT_STALL_ITERATIONS:
+                        metrics.incr("agent.stalled")
+                        stop_reason = "stalled"
+                        break
+                else:
+                    final_response = content or "I've completed the task as requested."
+                    completed = True
+                    break
+            except Exception as e:
+                print(f"Agent Loop Error: {e}")
+                final_response = f"I encountered an internal error: {str(e)}. Please check my process log."
+                break
+
+        if not final_response:
+            # If we hit the limit (or stalled), try one last call to synthesize what we have
+            if stop_reason == "stalled":
+                limit_text = "You are repeating actions that return the same results."
+            else:
+                limit_text = "You have reached your maximum action limit."
+            try:
+                conversation_history.append({"role": "user", "parts": [{"text": f"{limit_text} Please provide a concise summary of what you have accomplished or found so far based on the tool results above."}]})
+                llm_raw = None
+                llm_calls += 1
+                async for event in self._ask_llm(conversation_history, tool_defs, stream_tokens,
+                                                 summary_state=summary_state, result_scope=result_scope):
+                    if event["type"] == "response":
+                        llm_raw = event["response"]
+                    else:
+                        yield event
+                final_response = llm_raw["choices"][0]["message"].get("content") or "I've reached my process limit. Please check the logs for the data gathered."
+            except:
+                final_response = "I ran out of reasoning steps (max iterations reached). Here is what I found so far. Check the log for details."
+
+        if completed and plan_data and not tool_errors:
+            # The plan ran to an answer without tool errors; it may now be promoted to a template
+            plan_cache.mark_validated(message, user_id, history)
+        metrics.observe("agent.llm_calls_per_request", llm_calls)
+
+        yield {"type": "final", "response": final_response, "intent": intent or "CHAT", "actions": actions_taken}
+
+    async def run_to_completion(
+        self,
+        message: str,
+        history: Optional[List[Dict[str, Any]]] = None,
+        session_id: Optional[str] = None,
+        user_id: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """Runs the loop without streaming and returns the final event."""
+        final = None
+        async for event in self.run(message, history, session_id=session_id, user_id=user_id):
+            if event["type"] == "final":
+                final = event
+        return final
+
+    def _iteration_budget(self, intent: str, plan_data: Optional[Dict[str, Any]]) -> int:
+        """LLM iterations allowed for a request: a few for chat, scaled by plan length for tasks"""
+        if intent == "CHAT":
+            budget = settings.AGENT_CHAT_ITERATIONS
+        elif plan_data and plan_data.get("steps"):
+            budget = max(settings.AGENT_MIN_TASK_ITERATIONS,
+                         len(plan_data["steps"]) * settings.AGENT_ITERATIONS_PER_STEP + 1)
+        else:
+            budget = self.max_iterations
+        return min(self.max_iterations, budget)
+
+    async def _route_staged(self, message: str, user_id: Optional[str] = None,
+                            history: Optional[List[Dict[str, Any]]] = None):
+        """
+        (intent_data, plan_data or None) from the separate intent and planner
+        calls. When the local classifier is unsure, planning overlaps the
+        remote intent call only if the local model leans towards TASK/HYBRID,
+        so conversational messages do not spend planner quota.
+        """
+        plan_task, resolved_intent = None, None
+        intent_data = intent_classifier.classify(message)
+        if intent_data is not None:
+            metrics.incr("intent.local")
+        else:
+            if settings.INTENT_LOCAL_ENABLED and intent_classifier.predict(message)[0] != "CHAT":
+                # The plan is cached under the intent the remote call settles on
+                resolved_intent = asyncio.get_running_loop().create_future()
+                plan_task = asyncio.create_task(planner_service.generate_plan(
+                    message, user_id=user_id, history=history, intent=resolved_intent))
+            try:
+                intent_data = await intent_detector.detect(message, use_local=False)
+            except asyncio.CancelledError:
+                if plan_task:
+                    plan_task.cancel()
+                raise
+            except Exception as e:
+                intent_data = {"intent": "CHAT", "reason": f"Detector Error: {str(e)}"}
+
+        if intent_data.get("intent", "CHAT") not in ["TASK", "HYBRID"]:
+            if plan_task:
+                plan_task.cancel()
+                metrics.incr("planner.speculation_wasted")
+            return intent_data, None
+
+        intent = intent_data["intent"]
+        if resolved_intent is not None:
+            resolved_intent.set_result(intent)
+        try:
+            plan_data = await (plan_task or planner_service.generate_plan(message, user_id=user_id, history=history,
+                                                                          intent=intent))
+        except Exception as e:
+            print(f"Planning failed: {e}")
+            plan_data = {"reasoning": "Direct execution due to planning failure.", "steps": [message]}
+        return intent_data, plan_data
+
+    def _parse_route(self, content: Optional[str]):
+        """Splits a leading ROUTE line off the content: (route dict or {}, remaining content)"""
+        if not content or not content.lstrip().startswith(ROUTE_PREFIX):
+            return {}, content
+        line, _, rest = content.lstrip().partition("\n")
+        try:
+            route = json.loads(line[len(ROUTE_PREFIX):].strip())
+        except ValueError:
+            route = {}
+        return (route if isinstance(route, dict) else {}), rest.strip() or None
+
+    async def _ask_llm(
+        self,
+        conversation_history: List[Dict[str, Any]],
+        tool_defs: List[Dict[str, Any]],
+        stream_tokens: bool,
+        routing: bool = False,
+        plan_data: Optional[Dict[str, Any]] = None,
+        summary_state: Optional[RollingSummary] = None,
+        result_scope: Optional[str] = None
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """Yields token events (when streaming) and finally a response event."""
+        # Never replay a cached turn once the conversation has acted on the world,
+        # and never store a turn that would act on it
+        use_cache = not self._has_side_effects(conversation_history)
+        instructions = None
+        if routing:
+            instructions = ROUTING_INSTRUCTION
+        elif plan_data and plan_data.get("steps"):
+            steps = "\n".join(f"{n}. {step}" for n, step in enumerate(plan_data["steps"], 1))
+            instructions = f"Plan for the current request:\n{steps}"
+        if stream_tokens:
+            events = llm_service.stream_raw_response(
+                user_input="",
+                history=conversation_history,
+                tools=tool_defs,
+                use_cache=use_cache,
+                instructions=instructions,
+                uncacheable_tools=mcp_service.SIDE_EFFECT_TOOLS,
+                summary_state=summary_state,
+                result_scope=result_scope
+            )
+            if routing:
+                events = self._hide_route_line(events)
+            async for event in events:
+                yield event
+        else:
+            llm_raw = await llm_service.get_raw_response(
+                user_input="",
+                history=conversation_history,
+                tools=tool_defs,
+                use_cache=use_cache,
+                hedge=settings.LLM_HEDGING_ENABLED,
+                instructions=instructions,
+                uncacheable_tools=mcp_service.SIDE_EFFECT_TOOLS,
+                summary_state=summary_state,
+                result_scope=result_scope
+            )
+            yield {"type": "response", "response": llm_raw}
+
+    async def _hide_route_line(self, events: AsyncIterator[Dict[str, Any]]) -> AsyncIterator[Dict[str, Any]]:
+        """Holds back streamed tokens until a leading ROUTE line is complete, and drops it"""
+        buffer, passthrough = "", False
+        async for event in events:
+            if event["type"] != "token" or passthrough:
+                yield event
+                continue
+            buffer += event["text"]
+            head = buffer.lstrip()
+            if head.startswith(ROUTE_PREFIX):
+                if "\n" not in head:
+                    continue
+                text = head.partition("\n")[2].lstrip()
+            elif ROUTE_PREFIX.startswith(head):
+                continue
+            else:
+                text = buffer
+            passthrough = True
+            if text:
+                yield {"type": "token", "text": text}
+
+    def _has_side_effects(self, conversation_history: List[Dict[str, Any]]) -> bool:
+        for entry in conversation_history:
+            for part in entry.get("parts", []):
+                call = part.get("function_call")
+                if call and mcp_service.is_side_effecting(call.get("name")):
+                    return True
+        return False
+
+
+agent_service = AgentService()
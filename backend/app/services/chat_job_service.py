@@ -0,0 +1,63 @@
+"""
+Chat Jobs
+Background mode for long-running chat requests (missions, multi-page
+browsing, document indexing) that outlast client and proxy timeouts.
+
+A chat job runs the same agent loop as /chat/stream on the bounded "chat"
+JobQueue. Every agent event (intent, plan, token, tool_start, tool_end,
+final) is recorded in the job's event log, so clients can poll it, stream
+it, and resume from the last event they saw after a reconnect. The work
+keeps running when the client goes away.
+
+Token events are dropped from the log once the job ends, since the final
+event carries the whole response; finished jobs only keep the step events.
+"""
+
+from typing import Any, Dict
+
+from app.core.config import settings
+from app.services.agent_service import agent_service
+from app.services.job_queue import Job, JobQueue
+from app.services.session_history_service import session_history, session_scope
+
+
+async def run_chat_job(job: Job) -> Dict[str, Any]:
+    """Job handler: runs the agent loop and records its events"""
+    message = job.metadata["message"]
+    session_id = job.metadata.get("session_id")
+    final = None
+    tool_calls = 0
+    try:
+        async for event in agent_service.run(message, job.metadata.get("history"), stream_tokens=True,
+                                             session_id=session_scope(job.owner_id, session_id), user_id=job.owner_id):
+            job.add_event(event)
+            if event["type"] == "tool_end":
+                tool_calls += 1
+            if event["type"] in ("tool_start", "tool_end"):
+                job.update_progress(last_tool=event["name"], tool_calls=tool_calls)
+            if event["type"] == "final":
+                final = event
+    finally:
+        job.compact_events(lambda event: event["type"] != "token")
+
+    if final is None:
+        raise RuntimeError("The agent finished without a final response")
+    if job.metadata.get("server_side_history"):
+        await session_history.append(session_id, job.owner_id, message, final["response"])
+    return {"response": final["response"], "intent": final["intent"], "actions": final["actions"]}
+
+
+def describe(job: Job) -> Dict[str, Any]:
+    """Job status for API responses; the history and event log are left out"""
+    data = job.to_dict()
+    data["metadata"] = {"session_id": job.metadata.get("session_id")}
+    data["events"] = len(job.events)
+    return data
+
+
+chat_jobs = JobQueue(
+    "chat",
+    workers=settings.CHAT_JOB_WORKERS,
+    max_queued=settings.CHAT_JOB_QUEUE_SIZE,
+    max_finished=settings.CHAT_JOB_MAX_FINISHED
+)
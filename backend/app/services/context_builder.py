@@ -0,0 +1,290 @@
+"""
+Context Builder
+Fits EDITH's parts-based conversation history into a token budget before it
+is sent to an LLM.
+
+History is split into atomic groups (a model turn that calls tools travels
+with the tool responses that answer it), so trimming can never orphan a
+tool response. Then:
+
+0. Large tool payloads the model has already seen (every tool group but
+   the latest) are moved to the tool result store and replaced by a
+   preview and a handle the model can expand (TOOL_RESULT_REFS_ENABLED).
+   This keeps the per-iteration prompt roughly constant in size.
+1. Tool payloads outside the most recent tool groups are truncated.
+2. The oldest groups are evicted until the history fits
+   CONTEXT_TOKEN_BUDGET; the current user turn is never evicted.
+3. Evicted groups are folded into an extractive rolling summary that is
+   sent alongside the kept history. Callers that build the same growing
+   history repeatedly (the agent loop) pass a RollingSummary, so only
+   newly evicted groups are summarized.
+
+Tokens are counted locally with tiktoken (a requirement). If it cannot be
+loaded, a ~3 characters per token estimate is used instead; that
+overestimates English prose, which leaves the budget some margin.
+"""
+
+import json
+from collections import deque
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.core.config import settings
+from app.core.metrics import metrics
+from app.services.tool_result_store import EXPAND_TOOL_RESULT, tool_result_store
+
+# Per-message framing overhead (role, separators) in chat formats
+MESSAGE_OVERHEAD_TOKENS = 4
+SUMMARY_LINE_CHARS = 200
+
+_encoding = None
+_encoding_loaded = False
+
+
+def count_tokens(text: str) -> int:
+    """Approximate token count for `text`"""
+    global _encoding, _encoding_loaded
+    if not text:
+        return 0
+    if not _encoding_loaded:
+        _encoding_loaded = True
+        try:
+            import tiktoken
+            _encoding = tiktoken.get_encoding("cl100k_base")
+        except Exception:
+            _encoding = None
+    if _encoding is not None:
+        return len(_encoding.encode(text, disallowed_special=()))
+    return (len(text) + 2) // 3
+
+
+def _as_text(value: Any) -> str:
+    return value if isinstance(value, str) else json.dumps(value, default=str)
+
+
+def entry_tokens(entry: Dict[str, Any]) -> int:
+    tokens = MESSAGE_OVERHEAD_TOKENS
+    for part in entry.get("parts", []):
+        if "text" in part:
+            tokens += count_tokens(part["text"])
+        if "function_call" in part:
+            call = part["function_call"]
+            tokens += count_tokens(call.get("name", "")) + count_tokens(_as_text(call.get("args", {})))
+        if "function_response" in part:
+            tokens += count_tokens(_as_text(part["function_response"].get("response")))
+    return tokens
+
+
+def _is_user_text(entry: Dict[str, Any]) -> bool:
+    return entry.get("role") == "user" and any("text" in p for p in entry.get("parts", []))
+
+
+def _call_ids(entry: Dict[str, Any]) -> List[str]:
+    return [p["function_call"].get("id") for p in entry.get("parts", []) if "function_call" in p]
+
+
+def _response_ids(entry: Dict[str, Any]) -> List[str]:
+    return [p["function_response"].get("id") for p in entry.get("parts", []) if "function_response" in p]
+
+
+def _has_tool_payload(group: List[Dict[str, Any]]) -> bool:
+    return any(_response_ids(entry) for entry in group)
+
+
+def _response_text(fr: Dict[str, Any]) -> str:
+    response = fr.get("response")
+    result = response.get("result") if isinstance(response, dict) and set(response) == {"result"} else response
+    return _as_text(result)
+
+
+def _summary_lines(group: List[Dict[str, Any]]) -> List[str]:
+    """One short line per message or tool call in `group`"""
+    lines = []
+    for entry in group:
+        role = "User" if entry.get("role") == "user" else "Assistant"
+        for part in entry.get("parts", []):
+            if part.get("text"):
+                text = " ".join(part["text"][:SUMMARY_LINE_CHARS * 2].split())
+                if len(text) > SUMMARY_LINE_CHARS:
+                    text = text[:SUMMARY_LINE_CHARS] + "..."
+                lines.append(f"- {role}: {text}")
+            if "function_call" in part:
+                lines.append(f"- Assistant called {part['function_call'].get('name')}")
+    return lines
+
+
+class RollingSummary:
+    """
+    Summary state for one conversation whose history only grows: the lines
+    of the groups evicted so far, with the oldest dropped past the size cap.
+    """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.groups = 0
+        self.lines: deque = deque()
+        self.chars = 0
+        self.trimmed = False
+
+    def add(self, lines: List[str], max_chars: int):
+        for line in lines:
+            self.lines.append(line)
+            self.chars += len(line) + 1
+        while self.chars > max_chars and len(self.lines) > 1:
+            self.chars -= len(self.lines.popleft()) + 1
+            self.trimmed = True
+
+    def text(self, max_chars: int) -> str:
+        summary = "\n".join((["- ..."] if self.trimmed else []) + list(self.lines))
+        return summary[-max_chars:]
+
+
+def truncate_tool_payload(entry: Dict[str, Any], max_chars: int) -> Dict[str, Any]:
+    """Returns a copy of a tool entry with every response cut to `max_chars`"""
+    parts = []
+    for part in entry.get("parts", []):
+        if "function_response" in part:
+            fr = part["function_response"]
+            text = _response_text(fr)
+            if len(text) > max_chars:
+                text = f"{text[:max_chars]}... [truncated {len(text) - max_chars} chars]"
+                part = {"function_response": {**fr, "response": {"result": text}}}
+        parts.append(part)
+    return {**entry, "parts": parts}
+
+
+def reference_tool_payload(entry: Dict[str, Any], min_chars: int, preview_chars: int,
+                           scope: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Returns a copy of a tool entry with every response longer than
+    `min_chars` stored aside for `scope` and replaced by its head and a handle
+    """
+    parts = []
+    for part in entry.get("parts", []):
+        if "function_response" in part:
+            fr = part["function_response"]
+            text = _response_text(fr)
+            if len(text) > min_chars:
+                handle = tool_result_store.put(text, scope)
+                preview = " ".join(text[:preview_chars].split())
+                text = (f"{preview}... [Full result ({len(text)} chars) stored as {handle}; "
+                        f"call {EXPAND_TOOL_RESULT} with this handle to read more]")
+                part = {"function_response": {**fr, "response": {"result": text}}}
+                metrics.incr("context.tool_results_referenced")
+        parts.append(part)
+    return {**entry, "parts": parts}
+
+
+class ContextBuilder:
+    def __init__(
+        self,
+        token_budget: int = None,
+        tool_result_max_chars: int = None,
+        full_tool_groups: int = None,
+        summary_max_chars: int = None
+    ):
+        self.token_budget = token_budget or settings.CONTEXT_TOKEN_BUDGET
+        self.tool_result_max_chars = tool_result_max_chars or settings.CONTEXT_TOOL_RESULT_MAX_CHARS
+        self.full_tool_groups = full_tool_groups if full_tool_groups is not None else settings.CONTEXT_FULL_TOOL_GROUPS
+        self.summary_max_chars = summary_max_chars or settings.CONTEXT_SUMMARY_MAX_CHARS
+
+    def build(self, history: Optional[List[Dict[str, Any]]],
+              rolling: Optional[RollingSummary] = None,
+              scope: Optional[str] = None) -> Tuple[Optional[str], List[Dict[str, Any]]]:
+        """
+        Returns (summary of evicted turns or None, history that fits the
+        budget). `rolling` carries the summary between calls for the same
+        conversation; `scope` owns the tool results moved to the store.
+        """
+        if not history:
+            return None, []
+
+        groups = self.group(history)
+
+        tool_groups = [i for i, g in enumerate(groups) if _has_tool_payload(g)]
+
+        # 0. Payloads the model has already seen are replaced by references
+        if settings.TOOL_RESULT_REFS_ENABLED:
+            consumed = set(tool_groups[:-1])
+            groups = [
+                [reference_tool_payload(e, settings.TOOL_RESULT_REF_MIN_CHARS, settings.TOOL_RESULT_PREVIEW_CHARS, scope)
+                 for e in g]
+                if i in consumed else g
+                for i, g in enumerate(groups)
+            ]
+
+        # 1. Old tool payloads are reduced to their head
+        keep_full = set(tool_groups[-self.full_tool_groups:]) if self.full_tool_groups else set()
+        groups = [
+            g if i in keep_full or i not in tool_groups
+            else [truncate_tool_payload(e, self.tool_result_max_chars) for e in g]
+            for i, g in enumerate(groups)
+        ]
+
+        # 2. Evict the oldest groups, but never the current user turn
+        protected_from = max((i for i, g in enumerate(groups) if _is_user_text(g[0])), default=len(groups) - 1)
+        sizes = [sum(entry_tokens(e) for e in g) for g in groups]
+        total = sum(sizes)
+        evicted = 0
+        while total > self.token_budget and evicted < protected_from:
+            total -= sizes[evicted]
+            evicted += 1
+
+        # 3. Still over budget: truncate every payload but the latest
+        if total > self.token_budget:
+            last_tool_group = tool_groups[-1] if tool_groups else None
+            for i in range(evicted, len(groups)):
+                if i in tool_groups and i != last_tool_group:
+                    groups[i] = [truncate_tool_payload(e, self.tool_result_max_chars) for e in groups[i]]
+                    total += sum(entry_tokens(e) for e in groups[i]) - sizes[i]
+
+        if evicted:
+            metrics.incr("context.evicted_groups", evicted)
+        metrics.observe("context.history_tokens", total)
+
+        summary = self.summarize(groups[:evicted], rolling) if evicted else None
+        return summary, [entry for g in groups[evicted:] for entry in g]
+
+    def group(self, history: List[Dict[str, Any]]) -> List[List[Dict[str, Any]]]:
+        """
+        Splits history into atomic groups. Tool entries join the group of the
+        call they answer; tool entries with no matching call (e.g. the client
+        sent an already-sliced history) are dropped.
+        """
+        groups: List[List[Dict[str, Any]]] = []
+        open_calls: set = set()
+        for entry in history:
+            response_ids = _response_ids(entry)
+            if response_ids:
+                if groups and open_calls.intersection(response_ids):
+                    groups[-1].append(entry)
+                    open_calls.difference_update(response_ids)
+                continue
+            groups.append([entry])
+            open_calls = set(_call_ids(entry))
+        return groups
+
+    def summarize(self, groups: List[List[Dict[str, Any]]], rolling: Optional[RollingSummary] = None) -> str:
+        """
+        Extractive summary: one short line per evicted message or tool call.
+        Derived only from the evicted prefix, so it stays stable (and
+        cacheable) as later turns are appended. Oldest lines go first when
+        it exceeds summary_max_chars.
+
+        With `rolling`, only the groups evicted since its last call are
+        read; it is rebuilt if fewer groups are evicted than before.
+        """
+        if rolling is None:
+            rolling = RollingSummary()
+        elif len(groups) < rolling.groups:
+            # Fewer groups evicted than last time (e.g. payloads shrank): start over
+            rolling.reset()
+            metrics.incr("context.summary_rebuilds")
+        for group in groups[rolling.groups:]:
+            rolling.add(_summary_lines(group), self.summary_max_chars)
+        rolling.groups = len(groups)
+        return rolling.text(self.summary_max_chars)
+
+
+context_builder = ContextBuilder()
@@ -1,9 +1,11 @@
 import fitz  # PyMuPDF
 import requests
+import asyncio
 import io
 import os
 import tempfile
 import logging
+from concurrent.futures import ProcessPoolExecutor
 import pandas as pd
 import pytesseract
 from docx import Document
@@ -13,6 +15,11 @@ from typing import List, Optional
 
 logger = logging.getLogger(__name__)
 
+TEXT_EXTENSIONS = ['txt', 'md', 'markdown', 'json', 'html', 'htm', 'xml', 'log', 'rst']
+
+# Parsing is CPU-bound (PDF layout, OCR), so it runs outside the API process
+_process_pool: Optional[ProcessPoolExecutor] = None
+
 class DocumentParserService:
     @staticmethod
     def parse_pdf(path_or_url: str) -> List[str]:
@@ -97,6 +104,10 @@ class DocumentParserService:
     def parse_excel(path: str) -> List[str]:
         """Parses Excel and returns string representation per sheet."""
         try:
+            if path.lower().endswith('.csv'):
+                df = pd.read_csv(path)
+                return [df.to_string(index=False)] if not df.empty else []
+
             xls = pd.ExcelFile(path)
             content = []
             for sheet_name in xls.sheet_names:
@@ -108,6 +119,17 @@ class DocumentParserService:
             logger.error(f"Error parsing Excel: {e}")
             return []
 
+    @staticmethod
+    def parse_text(path: str) -> List[str]:
+        """Reads a plain-text file as a single string."""
+        try:
+            with open(path, "r", encoding="utf-8", errors="replace") as f:
+                text = f.read().strip()
+            return [text] if text else []
+        except Exception as e:
+            logger.error(f"Error reading text file: {e}")
+            return []
+
     @classmethod
     def parse_any(cls, path: str) -> List[str]:
         """Auto-detects format and parses."""
@@ -117,4 +139,32 @@ class DocumentParserService:
         if ext in ['pptx', 'ppt']: return cls.parse_pptx(path)
         if ext in ['xlsx', 'xls', 'csv']: return cls.parse_excel(path)
         if ext in ['png', 'jpg', 'jpeg', 'bmp', 'tiff']: return cls.parse_image(path)
+        if ext in TEXT_EXTENSIONS: return cls.parse_text(path)
         return []
+
+    @classmethod
+    async def parse_any_async(cls, path: str) -> List[str]:
+        """Runs parse_any in the shared process pool."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(_get_process_pool(), _parse_any, path)
+
+
+def _parse_any(path: str) -> List[str]:
+    # Module-level so it can be pickled into pool workers
+    return DocumentParserService.parse_any(path)
+
+
+def _get_process_pool() -> ProcessPoolExecutor:
+    global _process_pool
+    if _process_pool is None:
+        from app.core.config import settings
+        _process_pool = ProcessPoolExecutor(max_workers=settings.PARSER_PROCESS_WORKERS)
+    return _process_pool
+
+
+def shutdown_parser_pool():
+    """Stops the parser worker processes (called on app shutdown)."""
+    global _process_pool
+    if _process_pool is not None:
+        _process_pool.shutdown(wait=False, cancel_futures=True)
+        _process_pool = None
@@ -0,0 +1,176 @@
+"""
+Document Pipeline Service
+Downloads, chunks, embeds and stores Supabase documents as background jobs
+"""
+
+import asyncio
+import logging
+import os
+import tempfile
+from datetime import datetime
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from app.core.config import settings
+from app.db.supabase_client import supabase_client
+from app.services.document_parser_service import DocumentParserService
+from app.services.document_processor import document_chunker
+from app.services.embedding_service import embedding_service
+from app.services.job_queue import Job, JobQueue
+from app.services.search_cache_service import search_cache
+
+logger = logging.getLogger(__name__)
+
+
+async def _with_retries(operation: Callable[[], Awaitable], description: str, job: Optional[Job] = None):
+    """Run an async operation, retrying with exponential backoff"""
+    retries = settings.DOCUMENT_BATCH_RETRIES
+    for attempt in range(retries + 1):
+        try:
+            return await operation()
+        except Exception as e:
+            if attempt == retries:
+                raise
+            delay = 0.5 * (2 ** attempt)
+            logger.warning(f"{description} failed (attempt {attempt + 1}/{retries + 1}), retrying in {delay}s: {e}")
+            if job:
+                job.update_progress(batches_retried=job.progress.get("batches_retried", 0) + 1)
+            await asyncio.sleep(delay)
+
+
+async def store_chunks(document_id: str, chunks: List[Dict], job: Optional[Job] = None,
+                       batch_size: Optional[int] = None):
+    """
+    Embed and store chunks as multi-row upserts.
+
+    The upsert of batch N runs while batch N+1 is being embedded, so a
+    1,000-chunk document costs len(chunks) / batch_size round-trips to each
+    service instead of one insert per chunk. Rows are keyed on
+    (document_id, chunk_index), so re-running a document or retrying a
+    failed batch is idempotent.
+    """
+    batch_size = batch_size or settings.CHUNK_UPSERT_BATCH_SIZE
+    pending_upsert = None
+
+    async def upsert(rows: List[Dict]):
+        await _with_retries(
+            lambda: supabase_client.upsert_document_chunks(rows),
+            f"Upsert of chunks {rows[0]['chunk_index']}-{rows[-1]['chunk_index']}",
+            job
+        )
+        if job:
+            job.update_progress(chunks_stored=job.progress.get("chunks_stored", 0) + len(rows))
+
+    try:
+        for start in range(0, len(chunks), batch_size):
+            batch = chunks[start:start + batch_size]
+            embeddings = await _with_retries(
+                lambda: embedding_service.generate_embeddings_batch([chunk['content'] for chunk in batch]),
+                f"Embedding of chunks {start}-{start + len(batch) - 1}",
+                job
+            )
+            if job:
+                job.update_progress(chunks_embedded=start + len(batch))
+            rows = [
+                {
+                    "document_id": document_id,
+                    "chunk_index": start + offset,
+                    "content": chunk['content'],
+                    "embedding": embedding,
+                    "metadata": chunk['metadata']
+                }
+                for offset, (chunk, embedding) in enumerate(zip(batch, embeddings))
+            ]
+
+            if pending_upsert:
+                await pending_upsert
+            pending_upsert = asyncio.create_task(upsert(rows))
+
+        if pending_upsert:
+            await pending_upsert
+            pending_upsert = None
+    finally:
+        if pending_upsert and not pending_upsert.done():
+            pending_upsert.cancel()
+
+    # Drop chunks left over from a previous, longer version of the document
+    await supabase_client.delete_document_chunks_from(document_id, len(chunks))
+
+
+async def extract_document_text(document: Dict) -> List[str]:
+    """
+    Stream a stored document to a temp file and parse it with
+    DocumentParserService (PDF, DOCX, PPTX, Excel/CSV, images, plain text).
+
+    The download is written to disk chunk by chunk rather than buffered in
+    memory, and the parser reads it from its own process, so large files do
+    not inflate the API process.
+    """
+    extension = os.path.splitext(document['filename'])[1].lower()
+    tmp = tempfile.NamedTemporaryFile(suffix=extension, delete=False)
+    try:
+        with tmp:
+            await supabase_client.download_file_to(
+                bucket="user-uploads",
+                file_path=document['storage_path'],
+                destination=tmp
+            )
+
+        pages = await DocumentParserService.parse_any_async(tmp.name)
+        if not pages:
+            raise ValueError(f"No text could be extracted from '{document['filename']}'")
+        return pages
+    finally:
+        os.unlink(tmp.name)
+
+
+async def process_document_job(job: Job) -> Dict:
+    """Job handler: index one document and keep its status row in sync"""
+    document = job.metadata["document"]
+    document_id = document["id"]
+
+    try:
+        await supabase_client.update_document(document_id=document_id, status="processing")
+
+        # Extract text with the format-aware parser (runs in a process pool)
+        pages = await extract_document_text(document)
+        text_content = "\n\n".join(pages)
+
+        # Chunk the document
+        chunks = document_chunker.chunk_text(
+            text=text_content,
+            metadata={
+                "filename": document['filename'],
+                "document_id": document_id
+            }
+        )
+        job.update_progress(chunks_total=len(chunks), chunks_embedded=0, chunks_stored=0)
+
+        try:
+            await store_chunks(document_id, chunks, job=job)
+        finally:
+            # Cached searches may reference chunks that just changed
+            search_cache.invalidate_user(document['user_id'])
+
+        await supabase_client.update_document(
+            document_id=document_id,
+            status="indexed",
+            processed_at=datetime.utcnow().isoformat()
+        )
+        logger.info(f"Processed document {document_id}: {len(chunks)} chunks")
+        return {"document_id": document_id, "chunks_created": len(chunks)}
+
+    except Exception as e:
+        logger.error(f"Document processing error: {e}")
+        await supabase_client.update_document(
+            document_id=document_id,
+            status="failed",
+            error_message=str(e)
+        )
+        raise
+
+
+document_jobs = JobQueue(
+    "documents",
+    workers=settings.DOCUMENT_JOB_WORKERS,
+    max_queued=settings.DOCUMENT_JOB_QUEUE_SIZE
+)
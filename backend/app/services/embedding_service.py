@@ -1,92 +1,260 @@
 """
 Vector Embedding Service
-Generates embeddings for document chunks using Google Gemini
+Generates embeddings for document chunks through a pluggable backend.
+
+Backends are registered by name and only constructed on first use, so
+importing this module is cheap and never fails because of a missing API key:
+
+- gemini: Google Gemini text-embedding-004 (default, 768 dimensions)
+- local:  the e5 SentenceTransformer already loaded by VectorStoreService
+          (1024 dimensions)
+- stub:   deterministic hash-based vectors for tests and offline benchmarks
+
+A backend's dimension must equal EMBEDDING_DIMENSION, the size of the
+chunks column and match RPC; check_dimension() verifies it at startup.
 """
 
 import os
-import google.generativeai as genai
-from typing import List, Dict
+import asyncio
+import hashlib
+import math
+import random
+import threading
+from typing import Callable, Dict, List, Optional
 import logging
 from dotenv import load_dotenv
+from app.core.singleflight import SingleFlight
 
 load_dotenv()
 logger = logging.getLogger(__name__)
 
-class EmbeddingService:
-    """Service for generating vector embeddings"""
-    
+
+class EmbeddingBackend:
+    """Base class for embedding providers"""
+
+    name: str = "base"
+    dimension: int = 0
+
+    async def embed(self, texts: List[str], task_type: str) -> List[List[float]]:
+        """
+        Embed a batch of texts
+
+        Args:
+            texts: Texts to embed
+            task_type: "retrieval_document" or "retrieval_query"
+
+        Returns:
+            One embedding vector per input text
+        """
+        raise NotImplementedError
+
+
+class GeminiEmbeddingBackend(EmbeddingBackend):
+    """Google Gemini embeddings (768 dimensions)"""
+
+    name = "gemini"
+    dimension = 768
+
     def __init__(self):
         api_key = os.getenv("GOOGLE_API_KEY")
         if not api_key:
             raise ValueError("GOOGLE_API_KEY not found in environment")
-        
+
+        import google.generativeai as genai
+
         genai.configure(api_key=api_key)
+        self._genai = genai
         self.model = "models/text-embedding-004"
-        
-        logger.info(f"Embedding service initialized with model: {self.model}")
-    
+
+    async def embed(self, texts: List[str], task_type: str) -> List[List[float]]:
+        # embed_content accepts a list and returns one vector per entry
+        result = await asyncio.to_thread(
+            self._genai.embed_content,
+            model=self.model,
+            content=texts,
+            task_type=task_type
+        )
+        return result['embedding']
+
+
+class LocalE5EmbeddingBackend(EmbeddingBackend):
+    """Local e5 embeddings, sharing the model loaded by VectorStoreService"""
+
+    name = "local"
+    dimension = 1024
+
+    def __init__(self):
+        from app.services.vector_store_service import vector_store
+
+        self.model = vector_store.model
+
+    async def embed(self, texts: List[str], task_type: str) -> List[List[float]]:
+        # E5 expects "query: " / "passage: " prefixes
+        prefix = "query: " if task_type == "retrieval_query" else "passage: "
+        vectors = await asyncio.to_thread(
+            self.model.encode,
+            [f"{prefix}{text}" for text in texts],
+            convert_to_tensor=False,
+            normalize_embeddings=True
+        )
+        return [list(map(float, v)) for v in vectors]
+
+
+class StubEmbeddingBackend(EmbeddingBackend):
+    """Deterministic unit vectors derived from a hash of the text"""
+
+    name = "stub"
+    dimension = 768
+
+    async def embed(self, texts: List[str], task_type: str) -> List[List[float]]:
+        return [self._vector(text) for text in texts]
+
+    def _vector(self, text: str) -> List[float]:
+        seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "big")
+        rng = random.Random(seed)
+        values = [rng.gauss(0.0, 1.0) for _ in range(self.dimension)]
+        norm = math.sqrt(sum(v * v for v in values)) or 1.0
+        return [v / norm for v in values]
+
+
+# Registry of backend factories, keyed by name
+_BACKENDS: Dict[str, Callable[[], EmbeddingBackend]] = {
+    GeminiEmbeddingBackend.name: GeminiEmbeddingBackend,
+    LocalE5EmbeddingBackend.name: LocalE5EmbeddingBackend,
+    StubEmbeddingBackend.name: StubEmbeddingBackend,
+}
+
+
+def register_embedding_backend(name: str, factory: Callable[[], EmbeddingBackend]):
+    """Register an additional embedding backend under `name`"""
+    _BACKENDS[name.lower()] = factory
+
+
+class EmbeddingService:
+    """Service for generating vector embeddings"""
+
+    def __init__(self, backend_name: Optional[str] = None):
+        """
+        Args:
+            backend_name: Registered backend to use. Defaults to the
+                EMBEDDING_BACKEND setting, resolved on first use.
+        """
+        self._backend_name = backend_name
+        self._backend: Optional[EmbeddingBackend] = None
+        self._lock = threading.Lock()
+        self._flights = SingleFlight("embeddings")
+
+    @property
+    def backend(self) -> EmbeddingBackend:
+        """The active backend, constructed on first access"""
+        if self._backend is None:
+            with self._lock:
+                if self._backend is None:
+                    self._backend = self._create_backend()
+        return self._backend
+
+    def set_backend(self, backend_name: str):
+        """Switch backends; the new one is constructed on next use"""
+        with self._lock:
+            self._backend_name = backend_name
+            self._backend = None
+
+    def check_dimension(self):
+        """
+        Raises ValueError if the configured backend's vectors would not fit
+        the database (EMBEDDING_DIMENSION), without constructing it
+        """
+        name, factory = self._factory()
+        dimension = getattr(factory, "dimension", None)
+        if dimension:
+            self._validate(name, dimension)
+
+    def _factory(self):
+        from app.core.config import settings
+
+        name = (self._backend_name or settings.EMBEDDING_BACKEND).lower()
+        factory = _BACKENDS.get(name)
+        if factory is None:
+            raise ValueError(f"Unknown embedding backend '{name}'. Available: {', '.join(_BACKENDS)}")
+        return name, factory
+
+    @staticmethod
+    def _validate(name: str, dimension: int):
+        from app.core.config import settings
+
+        if dimension != settings.EMBEDDING_DIMENSION:
+            raise ValueError(
+                f"Embedding backend '{name}' produces {dimension}-dimension vectors, but the chunks "
+                f"column and match RPC use {settings.EMBEDDING_DIMENSION} (EMBEDDING_DIMENSION). Use a "
+                f"{settings.EMBEDDING_DIMENSION}-dimension backend, or migrate the column and set EMBEDDING_DIMENSION."
+            )
+
+    def _create_backend(self) -> EmbeddingBackend:
+        name, factory = self._factory()
+        backend = factory()
+        self._validate(name, backend.dimension)
+        logger.info(f"Embedding service initialized with backend: {backend.name}")
+        return backend
+
+    async def _embed(self, texts: List[str], task_type: str) -> List[List[float]]:
+        # Concurrent identical requests share one backend call
+        backend = self.backend
+        key = (backend.name, task_type, tuple(texts))
+        return await self._flights.do(key, lambda: backend.embed(texts, task_type))
+
     async def generate_embedding(self, text: str) -> List[float]:
         """
         Generate embedding for a single text
-        
+
         Args:
             text: Text to embed
-            
+
         Returns:
             List of floats (768 dimensions for text-embedding-004)
         """
         try:
-            result = genai.embed_content(
-                model=self.model,
-                content=text,
-                task_type="retrieval_document"
-            )
-            return result['embedding']
+            embeddings = await self._embed([text], "retrieval_document")
+            return embeddings[0]
         except Exception as e:
             logger.error(f"Error generating embedding: {e}")
             raise
-    
+
     async def generate_embeddings_batch(self, texts: List[str]) -> List[List[float]]:
         """
         Generate embeddings for multiple texts
-        
+
         Args:
             texts: List of texts to embed
-            
+
         Returns:
             List of embedding vectors
         """
+        if not texts:
+            return []
         try:
-            embeddings = []
-            for text in texts:
-                embedding = await self.generate_embedding(text)
-                embeddings.append(embedding)
-            return embeddings
+            return await self._embed(texts, "retrieval_document")
         except Exception as e:
             logger.error(f"Error generating batch embeddings: {e}")
             raise
-    
+
     async def generate_query_embedding(self, query: str) -> List[float]:
         """
         Generate embedding for a search query
-        
+
         Args:
             query: Search query text
-            
+
         Returns:
             Embedding vector
         """
         try:
-            result = genai.embed_content(
-                model=self.model,
-                content=query,
-                task_type="retrieval_query"  # Different task type for queries
-            )
-            return result['embedding']
+            # Different task type for queries
+            embeddings = await self._embed([query], "retrieval_query")
+            return embeddings[0]
         except Exception as e:
             logger.error(f"Error generating query embedding: {e}")
             raise
 
 
-# Singleton instance
+# Singleton instance (backend is resolved lazily)
 embedding_service = EmbeddingService()
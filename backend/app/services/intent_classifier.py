@@ -0,0 +1,261 @@
+"""
+Local Intent Classifier
+A multinomial Naive Bayes model over word unigrams and bigrams that
+answers clear-cut CHAT / TASK / HYBRID cases in-process (well under a
+millisecond) so IntentDetector only calls the remote LLM when unsure.
+
+It starts from a small seed set and learns from the LLM's decisions:
+each remote classification is folded into the model immediately. Until it
+has seen INTENT_LOCAL_MIN_EXAMPLES decisions it defers to the LLM.
+
+After every decision the model is saved to INTENT_MODEL_PATH (off the
+event loop), so what it learned and its decision count survive restarts.
+The snapshot holds per-class counts of hashed features, never messages;
+it is ignored once the seed set or the features change.
+
+With INTENT_LOG_ENABLED the decisions are also appended to INTENT_LOG_PATH
+(JSON lines), which lets the model be rebuilt from the seeds plus the log
+when there is no usable snapshot. The log holds user messages in
+plaintext, so it is opt-in and bounded: past INTENT_LOG_MAX_BYTES it is
+rotated to "<path>.1", replacing the previous backup.
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import math
+import os
+import re
+import threading
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+INTENTS = ("CHAT", "TASK", "HYBRID")
+
+SEED_EXAMPLES = [
+    ("hi", "CHAT"),
+    ("hello edith", "CHAT"),
+    ("good morning", "CHAT"),
+    ("thanks", "CHAT"),
+    ("thank you so much", "CHAT"),
+    ("how are you", "CHAT"),
+    ("who are you", "CHAT"),
+    ("what can you do", "CHAT"),
+    ("tell me a joke", "CHAT"),
+    ("explain what recursion is", "CHAT"),
+    ("what is the difference between a list and a tuple", "CHAT"),
+    ("ok", "CHAT"),
+    ("bye", "CHAT"),
+    ("search for the latest news on ai", "TASK"),
+    ("find the price of bitcoin", "TASK"),
+    ("browse https://example.com and summarize it", "TASK"),
+    ("send an email to john about the meeting", "TASK"),
+    ("draft an email to my manager", "TASK"),
+    ("read my unread emails", "TASK"),
+    ("remind me every day at 9 to drink water", "TASK"),
+    ("schedule a task every 5 minutes", "TASK"),
+    ("create an excel sheet with these numbers", "TASK"),
+    ("make a powerpoint presentation about climate change", "TASK"),
+    ("write a pdf report on sales", "TASK"),
+    ("post this on linkedin", "TASK"),
+    ("analyze the uploaded document", "TASK"),
+    ("clone the github repository", "TASK"),
+    ("take a screenshot of amazon.com", "TASK"),
+    ("hello, can you find the price of bitcoin and save it", "HYBRID"),
+    ("hi edith, search the weather in london", "HYBRID"),
+    ("thanks! now send that as an email", "HYBRID"),
+    ("good morning, what's on my inbox today", "HYBRID"),
+    ("hey, explain transformers and find a good paper on them", "HYBRID"),
+]
+
+_TOKEN = re.compile(r"[a-z0-9']+|https?://|[?!]")
+
+# Bump when features() changes: saved models are then rebuilt
+FEATURES_VERSION = 1
+MODEL_FINGERPRINT = hashlib.sha256(json.dumps([FEATURES_VERSION, SEED_EXAMPLES]).encode("utf-8")).hexdigest()[:12]
+
+
+def features(text: str) -> List[str]:
+    tokens = _TOKEN.findall(text.lower())
+    return tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])] + [f"__len_{min(len(tokens), 8)}"]
+
+
+def _feature_key(feature: str) -> str:
+    # The model (and so its snapshot) only ever holds hashed features
+    return hashlib.blake2b(feature.encode("utf-8"), digest_size=8).hexdigest()
+
+
+class IntentClassifier:
+    def __init__(self, log_path: Optional[str] = None, model_path: Optional[str] = None):
+        self.log_path = log_path or settings.INTENT_LOG_PATH
+        self.model_path = model_path if model_path is not None else settings.INTENT_MODEL_PATH
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._loaded = False
+        self._reset()
+
+    def _reset(self):
+        self.class_docs: Dict[str, int] = defaultdict(int)
+        self.class_tokens: Dict[str, int] = defaultdict(int)
+        self.counts: Dict[str, Dict[str, int]] = {intent: defaultdict(int) for intent in INTENTS}
+        self.vocabulary: set = set()
+        self.logged_examples = 0
+
+    def _learn(self, text: str, intent: str):
+        # Callers hold self._lock
+        if intent not in self.counts:
+            return
+        self.class_docs[intent] += 1
+        for feature in features(text):
+            key = _feature_key(feature)
+            self.counts[intent][key] += 1
+            self.class_tokens[intent] += 1
+            self.vocabulary.add(key)
+
+    def train(self):
+        """Loads the saved model, or rebuilds it from the seed examples and the decision log"""
+        if self._load_model():
+            logger.info(f"Intent classifier loaded ({self.logged_examples} learned decisions)")
+            return
+        examples = list(SEED_EXAMPLES)
+        logged = 0
+        # Oldest first: the rotated backup, then the live log
+        for path in (f"{self.log_path}.1", self.log_path):
+            if not settings.INTENT_LOG_ENABLED or not os.path.exists(path):
+                continue
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                        examples.append((entry["text"], entry["intent"]))
+                        logged += 1
+                    except (ValueError, KeyError):
+                        continue
+        with self._lock:
+            self._reset()
+            for text, intent in examples:
+                self._learn(text, intent)
+            self.logged_examples = logged
+            self._loaded = True
+        logger.info(f"Intent classifier trained on {len(examples)} examples ({logged} logged)")
+
+    def _load_model(self) -> bool:
+        if not self.model_path:
+            return False
+        try:
+            with open(self.model_path, "r", encoding="utf-8") as f:
+                snapshot = json.load(f)
+            if snapshot["fingerprint"] != MODEL_FINGERPRINT:
+                return False
+            logged, class_docs, class_tokens, counts = (
+                int(snapshot["logged_examples"]), snapshot["class_docs"], snapshot["class_tokens"], snapshot["counts"]
+            )
+        except (OSError, ValueError, KeyError, TypeError):
+            return False
+        with self._lock:
+            self._reset()
+            for intent in INTENTS:
+                self.class_docs[intent] = class_docs.get(intent, 0)
+                self.class_tokens[intent] = class_tokens.get(intent, 0)
+                self.counts[intent].update(counts.get(intent, {}))
+                self.vocabulary.update(counts.get(intent, {}))
+            self.logged_examples = logged
+            self._loaded = True
+        return True
+
+    def _ensure_loaded(self):
+        if not self._loaded:
+            try:
+                self.train()
+            except Exception as e:
+                logger.warning(f"Intent classifier training failed: {e}")
+                self._loaded = True
+
+    def predict(self, text: str) -> Tuple[str, float]:
+        """(intent, posterior probability)"""
+        self._ensure_loaded()
+        tokens = [_feature_key(feature) for feature in features(text)]
+        with self._lock:
+            total_docs = sum(self.class_docs.values())
+            vocabulary = len(self.vocabulary) + 1
+            scores = {}
+            for intent in INTENTS:
+                if not self.class_docs[intent]:
+                    continue
+                score = math.log(self.class_docs[intent] / total_docs)
+                denominator = self.class_tokens[intent] + vocabulary
+                counts = self.counts[intent]
+                for token in tokens:
+                    score += math.log((counts.get(token, 0) + 1) / denominator)
+                scores[intent] = score
+
+        best = max(scores, key=scores.get)
+        norm = sum(math.exp(s - scores[best]) for s in scores.values())
+        return best, 1.0 / norm
+
+    def classify(self, text: str) -> Optional[Dict[str, str]]:
+        """An intent result if the local model is confident enough, else None"""
+        if not settings.INTENT_LOCAL_ENABLED:
+            return None
+        self._ensure_loaded()
+        if self.logged_examples < settings.INTENT_LOCAL_MIN_EXAMPLES:
+            return None
+        intent, confidence = self.predict(text)
+        if confidence < settings.INTENT_LOCAL_CONFIDENCE:
+            return None
+        return {"intent": intent, "reason": f"Local classifier (confidence {confidence:.2f})"}
+
+    async def record(self, text: str, intent: str):
+        """Learns from a remote decision, saves the model and, if enabled, logs the decision"""
+        if intent not in INTENTS:
+            return
+        self._ensure_loaded()
+        with self._lock:
+            self._learn(text, intent)
+            self.logged_examples += 1
+        line = json.dumps({"text": text, "intent": intent}) + "\n" if settings.INTENT_LOG_ENABLED else None
+        await asyncio.to_thread(self._persist, line)
+
+    def _persist(self, line: Optional[str]):
+        if self.model_path:
+            self._save_model()
+        if line:
+            self._append(line)
+
+    def _save_model(self):
+        with self._lock:
+            snapshot = json.dumps({
+                "fingerprint": MODEL_FINGERPRINT,
+                "logged_examples": self.logged_examples,
+                "class_docs": self.class_docs,
+                "class_tokens": self.class_tokens,
+                "counts": self.counts,
+            })
+        with self._write_lock:
+            try:
+                os.makedirs(os.path.dirname(self.model_path) or ".", exist_ok=True)
+                tmp_path = f"{self.model_path}.tmp"
+                with open(tmp_path, "w", encoding="utf-8") as f:
+                    f.write(snapshot)
+                os.replace(tmp_path, self.model_path)
+            except OSError as e:
+                logger.warning(f"Could not save the intent model: {e}")
+
+    def _append(self, line: str):
+        with self._write_lock:
+            try:
+                os.makedirs(os.path.dirname(self.log_path) or ".", exist_ok=True)
+                if os.path.exists(self.log_path) and os.path.getsize(self.log_path) >= settings.INTENT_LOG_MAX_BYTES:
+                    os.replace(self.log_path, f"{self.log_path}.1")
+                with open(self.log_path, "a", encoding="utf-8") as f:
+                    f.write(line)
+            except OSError as e:
+                logger.warning(f"Could not log intent decision: {e}")
+
+
+intent_classifier = IntentClassifier()
@@ -1,14 +1,17 @@
-import os
-import httpx
 import json
 from typing import Dict
-from app.core.config import settings
+from app.core.metrics import metrics
+from app.core.singleflight import SingleFlight
+from app.services.intent_classifier import intent_classifier
+from app.services.key_pool_service import FALLBACK_ROUTES, key_pools
+from app.services.llm_cache_service import llm_response_cache
 
 class IntentDetector:
     def __init__(self):
-        self.api_key = os.getenv("GROQ_API_KEY") or settings.GROQ_API_KEY
         self.base_url = "https://api.groq.com/openai/v1/chat/completions"
         self.model_id = "openai/gpt-oss-safeguard-20b"
+        self.routes = [("Groq", self.base_url, self.model_id), *FALLBACK_ROUTES]
+        self._flights = SingleFlight("intent")
         
         self.system_prompt = (
             "You are the Intent Classifier for EDITH, an advanced AI Agent. "
@@ -21,43 +24,71 @@ class IntentDetector:
             "{\"intent\": \"CHAT\" | \"TASK\" | \"HYBRID\", \"reason\": \"...\"}"
         )
 
-    async def detect(self, user_input: str) -> Dict:
+    async def detect(self, user_input: str, use_cache: bool = True, use_local: bool = True) -> Dict:
         """
-        Classifies the user intent using Groq.
+        Classifies the user intent, locally when intent_classifier is
+        confident and with Groq otherwise. Callers that already asked the
+        local classifier pass use_local=False.
+
+        Remote results are cached by request, not by the provider that
+        answered: post_chat may fail over, and any route's classification
+        serves a repeat.
         """
+        local = intent_classifier.classify(user_input) if use_local else None
+        if local is not None:
+            metrics.incr("intent.local")
+            return local
+
         try:
-            async with httpx.AsyncClient() as client:
-                payload = {
-                    "model": self.model_id,
-                    "messages": [
-                        {"role": "system", "content": self.system_prompt},
-                        {"role": "user", "content": f"User Input: \"{user_input}\""}
-                    ],
-                    "temperature": 0.0,
-                    # Note: Not all models support json_mode, but we provide the prompt instruction.
-                }
-                headers = {
-                    "Authorization": f"Bearer {self.api_key}",
-                    "Content-Type": "application/json"
-                }
-                
-                response = await client.post(self.base_url, json=payload, headers=headers)
-                if response.status_code != 200:
-                    print(f"DEBUG Intent Error: {response.text}")
-                    raise Exception(f"Groq API Error: {response.text}")
-                
-                data = response.json()
-                content = data["choices"][0]["message"]["content"]
-                # Clean markdown if model is chatty
-                if "```json" in content:
-                    content = content.split("```json")[1].split("```")[0].strip()
-                elif "```" in content:
-                    content = content.split("```")[1].split("```")[0].strip()
-                
-                return json.loads(content)
+            payload = {
+                "model": self.model_id,
+                "messages": [
+                    {"role": "system", "content": self.system_prompt},
+                    {"role": "user", "content": f"User Input: \"{user_input}\""}
+                ],
+                "temperature": 0.0,
+                # Note: Not all models support json_mode, but we provide the prompt instruction.
+            }
+            cache_key = llm_response_cache.make_key("intent", self.model_id, payload["messages"])
+            data = llm_response_cache.get(cache_key) if use_cache else None
+            if data is None:
+                # Concurrent identical requests share one upstream call
+                data = await self._flights.do(cache_key, lambda: self._classify_remote(payload, user_input))
+                metrics.incr("intent.remote")
+
+            result = self._parse(data)
+            # Only cache completions that parsed
+            if use_cache:
+                llm_response_cache.set(cache_key, data)
+            return result
         except Exception as e:
-            print(f"Intent Detection Error: {e}")
+            print(f"Intent Detection Error (falling back to CHAT): {e}")
+            metrics.incr("intent.fallbacks")
             # Fallback to CHAT to be safe
             return {"intent": "CHAT", "reason": "System fallback due to detection error."}
 
+    def _parse(self, data: Dict) -> Dict:
+        content = data["choices"][0]["message"]["content"]
+        # Clean markdown if model is chatty
+        if "```json" in content:
+            content = content.split("```json")[1].split("```")[0].strip()
+        elif "```" in content:
+            content = content.split("```")[1].split("```")[0].strip()
+        return json.loads(content)
+
+    async def _classify_remote(self, payload: Dict, user_input: str) -> Dict:
+        """One upstream classification; recorded once however many callers share it"""
+        data = await self._request(payload)
+        # Training data for the local classifier
+        await intent_classifier.record(user_input, self._parse(data).get("intent"))
+        return data
+
+    async def _request(self, payload: Dict) -> Dict:
+        """Raw completion for a classification payload (Groq, failing over to other providers)."""
+        response = await key_pools.post_chat(self.routes, payload)
+        if response.status_code != 200:
+            print(f"DEBUG Intent Error: {response.text}")
+            raise Exception(f"Groq API Error: {response.text}")
+        return response.json()
+
 intent_detector = IntentDetector()
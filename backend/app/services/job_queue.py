@@ -0,0 +1,183 @@
+"""
+Background Job Queue
+Bounded asyncio worker pool for work that should not run inside an HTTP request.
+
+Jobs are kept in memory: submitting returns a Job immediately, workers pick
+jobs up in FIFO order, and callers poll the job's status and progress.
+Handlers can also record an ordered event log, which callers can read from
+any offset or wait on (e.g. to stream it and resume after a reconnect).
+Handlers may compact the log once events are no longer needed; sequence
+numbers are never reused, so readers resume correctly across the gap.
+"""
+
+import asyncio
+import logging
+import uuid
+from bisect import bisect_right
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class Job:
+    """A unit of background work and its observable state"""
+
+    def __init__(self, kind: str, owner_id: Optional[str] = None, **metadata):
+        self.id = str(uuid.uuid4())
+        self.kind = kind
+        self.owner_id = owner_id
+        self.metadata = metadata
+        self.status = "queued"  # queued | running | succeeded | failed
+        self.progress: Dict[str, Any] = {}
+        self.result: Any = None
+        self.error: Optional[str] = None
+        self.created_at = datetime.utcnow()
+        self.started_at: Optional[datetime] = None
+        self.finished_at: Optional[datetime] = None
+        self.events: List[Dict[str, Any]] = []
+        self._seqs: List[int] = []
+        self._next_seq = 0
+        self._waiters: List[asyncio.Future] = []
+
+    def add_event(self, event: Dict[str, Any]):
+        """Append to the event log; events are numbered by an increasing `seq`"""
+        self.events.append({**event, "seq": self._next_seq})
+        self._seqs.append(self._next_seq)
+        self._next_seq += 1
+        self._notify()
+
+    def events_after(self, seq: int) -> List[Dict[str, Any]]:
+        """Events with a seq greater than `seq` (-1 for all)"""
+        return self.events[bisect_right(self._seqs, seq):]
+
+    def compact_events(self, keep: Callable[[Dict[str, Any]], bool]):
+        """Drop the events `keep` rejects; the others keep their seq"""
+        self.events = [event for event in self.events if keep(event)]
+        self._seqs = [event["seq"] for event in self.events]
+
+    async def wait(self, timeout: float) -> bool:
+        """Wait up to `timeout` seconds for a new event or completion; False on timeout"""
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            await asyncio.wait_for(waiter, timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+        finally:
+            if waiter in self._waiters:
+                self._waiters.remove(waiter)
+
+    def _notify(self):
+        for waiter in self._waiters:
+            if not waiter.done():
+                waiter.set_result(None)
+        self._waiters = []
+
+    def update_progress(self, **kwargs):
+        """Merge progress counters (e.g. chunks_stored=40)"""
+        self.progress.update(kwargs)
+
+    @property
+    def done(self) -> bool:
+        return self.status in ("succeeded", "failed")
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "job_id": self.id,
+            "kind": self.kind,
+            "status": self.status,
+            "progress": self.progress,
+            "result": self.result,
+            "error": self.error,
+            "metadata": self.metadata,
+            "created_at": self.created_at.isoformat(),
+            "started_at": self.started_at.isoformat() if self.started_at else None,
+            "finished_at": self.finished_at.isoformat() if self.finished_at else None,
+        }
+
+
+JobHandler = Callable[[Job], Awaitable[Any]]
+
+
+class JobQueue:
+    """
+    Bounded worker pool. Workers are started lazily on the first submit so
+    the queue binds to the running event loop, not the importing one.
+    """
+
+    def __init__(self, name: str, workers: int = 2, max_queued: int = 100, max_finished: int = 500):
+        self.name = name
+        self.workers = workers
+        self.max_queued = max_queued
+        self.max_finished = max_finished
+        self._jobs: Dict[str, Job] = {}
+        self._handlers: Dict[str, JobHandler] = {}
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker_tasks: List[asyncio.Task] = []
+
+    def submit(self, handler: JobHandler, kind: str, owner_id: Optional[str] = None, **metadata) -> Job:
+        """
+        Queue a job and return it immediately.
+
+        Raises:
+            asyncio.QueueFull: if max_queued jobs are already waiting
+        """
+        self._ensure_workers()
+        job = Job(kind, owner_id=owner_id, **metadata)
+        self._queue.put_nowait(job)
+        self._handlers[job.id] = handler
+        self._jobs[job.id] = job
+        self._prune_finished()
+        logger.info(f"[{self.name}] queued {kind} job {job.id}")
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        return self._jobs.get(job_id)
+
+    async def shutdown(self):
+        """Cancel workers; queued jobs are dropped"""
+        for task in self._worker_tasks:
+            task.cancel()
+        await asyncio.gather(*self._worker_tasks, return_exceptions=True)
+        self._worker_tasks = []
+        self._queue = None
+
+    def _ensure_workers(self):
+        if self._queue is None:
+            self._queue = asyncio.Queue(maxsize=self.max_queued)
+        if not self._worker_tasks:
+            self._worker_tasks = [
+                asyncio.create_task(self._worker(i)) for i in range(self.workers)
+            ]
+
+    async def _worker(self, index: int):
+        while True:
+            job = await self._queue.get()
+            handler = self._handlers.pop(job.id, None)
+            job.status = "running"
+            job.started_at = datetime.utcnow()
+            try:
+                job.result = await handler(job)
+                job.status = "succeeded"
+            except asyncio.CancelledError:
+                job.status = "failed"
+                job.error = "Cancelled"
+                raise
+            except Exception as e:
+                logger.error(f"[{self.name}] job {job.id} failed: {e}")
+                job.status = "failed"
+                job.error = str(e)
+            finally:
+                job.finished_at = datetime.utcnow()
+                job._notify()
+                self._queue.task_done()
+
+    def _prune_finished(self):
+        finished = [job for job in self._jobs.values() if job.done]
+        if len(finished) <= self.max_finished:
+            return
+        finished.sort(key=lambda job: job.finished_at)
+        for job in finished[:len(finished) - self.max_finished]:
+            del self._jobs[job.id]
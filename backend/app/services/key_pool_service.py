@@ -0,0 +1,305 @@
+"""
+API Key Pools
+Per-provider pools of API keys with local rate-limit accounting.
+
+Every key has two token buckets sized from the provider's per-key quota:
+requests per minute and tokens per minute. A request is sent with the
+least-loaded key that still has budget (fewest in-flight calls, then the
+most headroom left), so sustained throughput grows with the number of
+keys instead of one burst draining a single key for everyone.
+
+Budgets are corrected from what providers report: actual token usage,
+x-ratelimit-remaining-* / x-ratelimit-reset-* headers, and 429 responses,
+which cool the offending key down for Retry-After seconds.
+
+A share of every bucket (KEY_POOL_PRIORITY_RESERVE) is held back for
+priority requests: the small intent and planner calls. Agent calls with
+full tool schemas cannot drain a key so far that routing has nothing left.
+When a provider still has no key, post_chat fails over to the next
+provider instead of failing the call.
+
+Keys come from GOOGLE_API_KEYS / GROQ_API_KEYS / OPENAI_API_KEYS
+(comma-separated) plus the single-key settings.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import re
+import threading
+import time
+from typing import Any, Dict, List, Mapping, Optional, Tuple
+
+import httpx
+
+from app.core.config import settings
+from app.core.http_client import http_pool
+from app.core.metrics import metrics
+from app.services.provider_health_service import parse_retry_after
+
+logger = logging.getLogger(__name__)
+
+_DURATION_PART = re.compile(r"(\d+(?:\.\d+)?)(ms|s|m|h)")
+_DURATION_UNITS = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+
+
+# Failover targets for the single-shot intent and planner calls
+FALLBACK_ROUTES = [
+    ("Gemini", "https://generativelanguage.googleapis.com/v1beta/openai/chat/completions", "gemini-2.5-flash"),
+    ("OpenAI", "https://api.openai.com/v1/chat/completions", "gpt-4o-mini"),
+]
+
+
+class NoKeyAvailable(RuntimeError):
+    """Every key of the provider is out of budget or cooling down"""
+
+
+def parse_reset_duration(value: Optional[str]) -> Optional[float]:
+    """Seconds from x-ratelimit-reset-* values such as "1m2.5s", "20ms" or "7" """
+    if not value:
+        return None
+    parts = _DURATION_PART.findall(value)
+    if parts:
+        return sum(float(amount) * _DURATION_UNITS[unit] for amount, unit in parts)
+    return parse_retry_after(value)
+
+
+class TokenBucket:
+    def __init__(self, capacity: float, per_minute: float):
+        self.capacity = capacity
+        self.rate = per_minute / 60.0
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_for(self, amount: float, reserve: float = 0.0) -> float:
+        """Seconds until `amount` is available (after refill) with `reserve` of the capacity left over"""
+        missing = min(amount + reserve * self.capacity, self.capacity) - self.tokens
+        return max(0.0, missing / self.rate) if self.rate else float("inf")
+
+
+class PooledKey:
+    def __init__(self, key: str, rpm: int, tpm: int):
+        self.key = key
+        self.requests = TokenBucket(rpm, rpm)
+        self.tokens = TokenBucket(tpm, tpm)
+        self.in_flight = 0
+        self.cooldown_until = 0.0
+
+    def wait_for(self, estimated_tokens: int, now: float, reserve: float = 0.0) -> float:
+        self.requests.refill(now)
+        self.tokens.refill(now)
+        return max(self.cooldown_until - now, self.requests.wait_for(1, reserve),
+                   self.tokens.wait_for(estimated_tokens, reserve))
+
+    def headroom(self) -> float:
+        return min(self.requests.tokens / self.requests.capacity, self.tokens.tokens / self.tokens.capacity)
+
+
+class KeyPool:
+    def __init__(self, provider: str, keys: List[str], rpm: int, tpm: int):
+        self.provider = provider
+        self.keys = [PooledKey(key, rpm, tpm) for key in keys]
+        self._by_key = {pooled.key: pooled for pooled in self.keys}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def try_acquire(self, estimated_tokens: int, priority: bool = False) -> Tuple[Optional[str], float]:
+        """
+        (key, 0) for the least-loaded key with budget, else (None, seconds
+        until one frees up). Non-priority requests leave the reserve untouched.
+        """
+        now = time.monotonic()
+        reserve = 0.0 if priority else settings.KEY_POOL_PRIORITY_RESERVE
+        with self._lock:
+            ready, soonest = [], float("inf")
+            for pooled in self.keys:
+                wait = pooled.wait_for(estimated_tokens, now, reserve)
+                if wait <= 0:
+                    ready.append(pooled)
+                soonest = min(soonest, wait)
+            if not ready:
+                return None, soonest
+
+            pooled = min(ready, key=lambda k: (k.in_flight, -k.headroom()))
+            pooled.requests.tokens -= 1
+            pooled.tokens.tokens -= min(estimated_tokens, pooled.tokens.capacity)
+            pooled.in_flight += 1
+            return pooled.key, 0.0
+
+    def release(self, key: str, estimated_tokens: int, status_code: Optional[int] = None,
+                headers: Optional[Mapping[str, str]] = None, used_tokens: Optional[int] = None):
+        """Settles a request: reconciles token usage and applies rate-limit headers"""
+        headers = headers or {}
+        now = time.monotonic()
+        with self._lock:
+            pooled = self._by_key.get(key)
+            if pooled is None:
+                return
+            pooled.in_flight = max(0, pooled.in_flight - 1)
+            if used_tokens is not None:
+                pooled.tokens.tokens -= used_tokens - min(estimated_tokens, pooled.tokens.capacity)
+
+            remaining_requests = headers.get("x-ratelimit-remaining-requests")
+            if remaining_requests is not None and remaining_requests.isdigit():
+                pooled.requests.tokens = min(pooled.requests.tokens, float(remaining_requests))
+            remaining_tokens = headers.get("x-ratelimit-remaining-tokens")
+            if remaining_tokens is not None and remaining_tokens.isdigit():
+                pooled.tokens.tokens = min(pooled.tokens.tokens, float(remaining_tokens))
+
+            if status_code == 429:
+                delay = (parse_retry_after(headers.get("retry-after"))
+                         or parse_reset_duration(headers.get("x-ratelimit-reset-requests"))
+                         or parse_reset_duration(headers.get("x-ratelimit-reset-tokens"))
+                         or settings.LLM_BREAKER_OPEN_SECONDS)
+                pooled.cooldown_until = max(pooled.cooldown_until, now + delay)
+                metrics.incr(f"llm.key_rate_limited.{self.provider}")
+
+    def available(self) -> bool:
+        """True if any key is outside a 429 cooldown"""
+        now = time.monotonic()
+        with self._lock:
+            return any(pooled.cooldown_until <= now for pooled in self.keys)
+
+    def stats(self) -> List[Dict[str, Any]]:
+        now = time.monotonic()
+        with self._lock:
+            return [
+                {
+                    "key": f"...{pooled.key[-4:]}",
+                    "in_flight": pooled.in_flight,
+                    "requests_left": round(pooled.requests.tokens, 1),
+                    "tokens_left": round(pooled.tokens.tokens),
+                    "cooldown_s": round(max(0.0, pooled.cooldown_until - now), 1),
+                }
+                for pooled in self.keys
+            ]
+
+
+class KeyPoolRegistry:
+    def __init__(self):
+        self.pools: Dict[str, KeyPool] = {}
+        for provider, pool_setting, single_setting, rpm, tpm in [
+            ("Gemini", "GOOGLE_API_KEYS", "GOOGLE_API_KEY", settings.GEMINI_KEY_RPM, settings.GEMINI_KEY_TPM),
+            ("Groq", "GROQ_API_KEYS", "GROQ_API_KEY", settings.GROQ_KEY_RPM, settings.GROQ_KEY_TPM),
+            ("OpenAI", "OPENAI_API_KEYS", "OPENAI_API_KEY", settings.OPENAI_KEY_RPM, settings.OPENAI_KEY_TPM),
+        ]:
+            keys = self._configured_keys(pool_setting, single_setting)
+            if keys:
+                self.pools[provider] = KeyPool(provider, keys, rpm, tpm)
+
+    @staticmethod
+    def _configured_keys(pool_setting: str, single_setting: str) -> List[str]:
+        raw = [
+            *(os.getenv(pool_setting) or getattr(settings, pool_setting) or "").split(","),
+            os.getenv(single_setting) or getattr(settings, single_setting),
+        ]
+        keys = []
+        for key in raw:
+            key = (key or "").strip()
+            if key and key not in keys:
+                keys.append(key)
+        return keys
+
+    def has(self, provider: str) -> bool:
+        return provider in self.pools
+
+    def size(self, provider: str) -> int:
+        pool = self.pools.get(provider)
+        return len(pool) if pool else 0
+
+    def available(self, provider: str) -> bool:
+        pool = self.pools.get(provider)
+        return bool(pool) and pool.available()
+
+    async def acquire(self, provider: str, estimated_tokens: int, priority: bool = False) -> Optional[str]:
+        """
+        A key with budget for the request, waiting up to KEY_POOL_MAX_WAIT_SECONDS
+        for one to refill. None if the provider has no usable key.
+        """
+        pool = self.pools.get(provider)
+        if pool is None:
+            return None
+        key, wait = pool.try_acquire(estimated_tokens, priority)
+        if key is None and wait <= settings.KEY_POOL_MAX_WAIT_SECONDS:
+            metrics.incr(f"llm.key_waits.{provider}")
+            await asyncio.sleep(wait)
+            key, _ = pool.try_acquire(estimated_tokens, priority)
+        if key is None:
+            metrics.incr(f"llm.keys_exhausted.{provider}")
+        return key
+
+    def release(self, provider: str, key: str, estimated_tokens: int, status_code: Optional[int] = None,
+                headers: Optional[Mapping[str, str]] = None, usage: Optional[Dict[str, Any]] = None):
+        pool = self.pools.get(provider)
+        if pool is not None and key:
+            used = (usage or {}).get("total_tokens")
+            pool.release(key, estimated_tokens, status_code, headers, used)
+
+    async def post_json(self, provider: str, url: str, payload: Dict[str, Any], priority: bool = True) -> httpx.Response:
+        """
+        POSTs a chat completion with a pooled key; for single-shot callers
+        (intent, planner), which may use the priority reserve
+        """
+        body = json.dumps(payload).encode("utf-8")
+        estimated = estimate_request_tokens(body)
+        key = await self.acquire(provider, estimated, priority)
+        if key is None:
+            raise NoKeyAvailable(f"No {provider} API key available")
+
+        status_code, headers, usage = None, None, None
+        try:
+            client = http_pool.client_for(url)
+            response = await client.post(url, content=body, headers={
+                "Authorization": f"Bearer {key}",
+                "Content-Type": "application/json"
+            })
+            status_code, headers = response.status_code, response.headers
+            if status_code == 200:
+                usage = response.json().get("usage")
+            return response
+        finally:
+            self.release(provider, key, estimated, status_code, headers, usage)
+
+    async def post_chat(self, routes: List[Tuple[str, str, str]], payload: Dict[str, Any]) -> httpx.Response:
+        """
+        POSTs `payload` to the first of `routes` ((provider, url, model), in
+        order of preference) that has a key and answers without a 429/5xx.
+        The last response is returned if every route answered with an error.
+        """
+        response = None
+        for index, (provider, url, model) in enumerate(routes):
+            if not self.has(provider):
+                continue
+            if index:
+                metrics.incr(f"llm.failovers.{provider}")
+            try:
+                response = await self.post_json(provider, url, {**payload, "model": model})
+            except NoKeyAvailable as e:
+                logger.warning(f"{e}; failing over")
+                continue
+            if response.status_code == 429 or response.status_code >= 500:
+                logger.warning(f"{provider} answered {response.status_code}; failing over")
+                continue
+            return response
+        if response is None:
+            raise NoKeyAvailable("No API key available for any provider")
+        return response
+
+    def snapshot(self) -> Dict[str, List[Dict[str, Any]]]:
+        return {provider: pool.stats() for provider, pool in self.pools.items()}
+
+
+def estimate_request_tokens(body: bytes) -> int:
+    # ~4 bytes per token for the prompt, plus room for the completion
+    return len(body) // 4 + settings.KEY_POOL_COMPLETION_TOKENS
+
+
+key_pools = KeyPoolRegistry()
+metrics.register_gauge("llm.key_pools", key_pools.snapshot)
@@ -0,0 +1,130 @@
+"""
+LLM Response Cache
+Caches deterministic (temperature 0) completions keyed by a canonical hash
+of (provider, model, messages, tools).
+
+Two tiers: an in-memory LRU, and an optional on-disk tier (one JSON file per
+entry under LLM_CACHE_DISK_DIR) that survives restarts and is shared by
+worker processes. Hits and misses are reported to the metrics registry.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import time
+from typing import Any, Dict, List, Optional
+
+from app.core.cache import TTLCache
+from app.core.config import settings
+from app.core.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class LLMResponseCache:
+    def __init__(self, maxsize: int, ttl: float, disk_dir: Optional[str] = None, enabled: bool = True):
+        self.enabled = enabled
+        self.ttl = ttl
+        self.memory = TTLCache(maxsize=maxsize, ttl=ttl)
+        self.disk_dir = disk_dir
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+
+    @staticmethod
+    def make_key(provider: str, model: str, messages: List[Dict[str, Any]],
+                 tools: Optional[List[Dict[str, Any]]] = None, prefix_version: str = "") -> str:
+        """
+        Canonical hash: key order and whitespace do not affect the key.
+        Callers with a precompiled static prefix pass its hash as
+        prefix_version instead of re-serializing it.
+        """
+        canonical = json.dumps(
+            {"provider": provider, "model": model, "messages": messages, "tools": tools or [], "prefix": prefix_version},
+            sort_keys=True, separators=(",", ":"), ensure_ascii=False, default=str
+        )
+        return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+    def get(self, key: str, count_miss: bool = True) -> Optional[Any]:
+        """
+        Look a key up in memory, then on disk. Callers probing several keys
+        for one request pass count_miss=False and call record_miss() once.
+        """
+        if not self.enabled:
+            return None
+
+        value = self.memory.get(key)
+        if value is not None:
+            metrics.incr("llm_cache.hits.memory")
+            return value
+
+        value = self._disk_get(key)
+        if value is not None:
+            metrics.incr("llm_cache.hits.disk")
+            self.memory.set(key, value)
+            return value
+
+        if count_miss:
+            self.record_miss()
+        return None
+
+    def record_miss(self):
+        if self.enabled:
+            metrics.incr("llm_cache.misses")
+
+    def set(self, key: str, value: Any):
+        if not self.enabled:
+            return
+        self.memory.set(key, value)
+        self._disk_set(key, value)
+
+    def _disk_path(self, key: str) -> str:
+        return os.path.join(self.disk_dir, f"{key}.json")
+
+    def _disk_get(self, key: str) -> Optional[Any]:
+        if not self.disk_dir:
+            return None
+        path = self._disk_path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                entry = json.load(f)
+            if entry["expires_at"] <= time.time():
+                os.remove(path)
+                return None
+            return entry["value"]
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.warning(f"Ignoring unreadable LLM cache entry {key}: {e}")
+            return None
+
+    def _disk_set(self, key: str, value: Any):
+        if not self.disk_dir:
+            return
+        path = self._disk_path(key)
+        tmp_path = f"{path}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"expires_at": time.time() + self.ttl, "value": value}, f)
+            os.replace(tmp_path, path)
+        except Exception as e:
+            logger.warning(f"Failed to write LLM cache entry {key}: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        hits = metrics.get("llm_cache.hits.memory") + metrics.get("llm_cache.hits.disk")
+        lookups = hits + metrics.get("llm_cache.misses")
+        return {
+            "enabled": self.enabled,
+            "memory_entries": len(self.memory),
+            "disk_tier": bool(self.disk_dir),
+            "hit_ratio": round(hits / lookups, 3) if lookups else 0.0,
+        }
+
+
+llm_response_cache = LLMResponseCache(
+    maxsize=settings.LLM_CACHE_SIZE,
+    ttl=settings.LLM_CACHE_TTL_SECONDS,
+    disk_dir=settings.LLM_CACHE_DISK_DIR,
+    enabled=settings.LLM_CACHE_ENABLED
+)
+metrics.register_gauge("llm_cache", llm_response_cache.stats)
@@ -1,27 +1,26 @@
-import os
-import httpx
 import json
-import itertools
-from typing import List, Dict, Optional, Any
+import time
+import asyncio
+import hashlib
+import httpx
+from typing import AsyncIterator, Collection, List, Dict, Optional, Any
+from app.core.cache import TTLCache
 from app.core.config import settings
+from app.core.http_client import http_pool
+from app.core.metrics import metrics
+from app.core.singleflight import SingleFlight
+from app.services.context_builder import RollingSummary, context_builder
+from app.services.key_pool_service import estimate_request_tokens, key_pools
+from app.services.llm_cache_service import llm_response_cache
+from app.services.provider_health_service import provider_health
 
 class LLMService:
     def __init__(self):
         # ---------------------------------------------------------
-        # 1. API Keys & Configuration (Supporting Rotation)
+        # 1. API Keys: per-provider pools with RPM/TPM accounting
+        #    (see key_pool_service; a key is picked per request)
         # ---------------------------------------------------------
         
-        # Gemini Keys (Multiple support for "Wallet" and quota management)
-        self.gemini_keys = [
-            os.getenv("GOOGLE_API_KEY"),
-        ]
-        self.gemini_keys = [k for k in self.gemini_keys if k] # Filter out None
-        self.gemini_cycle = itertools.cycle(self.gemini_keys)
-        
-        # Fallback Providers
-        self.groq_key = os.getenv("GROQ_API_KEY") or settings.GROQ_API_KEY
-        self.openai_key = os.getenv("OPENAI_API_KEY")
-        
         # ---------------------------------------------------------
         # 2. Provider Map (Priority Order)
         # ---------------------------------------------------------
@@ -46,6 +45,15 @@ class LLMService:
             }
         ]
 
+        # Hedging budget: hedges fired vs. requests that could have hedged
+        self._hedge_eligible = 0
+        self._hedges_fired = 0
+
+        self._flights = SingleFlight("llm")
+
+        # Compiled static prefixes (system prompt + tool schemas) per tool set
+        self._prefix_cache = TTLCache(maxsize=64)
+
         self.system_instruction = (
             "You are EDITH, a General Intelligence Agent designed for elite personal and enterprise assistance. "
             "Your objective is to solve any user request by intelligently orchestrating your available tools.\n\n"
@@ -74,16 +82,26 @@ class LLMService:
             "3. **Real-time Status**: Always inform the user when you are 'indexing' or 'searching indexed records' to maintain the Omni-Dash transparency."
         )
 
-    async def get_raw_response(
-        self, 
-        user_input: str, 
-        history: List[Dict[str, Any]] = None,
-        tools: List[Dict[str, Any]] = None
-    ) -> Any:
-        # Construct messages once
-        messages = [{"role": "system", "content": self.system_instruction}]
-        processed_history = (history[-12:]) if history and len(history) > 12 else history
-        
+    def _build_messages(self, user_input: str, history: List[Dict[str, Any]] = None,
+                        instructions: Optional[str] = None,
+                        summary_state: Optional[RollingSummary] = None,
+                        result_scope: Optional[str] = None) -> List[Dict[str, Any]]:
+        """
+        Converts EDITH's parts-based history into OpenAI-format messages.
+        The static system prompt is not included; it is part of the compiled
+        prefix (see _compile_prefix). Per-call `instructions` follow it as a
+        separate system message so the prefix stays cacheable.
+        `summary_state` carries the rolling summary of evicted turns across
+        calls for the same conversation; `result_scope` owns the tool results
+        the context builder stores aside (see tool_result_store).
+        """
+        messages = []
+        if instructions:
+            messages.append({"role": "system", "content": instructions})
+        summary, processed_history = context_builder.build(history, summary_state, result_scope)
+        if summary:
+            messages.append({"role": "system", "content": f"Summary of earlier conversation:\n{summary}"})
+
         if processed_history:
             for entry in processed_history:
                 role = entry.get("role")
@@ -107,70 +125,391 @@ class LLMService:
                     messages.append(msg)
         if not history and user_input:
             messages.append({"role": "user", "content": user_input})
+        return messages
 
-        # Tool definitions
-        openapi_tools = []
-        if tools:
-            for t_group in tools:
-                for decl in t_group.get("function_declarations", []):
-                    openapi_tools.append({"type": "function", "function": {"name": decl["name"], "description": decl["description"], "parameters": decl["parameters"]}})
+    def _compile_prefix(self, tools: List[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """
+        The static part of every request: the system message and the tool
+        schemas converted to OpenAI format, serialized once per tool set.
+        `version` hashes both; it keys the response cache and the providers'
+        prompt caches. Reused while the same declaration objects are passed.
+        """
+        declarations = [decl for t_group in tools or [] for decl in t_group.get("function_declarations", [])]
+        key = tuple(decl["name"] for decl in declarations)
+        compiled = self._prefix_cache.get(key)
+        if (compiled is not None and compiled["system"] is self.system_instruction
+                and all(a is b for a, b in zip(compiled["declarations"], declarations))):
+            return compiled
 
-        # ---------------------------------------------------------
-        # TRY PROVIDERS WITH FALLBACK
-        # ---------------------------------------------------------
-        
-        # Build priority list based on user selection
+        openapi_tools = [
+            {"type": "function", "function": {"name": decl["name"], "description": decl["description"], "parameters": decl["parameters"]}}
+            for decl in declarations
+        ]
+        system_json = json.dumps({"role": "system", "content": self.system_instruction})
+        tools_json = json.dumps(openapi_tools) if openapi_tools else ""
+        compiled = {
+            "system": self.system_instruction,
+            "declarations": declarations,
+            "tools": openapi_tools,
+            "system_json": system_json,
+            "tools_json": tools_json,
+            "version": hashlib.sha256(f"{system_json}{tools_json}".encode("utf-8")).hexdigest()[:16],
+        }
+        self._prefix_cache.set(key, compiled)
+        return compiled
+
+    def _encode_payload(self, config: Dict[str, Any], messages: List[Dict[str, Any]],
+                        prefix: Dict[str, Any], stream: bool = False) -> bytes:
+        """
+        Request body with the compiled prefix spliced in verbatim, so only the
+        per-call messages are serialized and the prefix is byte-identical
+        across calls (what implicit provider prompt caching matches on).
+        """
+        head = {"model": config["model"], "temperature": 0.0}
+        if stream: head["stream"] = True
+        if config["provider"] == "OpenAI":
+            # Routes requests sharing the prefix to the same prompt cache
+            head["prompt_cache_key"] = prefix["version"]
+
+        body = json.dumps(head)[:-1]
+        if prefix["tools_json"]:
+            body += f', "tools": {prefix["tools_json"]}'
+        body += f', "messages": [{prefix["system_json"]}'
+        if messages:
+            body += f", {json.dumps(messages)[1:-1]}"
+        body += "]}"
+        return body.encode("utf-8")
+
+    def _provider_configs(self) -> List[Dict[str, Any]]:
+        """Builds the provider priority list based on user selection."""
         configs_to_try = []
         
         primary_name = settings.PRIMARY_LLM
         primary_model = settings.PRIMARY_MODEL
         
         # Add primary if keys exist
-        if primary_name == "Gemini" and self.gemini_keys:
+        if primary_name == "Gemini" and key_pools.has("Gemini"):
             configs_to_try.append({
                 "name": f"Gemini (Primary)",
+                "provider": "Gemini",
                 "url": "https://generativelanguage.googleapis.com/v1beta/openai/chat/completions",
-                "model": primary_model,
-                "key": next(self.gemini_cycle)
+                "model": primary_model
             })
-        elif primary_name == "Groq" and self.groq_key:
-            configs_to_try.append({"name": "Groq (Primary)", "url": "https://api.groq.com/openai/v1/chat/completions", "model": primary_model, "key": self.groq_key})
-        elif primary_name == "OpenAI" and self.openai_key:
-            configs_to_try.append({"name": "OpenAI (Primary)", "url": "https://api.openai.com/v1/chat/completions", "model": primary_model, "key": self.openai_key})
+        elif primary_name == "Groq" and key_pools.has("Groq"):
+            configs_to_try.append({"name": "Groq (Primary)", "provider": "Groq", "url": "https://api.groq.com/openai/v1/chat/completions", "model": primary_model})
+        elif primary_name == "OpenAI" and key_pools.has("OpenAI"):
+            configs_to_try.append({"name": "OpenAI (Primary)", "provider": "OpenAI", "url": "https://api.openai.com/v1/chat/completions", "model": primary_model})
 
         # Add remaining as fallbacks
-        if primary_name != "Gemini" and self.gemini_keys:
+        if primary_name != "Gemini" and key_pools.has("Gemini"):
              configs_to_try.append({
                 "name": "Gemini Fallback",
+                "provider": "Gemini",
                 "url": "https://generativelanguage.googleapis.com/v1beta/openai/chat/completions",
-                "model": "gemini-2.5-flash",
-                "key": next(self.gemini_cycle)
+                "model": "gemini-2.5-flash"
             })
-        if primary_name != "Groq" and self.groq_key:
-            configs_to_try.append({"name": "Groq Fallback", "url": "https://api.groq.com/openai/v1/chat/completions", "model": "openai/gpt-oss-20b", "key": self.groq_key})
-        if primary_name != "OpenAI" and self.openai_key:
-            configs_to_try.append({"name": "OpenAI Fallback", "url": "https://api.openai.com/v1/chat/completions", "model": "gpt-4o", "key": self.openai_key})
-
-        async with httpx.AsyncClient() as client:
-            for config in configs_to_try:
-                try:
-                    payload = {"model": config["model"], "messages": messages, "temperature": 0.0}
-                    if openapi_tools: payload["tools"] = openapi_tools
-                    
-                    headers = {"Authorization": f"Bearer {config['key']}", "Content-Type": "application/json"}
-                    
-                    response = await client.post(config["url"], json=payload, headers=headers, timeout=30.0)
-                    
-                    if response.status_code == 200:
-                        return response.json()
-                    else:
-                        print(f"Provider {config['name']} failed with {response.status_code}: {response.text}")
-                        continue # Try next config
-                except Exception as e:
-                    print(f"Network error with {config['name']}: {e}")
-                    continue
+        if primary_name != "Groq" and key_pools.has("Groq"):
+            configs_to_try.append({"name": "Groq Fallback", "provider": "Groq", "url": "https://api.groq.com/openai/v1/chat/completions", "model": "openai/gpt-oss-20b"})
+        if primary_name != "OpenAI" and key_pools.has("OpenAI"):
+            configs_to_try.append({"name": "OpenAI Fallback", "provider": "OpenAI", "url": "https://api.openai.com/v1/chat/completions", "model": "gpt-4o"})
+        return configs_to_try
+
+    async def get_raw_response(
+        self, 
+        user_input: str, 
+        history: List[Dict[str, Any]] = None,
+        tools: List[Dict[str, Any]] = None,
+        use_cache: bool = True,
+        hedge: bool = False,
+        instructions: Optional[str] = None,
+        uncacheable_tools: Optional[Collection[str]] = None,
+        summary_state: Optional[RollingSummary] = None,
+        result_scope: Optional[str] = None
+    ) -> Any:
+        """
+        Returns the first successful provider completion.
+
+        Calls are temperature 0, so identical requests are served from
+        llm_response_cache; pass use_cache=False for side-effecting turns.
+        Completions that call any of `uncacheable_tools` are never stored,
+        so replaying them cannot repeat a side effect.
+        With hedge=True, a slow primary is raced against the next healthy
+        provider (see _hedged_call).
+        """
+        messages = self._build_messages(user_input, history, instructions, summary_state, result_scope)
+        prefix = self._compile_prefix(tools)
+        configs = self._provider_configs()
+
+        cached = self._cached_response(configs, messages, prefix, use_cache)
+        if cached is not None:
+            return cached
+
+        if not use_cache:
+            return await self._fetch(configs, messages, prefix, use_cache, hedge, uncacheable_tools)
+
+        # Identical concurrent requests (e.g. Telegram and the web UI) share one call
+        flight_key = llm_response_cache.make_key(
+            ",".join(c["name"] for c in configs), "", messages, prefix_version=prefix["version"]
+        )
+        return await self._flights.do(flight_key, lambda: self._fetch(configs, messages, prefix, use_cache, hedge, uncacheable_tools))
+
+    async def _fetch(self, configs: List[Dict[str, Any]], messages: List[Dict[str, Any]],
+                     prefix: Dict[str, Any], use_cache: bool, hedge: bool,
+                     uncacheable_tools: Optional[Collection[str]] = None) -> Dict[str, Any]:
+        # ---------------------------------------------------------
+        # TRY PROVIDERS WITH FALLBACK (fastest healthy first)
+        # ---------------------------------------------------------
+        ordered = provider_health.order(configs)
+        if hedge and len(ordered) > 1:
+            data, config, ordered = await self._hedged_call(ordered, messages, prefix)
+            if data is not None:
+                self._store(config, messages, prefix, data, use_cache, uncacheable_tools)
+                return data
+
+        for config in ordered:
+            data = await self._call_provider(config, messages, prefix)
+            if data is not None:
+                self._store(config, messages, prefix, data, use_cache, uncacheable_tools)
+                return data
 
         # Final Fail
+        return self._unavailable_response()
+
+    async def _hedged_call(self, ordered: List[Dict[str, Any]], messages: List[Dict[str, Any]],
+                           prefix: Dict[str, Any]):
+        """
+        Sends to the first provider; if it has not answered within its
+        percentile latency (provider_health.hedge_delay) and the hedge budget
+        allows, sends the same request to the second. The first success wins
+        and the other request is cancelled.
+
+        Returns (data, winning_config, untried_configs); data is None if every
+        raced provider failed, so the caller falls back to the untried ones.
+        """
+        self._hedge_eligible += 1
+        primary, backup, remaining = ordered[0], ordered[1], ordered[2:]
+        tasks = {asyncio.create_task(self._call_provider(primary, messages, prefix)): primary}
+
+        done, _ = await asyncio.wait(tasks, timeout=provider_health.hedge_delay(primary["provider"]))
+        if not done:
+            if self._hedges_fired + 1 <= settings.LLM_HEDGE_BUDGET_RATIO * self._hedge_eligible:
+                self._hedges_fired += 1
+                metrics.incr("llm.hedges_fired")
+                tasks[asyncio.create_task(self._call_provider(backup, messages, prefix))] = backup
+            else:
+                metrics.incr("llm.hedges_skipped_budget")
+                remaining = [backup] + remaining
+        else:
+            remaining = [backup] + remaining
+
+        pending = set(tasks)
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    data = task.result()
+                    if data is not None:
+                        if tasks[task] is backup:
+                            metrics.incr("llm.hedges_won")
+                        return data, tasks[task], remaining
+        finally:
+            for task in pending:
+                task.cancel()
+        return None, None, remaining
+
+    async def _call_provider(self, config: Dict[str, Any], messages: List[Dict[str, Any]],
+                             prefix: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """
+        One attempt against one provider; updates its health and key pool.
+        None on failure. The key and any half-open probe slot are released on
+        every exit, including cancellation of the losing side of a hedge.
+        """
+        if not provider_health.acquire(config):
+            return None
+
+        body = self._encode_payload(config, messages, prefix)
+        estimated = estimate_request_tokens(body)
+        key, health_recorded = None, False
+        status_code, response_headers, usage = None, None, None
+        try:
+            key = await key_pools.acquire(config["provider"], estimated)
+            if key is None:
+                return None
+            headers = {"Authorization": f"Bearer {key}", "Content-Type": "application/json"}
+
+            start = time.monotonic()
+            try:
+                client = http_pool.client_for(config["url"])
+                response = await client.post(config["url"], content=body, headers=headers, timeout=self._timeout())
+            except Exception as e:
+                print(f"Network error with {config['name']}: {e}")
+                provider_health.record_failure(config["provider"])
+                health_recorded = True
+                return None
+            status_code, response_headers = response.status_code, response.headers
+
+            if response.status_code == 200:
+                provider_health.record_success(config["provider"], time.monotonic() - start)
+                health_recorded = True
+                data = response.json()
+                usage = data.get("usage") or {}
+                if usage.get("prompt_tokens"):
+                    metrics.observe("llm.prompt_tokens", usage["prompt_tokens"])
+                return data
+
+            print(f"Provider {config['name']} failed with {response.status_code}: {response.text}")
+            # Settle the key first: a 429 cools it, which the failure check reads
+            key_pools.release(config["provider"], key, estimated, status_code, response_headers)
+            key = None
+            self._record_provider_failure(config, response)
+            health_recorded = True
+            return None
+        finally:
+            if key is not None:
+                key_pools.release(config["provider"], key, estimated, status_code, response_headers, usage)
+            if not health_recorded:
+                # No key, or cancelled mid-request: says nothing about health
+                provider_health.release(config["provider"])
+
+    def _record_provider_failure(self, config: Dict[str, Any], response: httpx.Response):
+        # A 429 on one key only cools that key; the provider is unhealthy
+        # once every key in its pool is rate limited
+        if response.status_code == 429 and key_pools.available(config["provider"]):
+            provider_health.release(config["provider"])
+            return
+        provider_health.record_failure(config["provider"], response.status_code, response.headers.get("retry-after"))
+
+    def _timeout(self) -> httpx.Timeout:
+        # Fail fast on unreachable providers; allow long generations
+        return httpx.Timeout(30.0, connect=settings.LLM_CONNECT_TIMEOUT_SECONDS)
+
+    async def stream_raw_response(
+        self,
+        user_input: str,
+        history: List[Dict[str, Any]] = None,
+        tools: List[Dict[str, Any]] = None,
+        use_cache: bool = True,
+        instructions: Optional[str] = None,
+        uncacheable_tools: Optional[Collection[str]] = None,
+        summary_state: Optional[RollingSummary] = None,
+        result_scope: Optional[str] = None
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Streaming variant of get_raw_response.
+
+        Yields {"type": "token", "text": ...} as content deltas arrive, then a
+        single {"type": "response", "response": ...} whose payload has the same
+        shape as get_raw_response's (tool call deltas are reassembled). Falls
+        back to the next provider only if nothing has been streamed yet.
+        """
+        messages = self._build_messages(user_input, history, instructions, summary_state, result_scope)
+        prefix = self._compile_prefix(tools)
+        configs = self._provider_configs()
+
+        cached = self._cached_response(configs, messages, prefix, use_cache)
+        if cached is not None:
+            content = cached["choices"][0]["message"].get("content")
+            if content:
+                yield {"type": "token", "text": content}
+            yield {"type": "response", "response": cached}
+            return
+
+        for config in provider_health.order(configs):
+            if not provider_health.acquire(config):
+                continue
+            body = self._encode_payload(config, messages, prefix, stream=True)
+            estimated = estimate_request_tokens(body)
+            key = await key_pools.acquire(config["provider"], estimated)
+            if key is None:
+                provider_health.release(config["provider"])
+                continue
+            streamed_any = False
+            status_code, response_headers = None, None
+            start = time.monotonic()
+            try:
+                headers = {"Authorization": f"Bearer {key}", "Content-Type": "application/json"}
+                
+                client = http_pool.client_for(config["url"])
+                async with client.stream("POST", config["url"], content=body, headers=headers, timeout=self._timeout()) as response:
+                    status_code, response_headers = response.status_code, response.headers
+                    if response.status_code != 200:
+                        error_body = await response.aread()
+                        print(f"Provider {config['name']} failed with {response.status_code}: {error_body.decode(errors='replace')}")
+                        self._record_provider_failure(config, response)
+                        continue
+
+                    content = ""
+                    tool_calls: Dict[int, Dict[str, Any]] = {}
+                    async for line in response.aiter_lines():
+                        if not line.startswith("data:"):
+                            continue
+                        data = line[len("data:"):].strip()
+                        if data == "[DONE]":
+                            break
+                        chunk = json.loads(data)
+                        if not chunk.get("choices"):
+                            continue
+                        delta = chunk["choices"][0].get("delta", {})
+                        if delta.get("content"):
+                            content += delta["content"]
+                            streamed_any = True
+                            yield {"type": "token", "text": delta["content"]}
+                        for tc in delta.get("tool_calls") or []:
+                            streamed_any = True
+                            slot = tool_calls.setdefault(tc.get("index", len(tool_calls)), {
+                                "id": None, "type": "function", "function": {"name": "", "arguments": ""}
+                            })
+                            if tc.get("id"): slot["id"] = tc["id"]
+                            fn = tc.get("function") or {}
+                            if fn.get("name"): slot["function"]["name"] += fn["name"]
+                            if fn.get("arguments"): slot["function"]["arguments"] += fn["arguments"]
+
+                message = {"role": "assistant", "content": content or None}
+                if tool_calls:
+                    message["tool_calls"] = [tool_calls[i] for i in sorted(tool_calls)]
+                data = {"choices": [{"message": message}]}
+                provider_health.record_success(config["provider"], time.monotonic() - start)
+                self._store(config, messages, prefix, data, use_cache, uncacheable_tools)
+                yield {"type": "response", "response": data}
+                return
+            except Exception as e:
+                print(f"Network error with {config['name']}: {e}")
+                provider_health.record_failure(config["provider"])
+                if streamed_any:
+                    raise
+                continue
+            finally:
+                key_pools.release(config["provider"], key, estimated, status_code, response_headers)
+
+        yield {"type": "response", "response": self._unavailable_response()}
+
+    def _cache_key(self, config: Dict[str, Any], messages: List[Dict[str, Any]], prefix: Dict[str, Any]) -> str:
+        return llm_response_cache.make_key(config["provider"], config["model"], messages, prefix_version=prefix["version"])
+
+    def _store(self, config: Dict[str, Any], messages: List[Dict[str, Any]], prefix: Dict[str, Any],
+               data: Dict[str, Any], use_cache: bool, uncacheable_tools: Optional[Collection[str]]):
+        if not use_cache:
+            return
+        if uncacheable_tools:
+            calls = data["choices"][0]["message"].get("tool_calls") or []
+            if any(call.get("function", {}).get("name") in uncacheable_tools for call in calls):
+                metrics.incr("llm.cache_skipped_side_effects")
+                return
+        llm_response_cache.set(self._cache_key(config, messages, prefix), data)
+
+    def _cached_response(self, configs_to_try: List[Dict[str, Any]], messages: List[Dict[str, Any]],
+                         prefix: Dict[str, Any], use_cache: bool) -> Optional[Dict[str, Any]]:
+        """Returns a cached completion from any configured provider, if present."""
+        if not use_cache:
+            return None
+        for config in configs_to_try:
+            cached = llm_response_cache.get(self._cache_key(config, messages, prefix), count_miss=False)
+            if cached is not None:
+                return cached
+        llm_response_cache.record_miss()
+        return None
+
+    def _unavailable_response(self) -> Dict[str, Any]:
         return {
             "choices": [{"message": {"role": "assistant", "content": "I apologize, but all my intelligence providers are currently unavailable. Please check your API keys or connection."}}]
         }
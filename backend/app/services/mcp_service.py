@@ -1,8 +1,8 @@
 import os
 import re
-import httpx
 import json
-from typing import List, Dict, Any
+import hashlib
+from typing import List, Dict, Any, Optional
 import pandas as pd
 import pypdf
 from io import BytesIO, StringIO
@@ -26,13 +26,32 @@ from pptx import Presentation
 from openpyxl import Workbook
 
 
+from app.core.http_client import http_pool
+from app.core.singleflight import SingleFlight
 from app.services.document_parser_service import DocumentParserService
 from app.services.vector_store_service import vector_store
 from app.services.reasoning_agent_service import ReasoningAgentService
 from app.services.git_service import GitService
+from app.services.tool_memo_service import tool_memo
+from app.services.tool_result_store import EXPAND_TOOL_RESULT, tool_result_store
+
+def is_error_result(result: Any) -> bool:
+    """True for the error strings tools return instead of raising"""
+    if not isinstance(result, str):
+        return False
+    head = result.lstrip()[:200]
+    return head.startswith(("Error", "Action Failure", "❌")) or "Error:" in head.split("\n", 1)[0]
+
 
 class MCPService:
 
+    # Tools that change state outside the conversation (files, mail, posts, schedules)
+    SIDE_EFFECT_TOOLS = {
+        "clone_repository", "open_in_editor", "index_agent_files", "take_screenshot",
+        "write_file", "draft_email", "confirm_send_email", "schedule_task", "cancel_task",
+        "create_pdf", "create_docx", "create_ppt", "create_excel", "post_to_linkedin",
+    }
+
     def __init__(self):
         # ... existing ...
         self.tools = [
@@ -329,24 +348,79 @@ class MCPService:
                     },
                     "required": ["text"]
                 }
-            }
-        ]
-
-    def get_tool_definitions(self) -> List[Dict[str, Any]]:
-        return [
+            },
             {
-                "function_declarations": [
-                    {
-                        "name": tool["name"],
-                        "description": tool["description"],
-                        "parameters": tool["parameters"]
-                    } for tool in self.tools
-                ]
+                "name": EXPAND_TOOL_RESULT,
+                "description": "Reads the full text of an earlier tool result that was shortened to a preview with a handle (ref_...).",
+                "parameters": {
+                    "type": "object",
+                    "properties": {
+                        "handle": {"type": "string", "description": "The handle shown in the shortened result."},
+                        "offset": {"type": "integer", "description": "Character offset to start reading from (default 0)."},
+                        "length": {"type": "integer", "description": "Number of characters to read (default and maximum 4000)."}
+                    },
+                    "required": ["handle"]
+                }
             }
         ]
+        self._tool_definitions = None
+        self._tool_schema_version = None
+        self._search_flights = SingleFlight("search")
 
-    async def execute_tool(self, name: str, arguments: Dict[str, Any]) -> str:
-        """Executes the requested tool and returns the result."""
+    def get_tool_definitions(self) -> List[Dict[str, Any]]:
+        """
+        Tool declarations grouped for the LLM. Built once and shared: the
+        same objects on every call let LLMService reuse its compiled schemas,
+        so callers must not mutate them.
+        """
+        if self._tool_definitions is None:
+            self._tool_definitions = [
+                {
+                    "function_declarations": [
+                        {
+                            "name": tool["name"],
+                            "description": tool["description"],
+                            "parameters": tool["parameters"]
+                        } for tool in self.tools
+                    ]
+                }
+            ]
+        return self._tool_definitions
+
+    @property
+    def tool_schema_version(self) -> str:
+        """Short hash of the tool declarations; changes whenever a tool does"""
+        if self._tool_schema_version is None:
+            encoded = json.dumps(self.get_tool_definitions(), sort_keys=True).encode("utf-8")
+            self._tool_schema_version = hashlib.sha256(encoded).hexdigest()[:12]
+        return self._tool_schema_version
+
+    def is_side_effecting(self, name: str) -> bool:
+        return name in self.SIDE_EFFECT_TOOLS
+
+    async def execute_tool(self, name: str, arguments: Dict[str, Any], session_id: Optional[str] = None,
+                           result_scope: Optional[str] = None) -> str:
+        """
+        Executes the requested tool and returns the result. Read-only results
+        are memoized per session (see tool_memo_service); side effects
+        invalidate the memoized reads they affect. `result_scope` is the
+        scope whose stored tool results expand_tool_result may read.
+        """
+        memoized = tool_memo.get(session_id, name, arguments)
+        if memoized is not None:
+            return memoized
+        try:
+            result = await self._dispatch(name, arguments, result_scope)
+        finally:
+            if self.is_side_effecting(name):
+                tool_memo.invalidate(name, arguments)
+        if not is_error_result(result):
+            tool_memo.set(session_id, name, arguments, result)
+        return result
+
+    async def _dispatch(self, name: str, arguments: Dict[str, Any], result_scope: Optional[str] = None) -> str:
+        # Blocking tools (file parsing, SMTP/IMAP, document builders) run in a
+        # worker thread so they neither stall the event loop nor each other
         try:
             if name == "index_agent_files":
                 return await self._index_agent_files()
@@ -365,35 +439,38 @@ class MCPService:
             elif name == "take_screenshot":
                 return await self._take_screenshot(arguments.get("url"), arguments.get("filename"))
             elif name == "write_file":
-                return self._write_file(arguments.get("filename"), arguments.get("content"))
+                return await asyncio.to_thread(self._write_file, arguments.get("filename"), arguments.get("content"))
             elif name == "analyze_data":
-                return self._analyze_data(arguments.get("filename"), arguments.get("query"))
+                return await asyncio.to_thread(self._analyze_data, arguments.get("filename"), arguments.get("query"))
             elif name == "read_pdf" or name == "read_pdf_legacy":
-                return self._read_pdf(arguments.get("filename"))
+                return await asyncio.to_thread(self._read_pdf, arguments.get("filename"))
             elif name == "draft_email":
-                return self._draft_email(arguments.get("recipient"), arguments.get("subject"), arguments.get("body"), arguments.get("attachments"))
+                return await asyncio.to_thread(self._draft_email, arguments.get("recipient"), arguments.get("subject"), arguments.get("body"), arguments.get("attachments"))
             elif name == "confirm_send_email":
-                return self._confirm_send_email(arguments.get("confirmed"))
+                return await asyncio.to_thread(self._confirm_send_email, arguments.get("confirmed"))
             elif name == "schedule_task":
-                return self._schedule_task(arguments.get("task_description"), arguments.get("interval_seconds"))
+                return await asyncio.to_thread(self._schedule_task, arguments.get("task_description"), arguments.get("interval_seconds"))
             elif name == "read_email":
-                return self._read_email(arguments.get("limit", 5))
+                return await asyncio.to_thread(self._read_email, arguments.get("limit", 5))
             elif name == "list_scheduled_tasks":
-                return self._list_scheduled_tasks()
+                return await asyncio.to_thread(self._list_scheduled_tasks)
             elif name == "cancel_task":
-                return self._cancel_task(arguments.get("job_id"))
+                return await asyncio.to_thread(self._cancel_task, arguments.get("job_id"))
             elif name == "create_pdf":
-                return self._create_pdf(arguments.get("filename"), arguments.get("content"))
+                return await asyncio.to_thread(self._create_pdf, arguments.get("filename"), arguments.get("content"))
             elif name == "create_docx":
-                return self._create_docx(arguments.get("filename"), arguments.get("content"))
+                return await asyncio.to_thread(self._create_docx, arguments.get("filename"), arguments.get("content"))
             elif name == "create_ppt":
-                return self._create_ppt(arguments.get("filename"), arguments.get("title"), arguments.get("slides"))
+                return await asyncio.to_thread(self._create_ppt, arguments.get("filename"), arguments.get("title"), arguments.get("slides"))
             elif name == "create_excel":
-                return self._create_excel(arguments.get("filename"), arguments.get("data"))
+                return await asyncio.to_thread(self._create_excel, arguments.get("filename"), arguments.get("data"))
             elif name == "generate_linkedin_post":
                 return await self._generate_linkedin_post(arguments.get("topic"))
             elif name == "post_to_linkedin":
                 return await self._post_to_linkedin(arguments.get("text"), arguments.get("image_filenames", []), arguments.get("video_filenames", []))
+            elif name == EXPAND_TOOL_RESULT:
+                return self._expand_tool_result(arguments.get("handle"), result_scope, arguments.get("offset") or 0,
+                                                arguments.get("length"))
             else:
                 return f"Error: Tool '{name}' not found."
         except Exception as e:
@@ -403,6 +480,14 @@ class MCPService:
 
 
 
+    def _expand_tool_result(self, handle: str, scope: Optional[str], offset: int, length: Optional[int]) -> str:
+        text = tool_result_store.read(handle, scope, int(offset), int(length) if length else None)
+        if text is None:
+            return f"Error: No stored result for handle '{handle}' (it may have expired). Re-run the original tool instead."
+        if not text:
+            return "No more content: the offset is past the end of the result."
+        return text
+
     def _get_agent_files_path(self):
         return os.path.join(os.getcwd(), "agent_files")
 
@@ -419,16 +504,16 @@ class MCPService:
             path = os.path.join(folder, filename)
             if os.path.isfile(path):
                 # Auto-parse
-                chunks = DocumentParserService.parse_any(path)
+                chunks = await asyncio.to_thread(DocumentParserService.parse_any, path)
                 if chunks:
-                    vector_store.add_documents(chunks, {"filename": filename, "path": path})
+                    await asyncio.to_thread(vector_store.add_documents, chunks, {"filename": filename, "path": path})
                     indexed_count += 1
         
         return f"✅ Successfully scanned and indexed {indexed_count} documents in the vector store."
 
     async def _ask_document(self, question: str) -> str:
         """Performs semantic search across indexed documents and returns context."""
-        results = vector_store.search(question, k=5)
+        results = await asyncio.to_thread(vector_store.search, question, k=5)
         if not results:
             return "No relevant information found in your documents. Have you indexed them using 'index_agent_files'?"
         
@@ -445,7 +530,7 @@ class MCPService:
             return f"Error: Mission document '{filename}' not found."
         
         # Parse the mission document for context
-        chunks = DocumentParserService.parse_any(path)
+        chunks = await asyncio.to_thread(DocumentParserService.parse_any, path)
         if not chunks:
             return f"Error: Could not extract instructions from '{filename}'."
         
@@ -460,7 +545,7 @@ class MCPService:
     async def _clone_repository(self, repo_url: str, folder_name: str) -> str:
         """Clones a repo into agent_files."""
         target_path = os.path.join(self._get_agent_files_path(), folder_name)
-        success = GitService.clone_repo(repo_url, target_path)
+        success = await asyncio.to_thread(GitService.clone_repo, repo_url, target_path)
         if success:
             return f"✅ Repository cloned successfully to agent_files/{folder_name}."
         return f"❌ Failed to clone repository. check URL or if folder already exists."
@@ -668,31 +753,35 @@ Would you like me to send this email? You can:
 
     async def _real_search(self, query: str) -> str:
         """Attempts to perform a real search via Tavily or Serper."""
+        # Concurrent identical searches (agent, scheduler, bots) share one upstream call
+        return await self._search_flights.do(" ".join(query.split()).lower(), lambda: self._search_upstream(query))
+
+    async def _search_upstream(self, query: str) -> str:
         # TAVILY IS PRIORITIZED FOR RICH RESULTS
         if self.tavily_api_key:
             try:
-                async with httpx.AsyncClient() as client:
-                    response = await client.post(
-                        "https://api.tavily.com/search",
-                        json={"api_key": self.tavily_api_key.strip(), "query": query, "search_depth": "basic"},
-                        timeout=10.0
-                    )
-                    if response.status_code == 200:
-                        results = response.json()
-                        snippets = [r.get("content", "") for r in results.get("results", [])[:3]]
-                        return f"Search Results (via Tavily):\n" + "\n".join(snippets)
+                client = http_pool.client_for("https://api.tavily.com")
+                response = await client.post(
+                    "https://api.tavily.com/search",
+                    json={"api_key": self.tavily_api_key.strip(), "query": query, "search_depth": "basic"},
+                    timeout=10.0
+                )
+                if response.status_code == 200:
+                    results = response.json()
+                    snippets = [r.get("content", "") for r in results.get("results", [])[:3]]
+                    return f"Search Results (via Tavily):\n" + "\n".join(snippets)
             except Exception as e:
                 print(f"Tavily Error: {e}")
 
         if self.serper_api_key:
             try:
-                async with httpx.AsyncClient() as client:
-                    headers = {"X-API-KEY": self.serper_api_key, "Content-Type": "application/json"}
-                    response = await client.post("https://google.serper.dev/search", json={"q": query}, headers=headers)
-                    if response.status_code == 200:
-                        results = response.json()
-                        snippets = [res.get("snippet", "") for res in results.get("organic", [])[:3]]
-                        return "Search Results (via Serper):\n" + "\n".join(snippets)
+                client = http_pool.client_for("https://google.serper.dev")
+                headers = {"X-API-KEY": self.serper_api_key, "Content-Type": "application/json"}
+                response = await client.post("https://google.serper.dev/search", json={"q": query}, headers=headers)
+                if response.status_code == 200:
+                    results = response.json()
+                    snippets = [res.get("snippet", "") for res in results.get("organic", [])[:3]]
+                    return "Search Results (via Serper):\n" + "\n".join(snippets)
             except Exception as e:
                 print(f"Serper Error: {e}")
 
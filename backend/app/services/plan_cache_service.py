@@ -0,0 +1,294 @@
+"""
+Plan Cache
+Reuses plans for requests that repeat verbatim or nearly so, and lets
+validated plans be promoted to named templates.
+
+Requests are normalized into a structure (lowercased words with URLs,
+emails, numbers and quoted strings replaced by placeholders) plus the
+ordered slot values that were replaced. Lookups, in order:
+
+1. Templates: same slot types and a similar structure. The template's
+   steps are re-filled with the new request's slot values, so "summarize
+   https://a.com" can reuse a template made from "summarize https://b.com".
+2. Exact: same structure and slot values.
+3. Similar: same slot values and token Jaccard similarity of the
+   structures >= PLAN_CACHE_SIMILARITY.
+
+Entries are scoped to the user and a fingerprint of the recent history,
+so one conversation never replays another's plan. Turns that only make
+sense in context ("yes, send it", "do the same for the other file") are
+never cached or served. Templates belong to the user who promoted them.
+
+Entries are also keyed by the MCP tool-set version, so changing the tools
+invalidates cached plans; templates built for another tool set are kept
+but marked stale and not served. Templates persist to PLAN_TEMPLATES_PATH.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.core.cache import TTLCache
+from app.core.config import settings
+from app.core.metrics import metrics
+from app.services.mcp_service import mcp_service
+
+logger = logging.getLogger(__name__)
+
+_SLOT_PATTERNS = [
+    ("url", re.compile(r"https?://\S+")),
+    ("email", re.compile(r"[\w.+-]+@[\w-]+\.[\w.]+")),
+    ("quoted", re.compile(r"\"[^\"]+\"")),
+    ("num", re.compile(r"\b\d+(?:\.\d+)?\b")),
+]
+_WORD = re.compile(r"<\w+>|[a-z0-9']+")
+
+# Words that point back into the conversation
+CONTEXT_WORDS = {
+    "it", "that", "those", "them", "same", "again", "above", "previous", "earlier",
+    "other", "instead", "yes", "yeah", "ok", "okay", "sure",
+}
+MIN_CACHEABLE_WORDS = 3
+
+
+def normalize(request: str) -> Tuple[str, List[Tuple[str, str]]]:
+    """(structure, [(slot type, value), ...]) for a request"""
+    text = request.strip()
+    found = []
+    for slot_type, pattern in _SLOT_PATTERNS:
+        for match in pattern.finditer(text):
+            found.append((match.start(), slot_type, match.group(0)))
+        text = pattern.sub(lambda m: " " * len(m.group(0)), text)
+
+    # Rebuild with placeholders in positional order
+    structure, cursor = [], 0
+    original = request.strip()
+    for start, slot_type, value in sorted(found):
+        structure.append(original[cursor:start])
+        structure.append(f" <{slot_type}> ")
+        cursor = start + len(value)
+    structure.append(original[cursor:])
+
+    words = _WORD.findall("".join(structure).lower())
+    return " ".join(words), [(slot_type, value) for _, slot_type, value in sorted(found)]
+
+
+def context_dependent(request: str) -> bool:
+    """True for short or anaphoric turns whose meaning depends on the conversation"""
+    words = _WORD.findall(request.lower())
+    return len(words) < MIN_CACHEABLE_WORDS or any(word in CONTEXT_WORDS for word in words)
+
+
+def history_fingerprint(history: Optional[List[Dict[str, Any]]]) -> str:
+    """Short hash of the text of the last PLAN_CACHE_HISTORY_TURNS entries ("" without history)"""
+    if not history:
+        return ""
+    texts = [
+        part["text"]
+        for entry in history[-settings.PLAN_CACHE_HISTORY_TURNS:]
+        for part in entry.get("parts", [])
+        if part.get("text")
+    ]
+    return hashlib.sha256(json.dumps(texts).encode("utf-8")).hexdigest()[:12]
+
+
+def _similarity(a: str, b: str) -> float:
+    set_a, set_b = set(a.split()), set(b.split())
+    if not set_a or not set_b:
+        return 0.0
+    return len(set_a & set_b) / len(set_a | set_b)
+
+
+def _fill(steps: List[str], old_slots: List[Tuple[str, str]], new_slots: List[Tuple[str, str]]) -> List[str]:
+    filled = []
+    for step in steps:
+        for (_, old), (_, new) in zip(old_slots, new_slots):
+            step = step.replace(old, new)
+        filled.append(step)
+    return filled
+
+
+class PlanCache:
+    def __init__(self, templates_path: Optional[str] = None):
+        self.entries = TTLCache(maxsize=settings.PLAN_CACHE_SIZE, ttl=settings.PLAN_CACHE_TTL_SECONDS)
+        self.templates_path = templates_path or settings.PLAN_TEMPLATES_PATH
+        self._templates: Optional[Dict[str, Dict[str, Any]]] = None
+        self._lock = threading.Lock()
+
+    @property
+    def version(self) -> str:
+        return mcp_service.tool_schema_version
+
+    def _scope(self, user_id: Optional[str], history: Optional[List[Dict[str, Any]]]) -> Tuple[str, str]:
+        return (user_id or "", history_fingerprint(history))
+
+    def get(self, request: str, user_id: Optional[str] = None,
+            history: Optional[List[Dict[str, Any]]] = None) -> Optional[Dict[str, Any]]:
+        """{"intent", "plan", "source"} for a known request, else None"""
+        if not settings.PLAN_CACHE_ENABLED:
+            return None
+        if context_dependent(request):
+            metrics.incr("plan_cache.skipped_contextual")
+            return None
+        structure, slots = normalize(request)
+        version = self.version
+        scope = self._scope(user_id, history)
+
+        template = self._match_template(structure, slots, version, user_id)
+        if template is not None:
+            metrics.incr("plan_cache.hits.template")
+            plan = {**template["plan"], "steps": _fill(template["plan"]["steps"], template["slots"], slots)}
+            return {"intent": template["intent"], "plan": plan, "source": f"template:{template['name']}"}
+
+        entry = self.entries.get((version, scope, structure, tuple(slots)))
+        if entry is not None:
+            metrics.incr("plan_cache.hits.exact")
+            return {"intent": entry["intent"], "plan": entry["plan"], "source": "exact"}
+
+        best, best_score = None, settings.PLAN_CACHE_SIMILARITY
+        for (entry_version, entry_scope, entry_structure, entry_slots), candidate in self.entries.items():
+            if entry_version != version or entry_scope != scope or list(entry_slots) != slots:
+                continue
+            score = _similarity(structure, entry_structure)
+            if score >= best_score:
+                best, best_score = candidate, score
+        if best is not None:
+            metrics.incr("plan_cache.hits.similar")
+            return {"intent": best["intent"], "plan": best["plan"], "source": "similar"}
+
+        metrics.incr("plan_cache.misses")
+        return None
+
+    def set(self, request: str, plan: Dict[str, Any], intent: str = "TASK", user_id: Optional[str] = None,
+            history: Optional[List[Dict[str, Any]]] = None):
+        if not settings.PLAN_CACHE_ENABLED or not plan.get("steps") or context_dependent(request):
+            return
+        structure, slots = normalize(request)
+        self.entries.set((self.version, self._scope(user_id, history), structure, tuple(slots)), {
+            "intent": intent,
+            "plan": plan,
+            "structure": structure,
+            "slots": slots,
+            "validated": False,
+        })
+
+    def mark_validated(self, request: str, user_id: Optional[str] = None,
+                       history: Optional[List[Dict[str, Any]]] = None):
+        """The plan for `request` was executed to a final answer without tool errors"""
+        structure, slots = normalize(request)
+        entry = self.entries.get((self.version, self._scope(user_id, history), structure, tuple(slots)))
+        if entry is not None:
+            entry["validated"] = True
+
+    # ------------------------------------------------------------------
+    # Templates
+    # ------------------------------------------------------------------
+
+    def _load_templates(self) -> Dict[str, Dict[str, Any]]:
+        if self._templates is None:
+            with self._lock:
+                if self._templates is None:
+                    try:
+                        with open(self.templates_path, "r", encoding="utf-8") as f:
+                            templates = json.load(f)
+                        for template in templates.values():
+                            template["slots"] = [tuple(slot) for slot in template["slots"]]
+                            template.setdefault("owner", None)
+                        self._templates = templates
+                    except FileNotFoundError:
+                        self._templates = {}
+                    except Exception as e:
+                        logger.warning(f"Ignoring unreadable plan templates: {e}")
+                        self._templates = {}
+        return self._templates
+
+    def _save_templates(self):
+        # Callers hold self._lock
+        os.makedirs(os.path.dirname(self.templates_path) or ".", exist_ok=True)
+        tmp_path = f"{self.templates_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self._templates, f, indent=2)
+        os.replace(tmp_path, self.templates_path)
+
+    @staticmethod
+    def _template_key(user_id: Optional[str], name: str) -> str:
+        return f"{user_id or ''}/{name}"
+
+    def _match_template(self, structure: str, slots: List[Tuple[str, str]], version: str,
+                        user_id: Optional[str]) -> Optional[Dict[str, Any]]:
+        slot_types = [slot_type for slot_type, _ in slots]
+        best, best_score = None, settings.PLAN_CACHE_SIMILARITY
+        for template in self._load_templates().values():
+            if template["owner"] != user_id or template["tool_version"] != version:
+                continue
+            if [t for t, _ in template["slots"]] != slot_types:
+                continue
+            score = _similarity(structure, template["structure"])
+            if score >= best_score:
+                best, best_score = template, score
+        return best
+
+    def promote(self, request: str, name: str, user_id: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Turns the user's validated cached plan for `request` (from any of
+        their conversations) into a named template. Raises KeyError if no
+        plan is cached and ValueError if none has been validated yet.
+        """
+        structure, slots = normalize(request)
+        version, owner = self.version, user_id or ""
+        candidates = [
+            entry for (entry_version, (entry_owner, _), entry_structure, entry_slots), entry in self.entries.items()
+            if entry_version == version and entry_owner == owner
+            and entry_structure == structure and list(entry_slots) == slots
+        ]
+        if not candidates:
+            raise KeyError("No cached plan for this request")
+        entry = next((c for c in candidates if c["validated"]), None)
+        if entry is None:
+            raise ValueError("The cached plan has not completed successfully yet")
+
+        template = {
+            "name": name,
+            "intent": entry["intent"],
+            "plan": entry["plan"],
+            "structure": structure,
+            "slots": slots,
+            "tool_version": version,
+            "owner": user_id,
+            "created_at": time.time(),
+        }
+        self._load_templates()
+        with self._lock:
+            self._templates[self._template_key(user_id, name)] = template
+            self._save_templates()
+        metrics.incr("plan_cache.templates_promoted")
+        return self._describe(template)
+
+    def delete_template(self, name: str, user_id: Optional[str] = None) -> bool:
+        self._load_templates()
+        with self._lock:
+            if self._templates.pop(self._template_key(user_id, name), None) is None:
+                return False
+            self._save_templates()
+        return True
+
+    def list_templates(self, user_id: Optional[str] = None) -> List[Dict[str, Any]]:
+        return [self._describe(t) for t in self._load_templates().values() if t["owner"] == user_id]
+
+    def _describe(self, template: Dict[str, Any]) -> Dict[str, Any]:
+        return {
+            "name": template["name"],
+            "intent": template["intent"],
+            "structure": template["structure"],
+            "steps": template["plan"].get("steps", []),
+            "stale": template["tool_version"] != self.version,
+            "created_at": template["created_at"],
+        }
+
+
+plan_cache = PlanCache()
@@ -1,14 +1,17 @@
-import os
-import httpx
 import json
-from typing import List, Dict
-from app.core.config import settings
+from typing import Awaitable, Dict, List, Optional, Union
+from app.core.singleflight import SingleFlight
+from app.core.metrics import metrics
+from app.services.key_pool_service import FALLBACK_ROUTES, key_pools
+from app.services.llm_cache_service import llm_response_cache
+from app.services.plan_cache_service import plan_cache
 
 class PlannerService:
     def __init__(self):
-        self.api_key = os.getenv("GROQ_API_KEY") or settings.GROQ_API_KEY
         self.base_url = "https://api.groq.com/openai/v1/chat/completions"
         self.model_id = "openai/gpt-oss-safeguard-20b"
+        self.routes = [("Groq", self.base_url, self.model_id), *FALLBACK_ROUTES]
+        self._flights = SingleFlight("planner")
         
         self.system_prompt = (
             "You are the Strategic Planner for EDITH. "
@@ -40,44 +43,66 @@ class PlannerService:
             "}"
         )
 
-    async def generate_plan(self, user_input: str) -> Dict:
+    async def generate_plan(self, user_input: str, use_cache: bool = True, user_id: Optional[str] = None,
+                            history: Optional[List[Dict]] = None,
+                            intent: Union[str, Awaitable[str]] = "TASK") -> Dict:
         """
-        Generates a step-by-step plan for a complex task.
+        Generates a step-by-step plan for a complex task. Repeated and
+        near-identical requests are served from plan_cache (templates first),
+        scoped to the user and conversation. New plans are cached under
+        `intent`; a speculative caller that does not know it yet passes an
+        awaitable that resolves once it does. Completions are cached by
+        request, whichever route (see post_chat failover) answered it.
         """
+        if use_cache:
+            cached = plan_cache.get(user_input, user_id, history)
+            if cached is not None:
+                return cached["plan"]
+
         try:
-            async with httpx.AsyncClient() as client:
-                payload = {
-                    "model": self.model_id,
-                    "messages": [
-                        {"role": "system", "content": self.system_prompt},
-                        {"role": "user", "content": f"User Request: \"{user_input}\""}
-                    ],
-                    "temperature": 0.0,
-                }
-                headers = {
-                    "Authorization": f"Bearer {self.api_key}",
-                    "Content-Type": "application/json"
-                }
-                
-                response = await client.post(self.base_url, json=payload, headers=headers)
-                if response.status_code != 200:
-                    raise Exception(f"Planner API Error: {response.text}")
-                
-                data = response.json()
-                content = data["choices"][0]["message"]["content"]
-                
-                # Clean markdown if present
-                if "```json" in content:
-                    content = content.split("```json")[1].split("```")[0].strip()
-                elif "```" in content:
-                    content = content.split("```")[1].split("```")[0].strip()
-                
-                return json.loads(content)
+            payload = {
+                "model": self.model_id,
+                "messages": [
+                    {"role": "system", "content": self.system_prompt},
+                    {"role": "user", "content": f"User Request: \"{user_input}\""}
+                ],
+                "temperature": 0.0,
+            }
+            cache_key = llm_response_cache.make_key("planner", self.model_id, payload["messages"])
+            data = llm_response_cache.get(cache_key) if use_cache else None
+            if data is None:
+                # Concurrent identical requests share one upstream call
+                data = await self._flights.do(cache_key, lambda: self._request(payload))
+            
+            content = data["choices"][0]["message"]["content"]
+            
+            # Clean markdown if present
+            if "```json" in content:
+                content = content.split("```json")[1].split("```")[0].strip()
+            elif "```" in content:
+                content = content.split("```")[1].split("```")[0].strip()
+            
+            result = json.loads(content)
+            # Only cache completions that parsed
+            if use_cache:
+                llm_response_cache.set(cache_key, data)
+                if not isinstance(intent, str):
+                    intent = await intent
+                plan_cache.set(user_input, result, intent, user_id=user_id, history=history)
+            return result
         except Exception as e:
-            print(f"Planning Error: {e}")
+            print(f"Planning Error (falling back to a one-step plan): {e}")
+            metrics.incr("planner.fallbacks")
             return {
                 "reasoning": "Defaulting to direct execution due to planning error.",
                 "steps": [user_input]
             }
 
+    async def _request(self, payload: Dict) -> Dict:
+        """Raw completion for a planning payload (Groq, failing over to other providers)."""
+        response = await key_pools.post_chat(self.routes, payload)
+        if response.status_code != 200:
+            raise Exception(f"Planner API Error: {response.text}")
+        return response.json()
+
 planner_service = PlannerService()
@@ -0,0 +1,221 @@
+"""
+Provider Health Tracking
+Per-LLM-provider latency/error statistics with circuit breakers.
+
+Each provider keeps an EWMA of successful-call latency and of its error
+rate. Consecutive failures (or a 429) open the provider's circuit: it is
+skipped until the open period (or Retry-After) elapses, then a single
+half-open probe decides whether it closes again. LLMService routes each
+request to the fastest provider whose circuit allows traffic.
+"""
+
+import threading
+import time
+from collections import deque
+from email.utils import parsedate_to_datetime
+from typing import Any, Dict, List, Optional
+
+from app.core.config import settings
+from app.core.metrics import metrics
+
+# Client errors caused by the request itself, not by provider health
+REQUEST_ERROR_STATUSES = {400, 404, 413, 422}
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Retry-After as seconds from now (accepts delta-seconds or an HTTP date)"""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class ProviderHealth:
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, name: str):
+        self.name = name
+        self.ewma_latency: Optional[float] = None
+        self.error_rate = 0.0
+        self.consecutive_failures = 0
+        self.state = self.CLOSED
+        self.open_until = 0.0
+        self.probe_in_flight = False
+        self.probe_started = 0.0
+        self.samples = 0
+        self.recent_latencies = deque(maxlen=100)
+
+    def is_available(self, now: float) -> bool:
+        """True if the circuit would let a call through now (no side effects)"""
+        if self.state == self.OPEN:
+            return now >= self.open_until
+        if self.state == self.HALF_OPEN:
+            return not self._probe_busy(now)
+        return True
+
+    def acquire(self, now: float) -> bool:
+        """Like is_available, but claims the single probe slot when half-open"""
+        if self.state == self.OPEN:
+            if now < self.open_until:
+                return False
+            self.state = self.HALF_OPEN
+            self.probe_in_flight = False
+        if self.state == self.HALF_OPEN:
+            if self._probe_busy(now):
+                return False
+            self.probe_in_flight = True
+            self.probe_started = now
+        return True
+
+    def _probe_busy(self, now: float) -> bool:
+        # A probe that never reported back (e.g. cancelled) expires
+        return self.probe_in_flight and now - self.probe_started < settings.LLM_BREAKER_OPEN_SECONDS
+
+    def record_success(self, latency: float):
+        alpha = settings.LLM_HEALTH_EWMA_ALPHA
+        self.ewma_latency = latency if self.ewma_latency is None else alpha * latency + (1 - alpha) * self.ewma_latency
+        self.error_rate = (1 - alpha) * self.error_rate
+        self.consecutive_failures = 0
+        self.samples += 1
+        self.recent_latencies.append(latency)
+        self.state = self.CLOSED
+        self.probe_in_flight = False
+
+    def record_failure(self, now: float, retry_after: Optional[float] = None):
+        alpha = settings.LLM_HEALTH_EWMA_ALPHA
+        self.error_rate = alpha + (1 - alpha) * self.error_rate
+        self.consecutive_failures += 1
+        self.probe_in_flight = False
+
+        if retry_after is not None:
+            # Rate limited: stay away exactly as long as the provider asks
+            self._open(now, retry_after)
+        elif self.state == self.HALF_OPEN or self.consecutive_failures >= settings.LLM_BREAKER_FAILURE_THRESHOLD:
+            self._open(now, settings.LLM_BREAKER_OPEN_SECONDS)
+
+    def release_probe(self):
+        """A request error said nothing about health; free the probe slot"""
+        self.probe_in_flight = False
+
+    def _open(self, now: float, seconds: float):
+        if self.state != self.OPEN:
+            metrics.incr(f"llm.circuit_opened.{self.name}")
+        self.state = self.OPEN
+        self.open_until = max(self.open_until, now + seconds)
+
+    def latency_percentile(self, percentile: float) -> Optional[float]:
+        """Latency at `percentile` over the last 100 successes (None if < 10)"""
+        if len(self.recent_latencies) < 10:
+            return None
+        ordered = sorted(self.recent_latencies)
+        index = min(len(ordered) - 1, int(len(ordered) * percentile / 100))
+        return ordered[index]
+
+    def score(self) -> float:
+        """Lower is better: expected latency inflated by the error rate"""
+        latency = self.ewma_latency if self.ewma_latency is not None else settings.LLM_DEFAULT_LATENCY_SECONDS
+        return latency * (1 + 4 * self.error_rate)
+
+    def to_dict(self) -> Dict[str, Any]:
+        p95 = self.latency_percentile(95)
+        return {
+            "state": self.state,
+            "ewma_latency_s": round(self.ewma_latency, 3) if self.ewma_latency is not None else None,
+            "error_rate": round(self.error_rate, 3),
+            "consecutive_failures": self.consecutive_failures,
+            "open_for_s": round(max(0.0, self.open_until - time.monotonic()), 1) if self.state == self.OPEN else 0,
+            "samples": self.samples,
+            "p95_latency_s": round(p95, 3) if p95 is not None else None,
+        }
+
+
+class ProviderHealthRegistry:
+    def __init__(self):
+        self._providers: Dict[str, ProviderHealth] = {}
+        self._lock = threading.Lock()
+
+    def _get(self, name: str) -> ProviderHealth:
+        # Callers hold self._lock
+        health = self._providers.get(name)
+        if health is None:
+            health = self._providers[name] = ProviderHealth(name)
+        return health
+
+    def order(self, configs: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Drops providers whose circuit is open and sorts the rest by score.
+        Configs are in priority order; the first one gets a preference
+        factor, so it keeps traffic unless another provider is clearly faster.
+        If every circuit is open, the one that reopens soonest is returned
+        alone so the request still gets a single attempt.
+        """
+        now = time.monotonic()
+        with self._lock:
+            ranked = []
+            for position, config in enumerate(configs):
+                health = self._get(config["provider"])
+                if not health.is_available(now):
+                    continue
+                score = health.score()
+                if position == 0:
+                    score /= settings.LLM_PRIMARY_PREFERENCE
+                ranked.append((score, position, config))
+
+            if not ranked and configs:
+                soonest = min(configs, key=lambda c: self._get(c["provider"]).open_until)
+                metrics.incr("llm.all_circuits_open")
+                return [{**soonest, "last_resort": True}]
+
+        return [config for _, _, config in sorted(ranked, key=lambda r: (r[0], r[1]))]
+
+    def acquire(self, config: Dict[str, Any]) -> bool:
+        """Call right before sending; False means skip this provider"""
+        if config.get("last_resort"):
+            return True
+        with self._lock:
+            return self._get(config["provider"]).acquire(time.monotonic())
+
+    def release(self, provider: str):
+        """The call was not sent (or failed for a reason unrelated to health); free any probe slot"""
+        with self._lock:
+            self._get(provider).release_probe()
+
+    def hedge_delay(self, provider: str) -> float:
+        """How long to wait on `provider` before hedging to another one"""
+        with self._lock:
+            health = self._get(provider)
+            delay = health.latency_percentile(settings.LLM_HEDGE_PERCENTILE)
+            if delay is None:
+                delay = health.ewma_latency * 2 if health.ewma_latency is not None else settings.LLM_DEFAULT_LATENCY_SECONDS * 2
+            return max(settings.LLM_HEDGE_MIN_DELAY_SECONDS, delay)
+
+    def record_success(self, provider: str, latency: float):
+        with self._lock:
+            self._get(provider).record_success(latency)
+        metrics.observe(f"llm.latency_s.{provider}", latency)
+
+    def record_failure(self, provider: str, status_code: Optional[int] = None, retry_after: Optional[str] = None):
+        with self._lock:
+            health = self._get(provider)
+            if status_code in REQUEST_ERROR_STATUSES:
+                health.release_probe()
+                return
+            delay = parse_retry_after(retry_after) if status_code == 429 else None
+            if status_code == 429 and delay is None:
+                delay = settings.LLM_BREAKER_OPEN_SECONDS
+            health.record_failure(time.monotonic(), delay)
+        metrics.incr(f"llm.failures.{provider}")
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            return {name: health.to_dict() for name, health in self._providers.items()}
+
+
+provider_health = ProviderHealthRegistry()
+metrics.register_gauge("llm.providers", provider_health.snapshot)
@@ -0,0 +1,61 @@
+"""
+Semantic Search Cache
+Per-user cache of query embeddings and search_document_chunks results
+"""
+
+import logging
+from typing import Any, Dict, List, Optional
+
+from app.core.cache import TTLCache
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class SearchCache:
+    """
+    Two TTL/LRU caches per user:
+    - query text -> embedding (skips the embedding round-trip)
+    - (query, threshold, limit) -> RPC rows (skips both round-trips)
+
+    A user's caches are dropped whenever their documents are (re)processed.
+    """
+
+    def __init__(self, max_users: int, max_entries: int, ttl: float):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._users = TTLCache(maxsize=max_users)
+
+    def _caches(self, user_id: str) -> Dict[str, TTLCache]:
+        caches = self._users.get(user_id)
+        if caches is None:
+            caches = {
+                "embeddings": TTLCache(maxsize=self.max_entries, ttl=self.ttl),
+                "results": TTLCache(maxsize=self.max_entries, ttl=self.ttl),
+            }
+            self._users.set(user_id, caches)
+        return caches
+
+    def get_embedding(self, user_id: str, query: str) -> Optional[List[float]]:
+        return self._caches(user_id)["embeddings"].get(query)
+
+    def set_embedding(self, user_id: str, query: str, embedding: List[float]):
+        self._caches(user_id)["embeddings"].set(query, embedding)
+
+    def get_results(self, user_id: str, query: str, threshold: float, limit: int) -> Optional[List[Dict[str, Any]]]:
+        return self._caches(user_id)["results"].get((query, threshold, limit))
+
+    def set_results(self, user_id: str, query: str, threshold: float, limit: int, rows: List[Dict[str, Any]]):
+        self._caches(user_id)["results"].set((query, threshold, limit), rows)
+
+    def invalidate_user(self, user_id: str):
+        """Forget everything cached for a user (their chunks changed)"""
+        if self._users.pop(user_id) is not None:
+            logger.info(f"Search cache invalidated for user {user_id}")
+
+
+search_cache = SearchCache(
+    max_users=settings.SEARCH_CACHE_MAX_USERS,
+    max_entries=settings.SEARCH_CACHE_MAX_ENTRIES,
+    ttl=settings.SEARCH_CACHE_TTL_SECONDS
+)
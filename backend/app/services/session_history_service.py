@@ -0,0 +1,131 @@
+"""
+Session History
+Server-side conversation state for the chat endpoints.
+
+With a session_id and no client-sent history, the chat endpoints load the
+conversation from chat_messages (text, sender 'user' | 'ai') and append the
+new exchange afterwards, so clients only send the new message.
+
+Server-side history needs an authenticated caller, and state is keyed by
+(user id, session id): a chat_sessions row must belong to the caller, and
+session ids without a row get in-memory history private to that user.
+Anonymous callers keep sending their own history.
+
+Hot sessions are kept in a write-through LRU (SESSION_HISTORY_CACHE_SIZE):
+appends update the cache and then Supabase, and later turns are served
+from memory. Only the last SESSION_HISTORY_MAX_MESSAGES messages are kept
+and sent to the agent.
+"""
+
+import asyncio
+import logging
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from app.core.cache import TTLCache
+from app.core.config import settings
+from app.core.metrics import metrics
+from app.db.supabase_client import supabase_client
+
+logger = logging.getLogger(__name__)
+
+
+class SessionNotFound(Exception):
+    """The session exists but belongs to another user"""
+
+
+def session_scope(user_id: Optional[str], session_id: Optional[str]) -> Optional[str]:
+    """Per-user id for session-scoped state (e.g. the tool memo); None for anonymous callers"""
+    if not user_id or not session_id:
+        return None
+    return f"{user_id}/{session_id}"
+
+
+def _to_entry(text: str, sender: str) -> Dict[str, Any]:
+    return {"role": "user" if sender == "user" else "model", "parts": [{"text": text or ""}]}
+
+
+class SessionHistoryStore:
+    def __init__(self):
+        # (user_id, session_id) -> {"persisted", "history"}
+        self.sessions = TTLCache(maxsize=settings.SESSION_HISTORY_CACHE_SIZE, ttl=settings.SESSION_HISTORY_CACHE_TTL_SECONDS)
+
+    async def load(self, session_id: str, user_id: str) -> List[Dict[str, Any]]:
+        """
+        The session's recent history in parts format. Raises SessionNotFound
+        if the session is owned by someone other than `user_id`.
+        """
+        state = self.sessions.get((user_id, session_id))
+        if state is None:
+            metrics.incr("session_history.misses")
+            state = await self._fetch(session_id, user_id)
+            self.sessions.set((user_id, session_id), state)
+        else:
+            metrics.incr("session_history.hits")
+        return list(state["history"])
+
+    async def append(self, session_id: str, user_id: str, user_text: str, ai_text: str):
+        """Adds one exchange to the cache, then writes it through to Supabase"""
+        state = self.sessions.get((user_id, session_id))
+        if state is None:
+            state = await self._fetch(session_id, user_id)
+        history = state["history"] + [_to_entry(user_text, "user"), _to_entry(ai_text, "ai")]
+        state = {**state, "history": history[-settings.SESSION_HISTORY_MAX_MESSAGES:]}
+        self.sessions.set((user_id, session_id), state)
+
+        if state["persisted"]:
+            try:
+                await self._persist(session_id, [(user_text, "user"), (ai_text, "ai")])
+            except Exception as e:
+                logger.error(f"Error persisting messages for session {session_id}: {e}")
+
+    def forget(self, session_id: str):
+        self.sessions.invalidate(lambda key: key[1] == session_id)
+
+    async def _fetch(self, session_id: str, user_id: str) -> Dict[str, Any]:
+        try:
+            client = supabase_client.client
+            session = await asyncio.to_thread(
+                client.table("chat_sessions").select("id, user_id").eq("id", session_id).execute
+            )
+            if not session.data:
+                return {"persisted": False, "history": []}
+            if session.data[0].get("user_id") != user_id:
+                raise SessionNotFound(session_id)
+            messages = await asyncio.to_thread(
+                client.table("chat_messages").select("text, sender, created_at")
+                .eq("session_id", session_id)
+                .order("created_at", desc=True)
+                .limit(settings.SESSION_HISTORY_MAX_MESSAGES)
+                .execute
+            )
+        except SessionNotFound:
+            raise
+        except Exception as e:
+            # Not configured, or not a chat_sessions id: memory only
+            logger.debug(f"Session {session_id} not loaded from Supabase: {e}")
+            return {"persisted": False, "history": []}
+
+        # Rows written in one request can share a timestamp; the user turn goes first
+        rows = sorted(messages.data or [], key=lambda row: (row.get("created_at") or "", row.get("sender") != "user"))
+        return {
+            "persisted": True,
+            "history": [_to_entry(row.get("text"), row.get("sender")) for row in rows],
+        }
+
+    async def _persist(self, session_id: str, messages: List[tuple]):
+        client = supabase_client.client
+        # One insert per row, in order, so the created_at defaults follow the turn order
+        for text, sender in messages:
+            await asyncio.to_thread(
+                client.table("chat_messages").insert({"session_id": session_id, "text": text, "sender": sender}).execute
+            )
+            await asyncio.to_thread(
+                client.rpc("increment_message_count", {"session_id": session_id}).execute
+            )
+        await asyncio.to_thread(
+            client.table("chat_sessions").update({"updated_at": datetime.utcnow().isoformat()}).eq("id", session_id).execute
+        )
+
+
+session_history = SessionHistoryStore()
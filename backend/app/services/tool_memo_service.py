@@ -0,0 +1,109 @@
+"""
+Tool Memo
+Session-scoped memoization of read-only tool results.
+
+Within one chat session, a tool called again with the same canonical
+arguments (JSON with sorted keys, None values dropped) returns the stored
+result instead of paying the network/CPU cost again. Each tool has its own
+TTL (TOOL_MEMO_TTLS); tools without one are never memoized.
+
+Results also record the resources they were read from ("file:<name>",
+"index"). Side-effecting tools that change a resource invalidate every
+memoized read of it, across sessions, since agent_files is shared:
+write_file invalidates analyze_data / read_pdf of that file, and
+index_agent_files invalidates ask_document answers.
+
+MCPService does not memoize error results.
+"""
+
+import json
+import os
+from typing import Any, Dict, FrozenSet, Optional
+
+from app.core.cache import TTLCache
+from app.core.config import settings
+from app.core.metrics import metrics
+
+# Seconds a result stays valid, per tool
+TOOL_MEMO_TTLS = {
+    "google_search": 600,
+    "browse_url": 900,
+    "ask_document": 1800,
+    "reason_over_mission": 1800,
+    "analyze_data": 1800,
+    "read_pdf": 3600,
+    "read_pdf_legacy": 3600,
+}
+
+ANY_FILE = "file:*"
+
+
+def _file(arguments: Dict[str, Any]) -> str:
+    return f"file:{os.path.normpath(str(arguments.get('filename') or ''))}"
+
+
+def reads(name: str, arguments: Dict[str, Any]) -> FrozenSet[str]:
+    """Resources a read-only tool result depends on"""
+    if name in ("analyze_data", "read_pdf", "read_pdf_legacy", "reason_over_mission"):
+        return frozenset({_file(arguments)})
+    if name == "ask_document":
+        return frozenset({"index"})
+    return frozenset()
+
+
+def writes(name: str, arguments: Dict[str, Any]) -> FrozenSet[str]:
+    """Resources a side-effecting tool changes"""
+    if name in ("write_file", "take_screenshot", "create_pdf", "create_docx", "create_ppt", "create_excel"):
+        return frozenset({_file(arguments)})
+    if name == "index_agent_files":
+        return frozenset({"index"})
+    if name == "clone_repository":
+        return frozenset({ANY_FILE})
+    return frozenset()
+
+
+def canonical_args(arguments: Dict[str, Any]) -> str:
+    return json.dumps({k: v for k, v in arguments.items() if v is not None}, sort_keys=True, default=str)
+
+
+class ToolMemo:
+    def __init__(self):
+        # (session_id, tool, resources, canonical args) -> result
+        self.entries = TTLCache(maxsize=settings.TOOL_MEMO_SIZE)
+
+    def _key(self, session_id: str, name: str, arguments: Dict[str, Any]) -> tuple:
+        return (session_id, name, reads(name, arguments), canonical_args(arguments))
+
+    def get(self, session_id: Optional[str], name: str, arguments: Dict[str, Any]) -> Optional[Any]:
+        if not settings.TOOL_MEMO_ENABLED or not session_id or name not in TOOL_MEMO_TTLS:
+            return None
+        result = self.entries.get(self._key(session_id, name, arguments))
+        metrics.incr("tools.memo_hits" if result is not None else "tools.memo_misses")
+        return result
+
+    def set(self, session_id: Optional[str], name: str, arguments: Dict[str, Any], result: Any):
+        if not settings.TOOL_MEMO_ENABLED or not session_id or name not in TOOL_MEMO_TTLS:
+            return
+        self.entries.set(self._key(session_id, name, arguments), result, ttl=TOOL_MEMO_TTLS[name])
+
+    def invalidate(self, name: str, arguments: Dict[str, Any]) -> int:
+        """Drops memoized reads of whatever `name` changed; returns how many"""
+        changed = writes(name, arguments)
+        if not changed:
+            return 0
+        any_file = ANY_FILE in changed
+
+        def stale(key: tuple) -> bool:
+            resources = key[2]
+            return bool(resources & changed) or (any_file and any(r.startswith("file:") for r in resources))
+
+        removed = self.entries.invalidate(stale)
+        if removed:
+            metrics.incr("tools.memo_invalidations", removed)
+        return removed
+
+    def clear_session(self, session_id: str) -> int:
+        return self.entries.invalidate(lambda key: key[0] == session_id)
+
+
+tool_memo = ToolMemo()
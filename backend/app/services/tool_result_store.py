@@ -0,0 +1,45 @@
+"""
+Tool Result Store
+Side store for large tool outputs, so they are sent to the LLM in full only
+once.
+
+After the model has seen a tool result, ContextBuilder replaces it in
+later prompts with a short preview and a handle. The model can read the
+full text (or a slice of it) on demand with the `expand_tool_result` tool.
+Handles are content hashes, so the same result always gets the same handle
+and the rewritten history stays byte-stable across iterations, which keeps
+it cacheable by providers. Entries belong to the scope that stored them (a
+user's session, or a single agent run); a handle only reads back within
+that scope, so guessing one never exposes another user's tool output.
+"""
+
+import hashlib
+from typing import Optional
+
+from app.core.cache import TTLCache
+from app.core.config import settings
+
+EXPAND_TOOL_RESULT = "expand_tool_result"
+
+
+class ToolResultStore:
+    def __init__(self):
+        self.results = TTLCache(maxsize=settings.TOOL_RESULT_STORE_SIZE, ttl=settings.TOOL_RESULT_STORE_TTL_SECONDS)
+
+    def put(self, text: str, scope: Optional[str] = None) -> str:
+        """Stores `text` for `scope` and returns its handle"""
+        handle = "ref_" + hashlib.sha256(text.encode("utf-8")).hexdigest()[:12]
+        self.results.set((scope, handle), text)
+        return handle
+
+    def read(self, handle: str, scope: Optional[str] = None, offset: int = 0,
+             length: Optional[int] = None) -> Optional[str]:
+        """A slice of a result stored for `scope`, or None if the handle is unknown, expired or another scope's"""
+        text = self.results.get((scope, handle))
+        if text is None:
+            return None
+        length = min(length or settings.TOOL_RESULT_EXPAND_MAX_CHARS, settings.TOOL_RESULT_EXPAND_MAX_CHARS)
+        return text[max(0, offset):max(0, offset) + length]
+
+
+tool_result_store = ToolResultStore()
@@ -0,0 +1,221 @@
+"""
+Tool Router
+Chooses which of MCPService's tools are sent to the LLM for a request.
+
+Sending every schema on every iteration costs thousands of input tokens.
+The router offers a small always-on core, the tools named in the request
+or matching its keywords, and companion tools (e.g. draft/confirm email).
+Only when keywords find nothing for a task does it embed the request (plus
+plan steps) and rank tools by similarity to their descriptions. Those are
+embedded once at startup (warm_up); until they are ready, or if the
+embedding backend is unavailable or slow, keyword matching alone decides.
+
+The subset grows on demand: the model can call `request_tools` (whose
+description lists every tool name) and AgentService also accepts calls to
+known tools that were not offered.
+"""
+
+import asyncio
+import json
+import logging
+import math
+import re
+from typing import Any, Dict, Iterable, List, Optional, Set
+
+from app.core.cache import TTLCache
+from app.core.config import settings
+from app.core.metrics import metrics
+from app.services.context_builder import count_tokens
+from app.services.embedding_service import embedding_service
+from app.services.mcp_service import mcp_service
+from app.services.tool_result_store import EXPAND_TOOL_RESULT
+
+logger = logging.getLogger(__name__)
+
+REQUEST_TOOLS = "request_tools"
+
+# Always offered: cheap, the usual first step for open-ended requests, and the
+# way back to tool results ContextBuilder replaced by references
+CORE_TOOLS = {"google_search", EXPAND_TOOL_RESULT}
+
+# Tools that are only useful together
+TOOL_GROUPS = [
+    {"draft_email", "confirm_send_email"},
+    {"schedule_task", "list_scheduled_tasks", "cancel_task"},
+    {"generate_linkedin_post", "post_to_linkedin"},
+    {"index_agent_files", "ask_document"},
+    {"clone_repository", "open_in_editor"},
+]
+
+# Words users say that tool descriptions do not
+TOOL_KEYWORDS = {
+    "draft_email": {"email", "mail", "send", "gmail"},
+    "read_email": {"inbox", "emails", "mail", "unread"},
+    "schedule_task": {"remind", "reminder", "every", "daily", "schedule", "later"},
+    "list_scheduled_tasks": {"scheduled", "reminders", "jobs"},
+    "create_excel": {"excel", "spreadsheet", "xlsx", "sheet", "table"},
+    "analyze_data": {"csv", "excel", "spreadsheet", "data", "chart", "statistics"},
+    "create_ppt": {"ppt", "powerpoint", "slides", "presentation", "deck"},
+    "create_docx": {"docx", "word", "document", "report"},
+    "create_pdf": {"pdf", "report"},
+    "generate_linkedin_post": {"linkedin", "post"},
+    "post_to_linkedin": {"linkedin"},
+    "browse_url": {"http", "https", "www", "website", "site", "price", "shop", "buy"},
+    "take_screenshot": {"screenshot", "capture"},
+    "clone_repository": {"github", "repo", "repository", "clone", "git"},
+    "ask_document": {"document", "documents", "file", "files", "uploaded", "pdf", "analyze"},
+    "reason_over_mission": {"mission"},
+    "write_file": {"save", "write", "file"},
+}
+
+_WORD = re.compile(r"[a-z0-9]+")
+
+
+def _words(text: str) -> Set[str]:
+    return set(_WORD.findall(text.lower()))
+
+
+def _cosine(a: List[float], b: List[float]) -> float:
+    dot = sum(x * y for x, y in zip(a, b))
+    norm = math.sqrt(sum(x * x for x in a)) * math.sqrt(sum(y * y for y in b))
+    return dot / norm if norm else 0.0
+
+
+class ToolRouter:
+    def __init__(self):
+        self._tool_embeddings: Optional[Dict[str, List[float]]] = None
+        self._tool_embeddings_task: Optional[asyncio.Task] = None
+        self._query_embeddings = TTLCache(maxsize=256, ttl=settings.SEARCH_CACHE_TTL_SECONDS)
+        self._request_tools_definition: Optional[Dict[str, Any]] = None
+        self._full_schema_tokens: Optional[int] = None
+
+    @property
+    def declarations(self) -> List[Dict[str, Any]]:
+        return mcp_service.get_tool_definitions()[0]["function_declarations"]
+
+    def warm_up(self):
+        """Starts embedding the tool descriptions in the background"""
+        if self._tool_embeddings is None and (self._tool_embeddings_task is None or self._tool_embeddings_task.done()):
+            self._tool_embeddings_task = asyncio.create_task(self._embed_tools())
+            self._tool_embeddings_task.add_done_callback(self._log_warm_up)
+
+    def _log_warm_up(self, task: asyncio.Task):
+        if not task.cancelled() and task.exception() is not None:
+            logger.warning(f"Tool description embedding failed: {task.exception()!r}")
+
+    def is_known(self, name: str) -> bool:
+        return any(decl["name"] == name for decl in self.declarations)
+
+    async def select(self, message: str, intent: str = "TASK", plan_steps: Iterable[str] = ()) -> Set[str]:
+        """Names of the tools to offer for this request"""
+        names = [decl["name"] for decl in self.declarations]
+        if not settings.TOOL_ROUTER_ENABLED:
+            return set(names)
+
+        query = "\n".join([message, *plan_steps])
+        words = _words(query)
+        selected = {name for name in CORE_TOOLS if name in names}
+
+        # Explicit mentions (whole tool names) and keywords
+        matched = {
+            decl["name"] for decl in self.declarations
+            if re.search(rf"\b{re.escape(decl['name'])}\b", query.lower())
+            or TOOL_KEYWORDS.get(decl["name"], set()) & words
+        }
+        selected |= matched
+
+        # Semantic ranking, only for tasks keywords say nothing about
+        if intent != "CHAT":
+            if matched - CORE_TOOLS:
+                metrics.incr("tools.router_keyword_only")
+            else:
+                similarities = await self._similarities(query)
+                if similarities:
+                    ranked = sorted(similarities, key=similarities.get, reverse=True)
+                    selected.update(ranked[:settings.TOOL_ROUTER_TOP_K])
+
+        for group in TOOL_GROUPS:
+            if group & selected:
+                selected |= group & set(names)
+
+        self._report(selected)
+        return selected
+
+    def expand(self, selected: Set[str], requested: Iterable[str]) -> List[str]:
+        """Adds known tools (and their companions) to `selected`; returns what was added"""
+        known = {decl["name"] for decl in self.declarations}
+        added = []
+        for name in requested or []:
+            for extra in [name, *[n for g in TOOL_GROUPS if name in g for n in sorted(g)]]:
+                if extra in known and extra not in selected:
+                    selected.add(extra)
+                    added.append(extra)
+        if added:
+            metrics.incr("tools.router_expansions")
+        return added
+
+    def definitions(self, selected: Set[str]) -> List[Dict[str, Any]]:
+        """
+        function_declarations for `selected`, in MCPService order and as the
+        same objects, so LLMService's compiled prefix is reused per subset.
+        """
+        declarations = [decl for decl in self.declarations if decl["name"] in selected]
+        if settings.TOOL_ROUTER_ENABLED and len(declarations) < len(self.declarations):
+            declarations.append(self._request_tools())
+        return [{"function_declarations": declarations}]
+
+    def _request_tools(self) -> Dict[str, Any]:
+        if self._request_tools_definition is None:
+            names = ", ".join(decl["name"] for decl in self.declarations)
+            self._request_tools_definition = {
+                "name": REQUEST_TOOLS,
+                "description": (
+                    "Loads additional tools for this conversation when none of the offered tools fit. "
+                    f"Available tools: {names}."
+                ),
+                "parameters": {
+                    "type": "object",
+                    "properties": {
+                        "tools": {"type": "array", "items": {"type": "string"}, "description": "Tool names to load."}
+                    },
+                    "required": ["tools"]
+                }
+            }
+        return self._request_tools_definition
+
+    async def _similarities(self, query: str) -> Optional[Dict[str, float]]:
+        """Cosine similarity of each tool description to `query`, or None if embeddings are unavailable"""
+        if self._tool_embeddings is None:
+            # Not ready yet, or the startup batch failed: retry in the background
+            self.warm_up()
+            metrics.incr("tools.router_embedding_fallbacks")
+            return None
+        try:
+            return await asyncio.wait_for(self._embed_similarities(query), settings.TOOL_ROUTER_EMBED_TIMEOUT_SECONDS)
+        except Exception as e:
+            metrics.incr("tools.router_embedding_fallbacks")
+            logger.warning(f"Tool routing without embeddings: {e!r}")
+            return None
+
+    async def _embed_similarities(self, query: str) -> Dict[str, float]:
+        query_vector = self._query_embeddings.get(query)
+        if query_vector is None:
+            query_vector = await embedding_service.generate_query_embedding(query)
+            self._query_embeddings.set(query, query_vector)
+        return {name: _cosine(query_vector, vec) for name, vec in self._tool_embeddings.items()}
+
+    async def _embed_tools(self):
+        texts = [f"{decl['name'].replace('_', ' ')}: {decl['description']}" for decl in self.declarations]
+        vectors = await embedding_service.generate_embeddings_batch(texts)
+        self._tool_embeddings = {decl["name"]: vec for decl, vec in zip(self.declarations, vectors)}
+
+    def _report(self, selected: Set[str]):
+        if self._full_schema_tokens is None:
+            self._full_schema_tokens = count_tokens(json.dumps(self.declarations))
+        routed = self.definitions(selected)[0]["function_declarations"]
+        metrics.observe("tools.schema_tokens_full", self._full_schema_tokens)
+        metrics.observe("tools.schema_tokens_routed", count_tokens(json.dumps(routed)))
+        metrics.observe("tools.offered", len(selected))
+
+
+tool_router = ToolRouter()
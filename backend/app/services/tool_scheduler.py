@@ -0,0 +1,103 @@
+"""
+Tool Scheduler
+Runs the tool calls of one model message concurrently where that is safe.
+
+Calls are split into phases in message order: consecutive read-only calls
+form one concurrent phase, and every side-effecting call
+(MCPService.SIDE_EFFECT_TOOLS) is a phase of its own. So a write is never
+reordered with the reads around it, and side effects run one at a time
+in the order the model asked for them.
+
+Each tool also has a process-wide concurrency limit (TOOL_CONCURRENCY,
+default TOOL_DEFAULT_CONCURRENCY); side-effecting tools are limited to 1.
+Results are reported as they finish; callers put them into the history
+in the original call order. Concurrency is real only because blocking tools
+run in worker threads (MCPService._dispatch); a sync tool on the event
+loop would serialize the phase.
+"""
+
+import asyncio
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Tuple
+
+from app.core.config import settings
+from app.core.metrics import metrics
+from app.services.mcp_service import mcp_service
+
+# Heavier tools get tighter limits (browser instances, LLM-backed analysis)
+TOOL_CONCURRENCY = {
+    "browse_url": 2,
+    "ask_document": 2,
+    "analyze_data": 2,
+    "reason_over_mission": 1,
+    "read_email": 1,
+}
+
+
+class ToolScheduler:
+    def __init__(self):
+        self._semaphores: Dict[Tuple[int, str], asyncio.Semaphore] = {}
+
+    def _semaphore(self, name: str) -> asyncio.Semaphore:
+        # Semaphores bind to the running loop; bots running their own loop get their own
+        key = (id(asyncio.get_running_loop()), name)
+        semaphore = self._semaphores.get(key)
+        if semaphore is None:
+            if mcp_service.is_side_effecting(name):
+                limit = 1
+            else:
+                limit = TOOL_CONCURRENCY.get(name, settings.TOOL_DEFAULT_CONCURRENCY)
+            semaphore = self._semaphores[key] = asyncio.Semaphore(limit)
+        return semaphore
+
+    def phases(self, calls: List[Dict[str, Any]]) -> List[List[int]]:
+        """Call indexes grouped into phases that may run concurrently"""
+        phases: List[List[int]] = []
+        concurrent = settings.TOOL_PARALLEL_EXECUTION
+        for index, call in enumerate(calls):
+            read_only = not mcp_service.is_side_effecting(call["name"])
+            if concurrent and read_only and phases and not mcp_service.is_side_effecting(calls[phases[-1][0]]["name"]):
+                phases[-1].append(index)
+            else:
+                phases.append([index])
+        return phases
+
+    async def run(
+        self,
+        calls: List[Dict[str, Any]],
+        execute: Callable[[str, Dict[str, Any]], Awaitable[Any]]
+    ) -> AsyncIterator[Tuple[str, int, Any]]:
+        """
+        Executes `calls` ({"name", "args", ...}) and yields ("start", index, None)
+        and ("end", index, result) events. Exceptions become error results.
+        """
+        for phase in self.phases(calls):
+            if len(phase) > 1:
+                metrics.incr("tools.parallel_phases")
+            queue: asyncio.Queue = asyncio.Queue()
+
+            async def worker(index: int):
+                call = calls[index]
+                async with self._semaphore(call["name"]):
+                    await queue.put(("start", index, None))
+                    try:
+                        result = await execute(call["name"], call["args"])
+                    except Exception as e:
+                        print(f"Tool Error: {e}")
+                        result = f"Error executing tool: {str(e)}"
+                await queue.put(("end", index, result))
+
+            tasks = [asyncio.create_task(worker(index)) for index in phase]
+            try:
+                remaining = len(tasks)
+                while remaining:
+                    event = await queue.get()
+                    if event[0] == "end":
+                        remaining -= 1
+                    yield event
+            finally:
+                # The consumer went away (e.g. client disconnect): stop the phase
+                for task in tasks:
+                    task.cancel()
+
+
+tool_scheduler = ToolScheduler()
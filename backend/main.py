@@ -7,7 +7,7 @@ sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from app.api.v1.endpoints import chat, files, scheduler, linkedin, gmail, chat_sessions
+from app.api.v1.endpoints import chat, files, scheduler, linkedin, gmail, chat_sessions, vector_search, metrics, plans
 
 # SQLite removed - using Supabase for all persistence
 
@@ -35,9 +35,24 @@ app.include_router(scheduler.router, prefix="/api/v1/scheduler", tags=["Schedule
 app.include_router(linkedin.router, prefix="/api/v1/linkedin", tags=["LinkedIn"])
 app.include_router(gmail.router, prefix="/api/v1/gmail", tags=["Gmail"])
 app.include_router(chat_sessions.router, prefix="/api/v1/chat-sessions", tags=["Chat Sessions"])
+app.include_router(vector_search.router, prefix="/api/v1/vector", tags=["Vector Search"])
+app.include_router(metrics.router, prefix="/api/v1/metrics", tags=["Metrics"])
+app.include_router(plans.router, prefix="/api/v1/plans", tags=["Plans"])
 
 @app.on_event("startup")
 async def startup_event():
+    # Shared keep-alive HTTP clients for LLM providers and integrations
+    from app.core.http_client import http_pool
+    await http_pool.startup()
+
+    # Fail fast if the embedding backend does not fit the chunks column
+    from app.services.embedding_service import embedding_service
+    embedding_service.check_dimension()
+
+    # Embed tool descriptions once, in the background, for tool routing
+    from app.services.tool_router import tool_router
+    tool_router.warm_up()
+
     # Start Telegram Bot if enabled
     from app.services.telegram_adapter import TelegramBotService
     from app.core.config import settings
@@ -50,6 +65,17 @@ async def startup_event():
         thread = threading.Thread(target=bot_service.run, daemon=True)
         thread.start()
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    from app.services.chat_job_service import chat_jobs
+    from app.services.document_pipeline_service import document_jobs
+    from app.services.document_parser_service import shutdown_parser_pool
+    from app.core.http_client import http_pool
+    await chat_jobs.shutdown()
+    await document_jobs.shutdown()
+    shutdown_parser_pool()
+    await http_pool.shutdown()
+
 @app.get("/")
 async def root():
     return {"message": "Welcome to EDITH"}
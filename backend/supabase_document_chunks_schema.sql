@@ -0,0 +1,7 @@
+-- Document Chunks Constraints
+-- Run this in Supabase SQL Editor
+
+-- Chunk upserts from the document pipeline conflict on (document_id, chunk_index),
+-- which makes re-processing a document (or retrying a failed batch) idempotent.
+CREATE UNIQUE INDEX IF NOT EXISTS idx_document_chunks_document_chunk
+    ON document_chunks(document_id, chunk_index);
@@ -0,0 +1,263 @@
+import asyncio
+import copy
+import json
+
+import pytest
+
+pytest.importorskip("pydantic_settings")
+pytest.importorskip("app.services.agent_service")
+
+from app.core.config import settings
+from app.core.metrics import metrics
+from app.services import agent_service as agent_module
+from app.services.agent_service import AgentService
+
+
+def tool_call(call_id, name, **args):
+    return {"id": call_id, "type": "function", "function": {"name": name, "arguments": json.dumps(args)}}
+
+
+def calls(*tool_calls):
+    return {"role": "assistant", "content": None, "tool_calls": list(tool_calls)}
+
+
+def answer(text):
+    return {"role": "assistant", "content": text}
+
+
+class ScriptedLLM:
+    """Answers each call with the next scripted message and records what it was sent"""
+    def __init__(self):
+        self.script, self.calls = [], []
+
+    async def get_raw_response(self, user_input, history=None, tools=None, **kwargs):
+        self.calls.append({"history": copy.deepcopy(history), **kwargs})
+        return {"choices": [{"message": self.script.pop(0)}]}
+
+    async def stream_raw_response(self, user_input, history=None, tools=None, **kwargs):
+        """Streams the scripted content in small pieces, then the whole response"""
+        response = await self.get_raw_response(user_input, history, tools, **kwargs)
+        content = response["choices"][0]["message"].get("content") or ""
+        for start in range(0, len(content), 5):
+            yield {"type": "token", "text": content[start:start + 5]}
+        yield {"type": "response", "response": response}
+
+
+class FakePlanCache:
+    def __init__(self):
+        self.stored, self.validated = [], []
+
+    def get(self, request, user_id=None, history=None):
+        return None
+
+    def set(self, request, plan, intent="TASK", user_id=None, history=None):
+        self.stored.append((request, plan, intent))
+
+    def mark_validated(self, request, user_id=None, history=None):
+        self.validated.append(request)
+
+
+@pytest.fixture
+def llm(monkeypatch):
+    llm = ScriptedLLM()
+    monkeypatch.setattr(agent_module, "llm_service", llm)
+    return llm
+
+
+@pytest.fixture
+def plans(monkeypatch):
+    plans = FakePlanCache()
+    monkeypatch.setattr(agent_module, "plan_cache", plans)
+    return plans
+
+
+@pytest.fixture
+def tools(monkeypatch):
+    """Fakes tool execution: every call returns a fresh, numbered result"""
+    executed = []
+
+    async def execute_tool(name, arguments, session_id=None, result_scope=None):
+        executed.append((name, arguments))
+        return f"result {len(executed)} of {name}"
+
+    async def select(message, intent="TASK", plan_steps=()):
+        return {"google_search"}
+
+    monkeypatch.setattr(agent_module.mcp_service, "execute_tool", execute_tool)
+    monkeypatch.setattr(agent_module.tool_router, "select", select)
+    monkeypatch.setattr(agent_module.tool_router, "definitions", lambda selected: [])
+    return executed
+
+
+@pytest.fixture
+def agent(monkeypatch, llm, plans, tools):
+    monkeypatch.setattr(settings, "AGENT_ROUTING_MODE", "staged")
+    monkeypatch.setattr(settings, "AGENT_STALL_ITERATIONS", 2)
+    monkeypatch.setattr(settings, "AGENT_CHAT_ITERATIONS", 3)
+    monkeypatch.setattr(settings, "AGENT_MIN_TASK_ITERATIONS", 4)
+    monkeypatch.setattr(settings, "AGENT_ITERATIONS_PER_STEP", 2)
+    agent = AgentService(max_iterations=12)
+    agent.route = {"intent": "TASK", "plan": None}
+
+    async def route_staged(message, user_id=None, history=None):
+        return {"intent": agent.route["intent"], "reason": "test"}, agent.route["plan"]
+
+    monkeypatch.setattr(agent, "_route_staged", route_staged)
+    return agent
+
+
+def _run(agent, message="find it", **kwargs):
+    async def collect():
+        return [event async for event in agent.run(message, **kwargs)]
+    return asyncio.run(collect())
+
+
+def _last_user_text(call):
+    return [e for e in call["history"] if e["role"] == "user"][-1]["parts"][0]["text"]
+
+
+def test_a_repeated_call_reuses_the_result_with_a_nudge(agent, llm, tools):
+    llm.script = [
+        calls(tool_call("c1", "google_search", query="bitcoin")),
+        calls(tool_call("c2", "google_search", query="bitcoin")),
+        answer("It is up."),
+    ]
+    repeats = metrics.get("agent.repeated_tool_calls")
+    events = _run(agent)
+
+    assert tools == [("google_search", {"query": "bitcoin"})]
+    first, second = [e["result"] for e in events if e["type"] == "tool_end"]
+    assert first == "result 1 of google_search"
+    assert second.startswith("result 1 of google_search") and "already called" in second
+    assert metrics.get("agent.repeated_tool_calls") - repeats == 1
+    assert events[-1]["response"] == "It is up."
+
+
+def test_a_side_effect_makes_repeated_reads_run_again(agent, llm, tools):
+    llm.script = [
+        calls(tool_call("c1", "google_search", query="inbox")),
+        calls(tool_call("c2", "write_file", filename="a.txt", content="x")),
+        calls(tool_call("c3", "google_search", query="inbox")),
+        answer("Done."),
+    ]
+    _run(agent)
+    assert [name for name, _ in tools] == ["google_search", "write_file", "google_search"]
+
+
+def test_a_stalled_loop_stops_and_summarizes(agent, llm, tools):
+    llm.script = [calls(tool_call(f"c{i}", "google_search", query="same")) for i in range(3)]
+    llm.script.append(answer("Here is what I found."))
+    stalled = metrics.get("agent.stalled")
+    events = _run(agent)
+
+    # One new call, then AGENT_STALL_ITERATIONS iterations of nothing but repeats
+    assert len(llm.calls) == 4 and len(tools) == 1
+    assert "repeating actions" in _last_user_text(llm.calls[-1])
+    assert metrics.get("agent.stalled") - stalled == 1
+    assert events[-1]["response"] == "Here is what I found."
+
+
+def test_chat_requests_get_a_small_budget(agent, llm, tools):
+    agent.route = {"intent": "CHAT", "plan": None}
+    llm.script = [calls(tool_call(f"c{i}", "google_search", query=str(i))) for i in range(3)]
+    llm.script.append(answer("Summary."))
+    events = _run(agent)
+
+    assert len(tools) == settings.AGENT_CHAT_ITERATIONS
+    assert len(llm.calls) == settings.AGENT_CHAT_ITERATIONS + 1
+    assert "maximum action limit" in _last_user_text(llm.calls[-1])
+    assert events[-1]["intent"] == "CHAT"
+
+
+def test_task_budgets_follow_the_plan_length(agent, llm, tools):
+    agent.route = {"intent": "TASK", "plan": {"steps": ["search", "answer"], "reasoning": "r"}}
+    # 2 steps * 2 + 1 = 5 iterations
+    llm.script = [calls(tool_call(f"c{i}", "google_search", query=str(i))) for i in range(5)]
+    llm.script.append(answer("Summary."))
+    _run(agent)
+    assert len(tools) == 5 and len(llm.calls) == 6
+
+
+def test_iteration_budget():
+    agent = AgentService(max_iterations=12)
+    assert agent._iteration_budget("CHAT", None) == settings.AGENT_CHAT_ITERATIONS
+    assert agent._iteration_budget("TASK", None) == 12
+    assert agent._iteration_budget("TASK", {"steps": ["one"]}) == settings.AGENT_MIN_TASK_ITERATIONS
+    assert agent._iteration_budget("HYBRID", {"steps": ["s"] * 20}) == 12
+
+
+def test_combined_mode_routes_on_the_first_call(agent, llm, plans, monkeypatch):
+    monkeypatch.setattr(settings, "AGENT_ROUTING_MODE", "combined")
+    route = 'ROUTE: {"intent": "HYBRID", "steps": ["look it up", "explain"]}'
+    llm.script = [answer(f"{route}\nIt is 42.")]
+    events = _run(agent, "what is the answer")
+
+    assert llm.calls[0]["instructions"] == agent_module.ROUTING_INSTRUCTION
+    assert {"type": "intent", "intent": "HYBRID", "reason": "Routed by the first LLM call"} in events
+    assert [e["steps"] for e in events if e["type"] == "plan"] == [["look it up", "explain"]]
+    assert plans.stored == [("what is the answer", {"steps": ["look it up", "explain"],
+                                                    "reasoning": "Planned by the first LLM call"}, "HYBRID")]
+    assert events[-1]["response"] == "It is 42." and events[-1]["intent"] == "HYBRID"
+
+
+@pytest.fixture
+def router(monkeypatch):
+    """Fakes the staged routing services: an unsure local model and a scripted remote detector"""
+    monkeypatch.setattr(settings, "INTENT_LOCAL_ENABLED", True)
+    router = {"lean": "TASK", "remote": "TASK", "plans": []}
+
+    async def detect(message, use_cache=True, use_local=True):
+        await asyncio.sleep(0)
+        return {"intent": router["remote"], "reason": "remote"}
+
+    async def generate_plan(message, use_cache=True, user_id=None, history=None, intent="TASK"):
+        router["plans"].append(message)
+        if not isinstance(intent, str):
+            intent = await intent
+        router["planned_intent"] = intent
+        return {"steps": [message], "reasoning": intent}
+
+    monkeypatch.setattr(agent_module.intent_classifier, "classify", lambda message: None)
+    monkeypatch.setattr(agent_module.intent_classifier, "predict", lambda message: (router["lean"], 0.6))
+    monkeypatch.setattr(agent_module.intent_detector, "detect", detect)
+    monkeypatch.setattr(agent_module.planner_service, "generate_plan", generate_plan)
+    return router
+
+
+def _route(message="do it"):
+    return asyncio.run(AgentService()._route_staged(message))
+
+
+def test_no_speculative_plan_when_the_local_model_leans_chat(router):
+    router.update(lean="CHAT", remote="CHAT")
+    intent_data, plan_data = _route()
+    assert intent_data["intent"] == "CHAT" and plan_data is None
+    assert router["plans"] == []
+
+
+def test_a_speculative_plan_is_dropped_when_the_remote_intent_is_chat(router):
+    router.update(lean="TASK", remote="CHAT")
+    wasted = metrics.get("planner.speculation_wasted")
+    intent_data, plan_data = _route()
+    assert intent_data["intent"] == "CHAT" and plan_data is None
+    assert metrics.get("planner.speculation_wasted") - wasted == 1
+    assert "planned_intent" not in router
+
+
+def test_a_speculative_plan_is_kept_under_the_remote_intent(router):
+    router.update(lean="TASK", remote="HYBRID")
+    intent_data, plan_data = _route()
+    assert intent_data["intent"] == "HYBRID"
+    assert plan_data == {"steps": ["do it"], "reasoning": "HYBRID"}
+    assert router["planned_intent"] == "HYBRID"
+
+
+def test_streamed_tokens_precede_the_answer_without_the_route_line(agent, llm, monkeypatch):
+    monkeypatch.setattr(settings, "AGENT_ROUTING_MODE", "combined")
+    llm.script = [answer('ROUTE: {"intent": "CHAT"}\nHello there.')]
+    events = _run(agent, "hello", stream_tokens=True)
+
+    types = [e["type"] for e in events]
+    assert types.index("token") < types.index("final")
+    assert "".join(e["text"] for e in events if e["type"] == "token") == "Hello there."
+    assert events[-1]["response"] == "Hello there."
@@ -0,0 +1,98 @@
+from app.core import cache as cache_module
+from app.core.cache import TTLCache
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def _frozen(monkeypatch) -> Clock:
+    clock = Clock()
+    monkeypatch.setattr(cache_module.time, "monotonic", clock)
+    return clock
+
+
+def test_get_returns_default_for_missing_key():
+    cache = TTLCache()
+    assert cache.get("missing") is None
+    assert cache.get("missing", "fallback") == "fallback"
+    assert "missing" not in cache
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = TTLCache(maxsize=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+
+    assert cache.get("a") == 1
+    assert cache.get("b") is None
+    assert cache.get("c") == 3
+    assert len(cache) == 2
+
+
+def test_entries_expire_after_ttl(monkeypatch):
+    clock = _frozen(monkeypatch)
+    cache = TTLCache(ttl=10)
+    cache.set("key", "value")
+
+    clock.now += 9.9
+    assert cache.get("key") == "value"
+    clock.now += 0.1
+    assert cache.get("key") is None
+    assert len(cache) == 0
+
+
+def test_per_entry_ttl_overrides_the_default(monkeypatch):
+    clock = _frozen(monkeypatch)
+    cache = TTLCache(ttl=10)
+    cache.set("short", 1, ttl=1)
+    cache.set("forever", 2)
+
+    clock.now += 5
+    assert cache.get("short") is None
+    assert cache.get("forever") == 2
+
+
+def test_falsy_values_are_cached():
+    cache = TTLCache()
+    cache.set("empty", [])
+    assert "empty" in cache
+    assert cache.get("empty", "fallback") == []
+
+
+def test_invalidate_removes_matching_keys():
+    cache = TTLCache()
+    cache.set(("user-1", "q1"), 1)
+    cache.set(("user-1", "q2"), 2)
+    cache.set(("user-2", "q1"), 3)
+
+    assert cache.invalidate(lambda key: key[0] == "user-1") == 2
+    assert cache.get(("user-2", "q1")) == 3
+    assert len(cache) == 1
+
+
+def test_items_skips_expired_entries(monkeypatch):
+    clock = _frozen(monkeypatch)
+    cache = TTLCache()
+    cache.set("old", 1, ttl=1)
+    cache.set("new", 2, ttl=100)
+
+    clock.now += 2
+    assert cache.items() == [("new", 2)]
+
+
+def test_pop_and_clear():
+    cache = TTLCache()
+    cache.set("a", 1)
+    cache.set("b", 2)
+
+    assert cache.pop("a") == 1
+    assert cache.pop("a", "gone") == "gone"
+    cache.clear()
+    assert len(cache) == 0
@@ -0,0 +1,175 @@
+import asyncio
+import time
+
+import pytest
+
+pytest.importorskip("pydantic_settings")
+pytest.importorskip("fastapi")
+pytest.importorskip("app.api.v1.endpoints.chat")
+
+from fastapi import FastAPI, HTTPException, WebSocketDisconnect
+from fastapi.testclient import TestClient
+
+from app.api.v1.endpoints import chat
+from app.core.config import settings
+from app.services.job_queue import JobQueue
+
+
+@pytest.fixture
+def agent(monkeypatch):
+    """Fakes the agent loop: replies to any message with a fixed event sequence"""
+    async def run(message, history=None, stream_tokens=False, session_id=None, user_id=None):
+        yield {"type": "intent", "intent": "CHAT", "reason": "test"}
+        yield {"type": "token", "text": message.upper()}
+        yield {"type": "final", "response": message.upper(), "intent": "CHAT", "actions": []}
+
+    monkeypatch.setattr(chat.agent_service, "run", run)
+    return run
+
+
+@pytest.fixture
+def client(monkeypatch, agent):
+    # A fresh queue per test: workers bind to the TestClient's event loop
+    monkeypatch.setattr(chat, "chat_jobs", JobQueue("chat-test", workers=1))
+    app = FastAPI()
+    app.include_router(chat.router, prefix="/api/v1/chat")
+    with TestClient(app) as client:
+        yield client
+
+
+def _finished(client, job_id, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while True:
+        job = client.get(f"/api/v1/chat/jobs/{job_id}").json()
+        if job["status"] in ("succeeded", "failed") or time.monotonic() > deadline:
+            return job
+        time.sleep(0.01)
+
+
+def test_stream_sends_tokens_before_the_final_event(client):
+    response = client.post("/api/v1/chat/stream", json={"message": "hi"})
+    assert response.headers["content-type"].startswith("text/event-stream")
+    events = [block.split("\n")[0] for block in response.text.strip().split("\n\n")]
+    assert events == ["event: intent", "event: token", "event: final"]
+    assert '"response": "HI"' in response.text
+
+
+def test_job_result_and_events_can_be_polled(client):
+    job_id = client.post("/api/v1/chat/jobs", json={"message": "hi"}).json()["job_id"]
+    job = _finished(client, job_id)
+
+    assert job["status"] == "succeeded"
+    assert job["result"]["response"] == "HI"
+    # Tokens are dropped once the job ends; seq numbers keep their gaps
+    assert [(e["seq"], e["type"]) for e in job["new_events"]] == [(0, "intent"), (2, "final")]
+    after = client.get(f"/api/v1/chat/jobs/{job_id}", params={"after": 0}).json()
+    assert [e["type"] for e in after["new_events"]] == ["final"]
+
+
+def test_job_stream_resumes_from_last_event_id(client):
+    job_id = client.post("/api/v1/chat/jobs", json={"message": "hi"}).json()["job_id"]
+    _finished(client, job_id)
+
+    full = client.get(f"/api/v1/chat/jobs/{job_id}/stream").text
+    assert "id: 0\nevent: intent\n" in full and "id: 2\nevent: final\n" in full
+
+    resumed = client.get(f"/api/v1/chat/jobs/{job_id}/stream", headers={"Last-Event-ID": "0"}).text
+    assert "event: intent" not in resumed and "id: 2\nevent: final\n" in resumed
+
+
+def test_unknown_jobs_are_not_found(client):
+    assert client.get("/api/v1/chat/jobs/missing").status_code == 404
+
+
+@pytest.fixture
+def slow_agent(monkeypatch, agent):
+    """"wait" never finishes and "slow" finishes late, so runs can overlap"""
+    async def run(message, history=None, stream_tokens=False, session_id=None, user_id=None):
+        yield {"type": "intent", "intent": "CHAT", "reason": "test"}
+        if message == "wait":
+            await asyncio.sleep(3600)
+        elif message == "slow":
+            await asyncio.sleep(0.05)
+        yield {"type": "final", "response": message, "intent": "CHAT", "actions": []}
+
+    monkeypatch.setattr(chat.agent_service, "run", run)
+    return run
+
+
+def _chat(ws, request_id, message, session_id=None):
+    ws.send_json({"type": "chat", "request_id": request_id, "message": message, "session_id": session_id})
+
+
+def _finals(ws, count):
+    finals = []
+    while len(finals) < count:
+        event = ws.receive_json()
+        if event["type"] == "final":
+            finals.append(event["request_id"])
+    return finals
+
+
+def test_ws_events_are_tagged_with_the_request(client):
+    with client.websocket_connect("/api/v1/chat/ws") as ws:
+        ws.send_json({"type": "ping"})
+        assert ws.receive_json() == {"type": "pong"}
+
+        _chat(ws, "r1", "hi", session_id="s1")
+        events = [ws.receive_json() for _ in range(3)]
+    assert [e["type"] for e in events] == ["intent", "token", "final"]
+    assert all(e["request_id"] == "r1" and e["session_id"] == "s1" for e in events)
+    assert events[-1]["response"] == "HI"
+
+
+def test_ws_rejects_malformed_messages(client):
+    with client.websocket_connect("/api/v1/chat/ws") as ws:
+        ws.send_text("not json")
+        assert ws.receive_json()["type"] == "error"
+        ws.send_json({"type": "shout", "request_id": "r1"})
+        assert ws.receive_json() == {"type": "error", "request_id": "r1", "detail": "Unknown message type: shout"}
+        _chat(ws, None, "hi")
+        assert ws.receive_json()["detail"] == "A unique request_id is required"
+
+
+def test_ws_turns_of_a_session_run_in_order(client, slow_agent):
+    with client.websocket_connect("/api/v1/chat/ws") as ws:
+        _chat(ws, "r1", "slow", session_id="s1")
+        _chat(ws, "r2", "fast", session_id="s1")
+        assert _finals(ws, 2) == ["r1", "r2"]
+
+        _chat(ws, "r3", "slow", session_id="s1")
+        _chat(ws, "r4", "fast", session_id="s2")
+        assert _finals(ws, 2) == ["r4", "r3"]
+
+
+def test_ws_requests_can_be_cancelled(client, slow_agent):
+    with client.websocket_connect("/api/v1/chat/ws") as ws:
+        _chat(ws, "r1", "wait")
+        assert ws.receive_json()["type"] == "intent"
+        _chat(ws, "r1", "again")
+        assert ws.receive_json()["detail"] == "A unique request_id is required"
+
+        ws.send_json({"type": "cancel", "request_id": "r1"})
+        assert ws.receive_json() == {"type": "cancelled", "request_id": "r1", "session_id": None}
+
+
+def test_ws_limits_concurrent_runs(client, slow_agent, monkeypatch):
+    monkeypatch.setattr(settings, "CHAT_WS_MAX_CONCURRENT_RUNS", 1)
+    with client.websocket_connect("/api/v1/chat/ws") as ws:
+        _chat(ws, "r1", "wait")
+        assert ws.receive_json()["type"] == "intent"
+        _chat(ws, "r2", "hi")
+        assert ws.receive_json() == {
+            "type": "error", "request_id": "r2", "detail": "Too many concurrent requests on this connection",
+        }
+
+
+def test_ws_closes_on_a_bad_token(client, monkeypatch):
+    async def reject(authorization):
+        raise HTTPException(status_code=401, detail="Invalid token")
+
+    monkeypatch.setattr(chat, "get_current_user", reject)
+    with pytest.raises(WebSocketDisconnect) as exc:
+        with client.websocket_connect("/api/v1/chat/ws?token=bad") as ws:
+            ws.receive_json()
+    assert exc.value.code == 4401
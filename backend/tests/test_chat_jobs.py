@@ -0,0 +1,81 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip("pydantic_settings")
+pytest.importorskip("app.services.chat_job_service")
+
+from app.services import chat_job_service
+from app.services.chat_job_service import describe, run_chat_job
+from app.services.job_queue import Job
+
+EVENTS = [
+    {"type": "intent", "intent": "TASK", "reason": "r"},
+    {"type": "tool_start", "id": "c1", "name": "google_search", "args": {}},
+    {"type": "tool_end", "id": "c1", "name": "google_search", "result": "r1"},
+    {"type": "token", "text": "Hel"},
+    {"type": "tool_start", "id": "c2", "name": "browse_url", "args": {}},
+    {"type": "tool_end", "id": "c2", "name": "browse_url", "result": "r2"},
+    {"type": "token", "text": "lo"},
+    {"type": "final", "response": "Hello", "intent": "TASK", "actions": ["google_search", "browse_url"]},
+]
+
+
+@pytest.fixture
+def agent(monkeypatch):
+    seen = {}
+
+    async def run(message, history=None, stream_tokens=False, session_id=None, user_id=None):
+        seen.update(message=message, session_id=session_id, user_id=user_id)
+        for event in EVENTS:
+            yield event
+
+    monkeypatch.setattr(chat_job_service.agent_service, "run", run)
+    return seen
+
+
+@pytest.fixture
+def appended(monkeypatch):
+    calls = []
+
+    async def append(session_id, user_id, user_text, ai_text):
+        calls.append((session_id, user_id, user_text, ai_text))
+
+    monkeypatch.setattr(chat_job_service.session_history, "append", append)
+    return calls
+
+
+def test_job_records_steps_and_drops_tokens_when_done(agent, appended):
+    job = Job("chat", owner_id="alice", message="hi", history=None, session_id="s1", server_side_history=True)
+    result = asyncio.run(run_chat_job(job))
+
+    assert result == {"response": "Hello", "intent": "TASK", "actions": ["google_search", "browse_url"]}
+    assert [e["type"] for e in job.events] == ["intent", "tool_start", "tool_end", "tool_start", "tool_end", "final"]
+    assert [e["seq"] for e in job.events] == [0, 1, 2, 4, 5, 7]
+    assert job.progress == {"last_tool": "browse_url", "tool_calls": 2}
+    assert describe(job)["metadata"] == {"session_id": "s1"}
+
+
+def test_tool_memo_and_history_are_scoped_to_the_owner(agent, appended):
+    job = Job("chat", owner_id="alice", message="hi", history=None, session_id="s1", server_side_history=True)
+    asyncio.run(run_chat_job(job))
+    assert agent["session_id"] == "alice/s1"
+    assert appended == [("s1", "alice", "hi", "Hello")]
+
+
+def test_client_history_is_not_stored(agent, appended):
+    job = Job("chat", owner_id=None, message="hi", history=[], session_id="s1", server_side_history=False)
+    asyncio.run(run_chat_job(job))
+    assert agent["session_id"] is None
+    assert appended == []
+
+
+def test_a_run_without_a_final_event_fails(monkeypatch, appended):
+    async def run(*args, **kwargs):
+        yield {"type": "token", "text": "partial"}
+
+    monkeypatch.setattr(chat_job_service.agent_service, "run", run)
+    job = Job("chat", message="hi")
+    with pytest.raises(RuntimeError):
+        asyncio.run(run_chat_job(job))
+    assert job.events == []
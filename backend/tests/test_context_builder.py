@@ -0,0 +1,116 @@
+import pytest
+
+pytest.importorskip("pydantic_settings")
+
+from app.core.config import settings
+from app.services.context_builder import ContextBuilder, RollingSummary, count_tokens, entry_tokens
+
+
+@pytest.fixture(autouse=True)
+def no_references(monkeypatch):
+    monkeypatch.setattr(settings, "TOOL_RESULT_REFS_ENABLED", False)
+
+
+def user(text):
+    return {"role": "user", "parts": [{"text": text}]}
+
+
+def model(text):
+    return {"role": "model", "parts": [{"text": text}]}
+
+
+def call(call_id, name="google_search"):
+    return {"role": "model", "parts": [{"function_call": {"id": call_id, "name": name, "args": {"q": "x"}}}]}
+
+
+def response(call_id, result, name="google_search"):
+    return {"role": "function", "parts": [{"function_response": {"id": call_id, "name": name, "response": {"result": result}}}]}
+
+
+def test_count_tokens_is_zero_for_empty_text():
+    assert count_tokens("") == 0
+    assert count_tokens("hello world") > 0
+
+
+def test_tool_responses_travel_with_their_call():
+    builder = ContextBuilder()
+    groups = builder.group([user("find x"), call("c1"), response("c1", "r1"), model("done")])
+    assert [len(g) for g in groups] == [1, 2, 1]
+
+
+def test_orphaned_tool_responses_are_dropped():
+    builder = ContextBuilder()
+    groups = builder.group([response("gone", "r"), user("hi")])
+    assert groups == [[user("hi")]]
+
+
+def test_history_within_budget_is_kept_as_is():
+    history = [user("hi"), model("hello"), user("how are you")]
+    summary, kept = ContextBuilder(token_budget=10_000).build(history)
+    assert summary is None
+    assert kept == history
+
+
+def test_oldest_turns_are_evicted_into_the_summary():
+    history = [user(f"question {i} " + "word " * 50) for i in range(6)] + [user("current question")]
+    budget = sum(entry_tokens(e) for e in history[-2:])
+    summary, kept = ContextBuilder(token_budget=budget).build(history)
+
+    assert kept[-1] == user("current question")
+    assert len(kept) < len(history)
+    assert summary.startswith("- User: question 0")
+
+
+def test_current_user_turn_is_never_evicted():
+    history = [user("word " * 500)]
+    summary, kept = ContextBuilder(token_budget=10).build(history)
+    assert summary is None
+    assert kept == history
+
+
+def test_eviction_never_splits_a_tool_group():
+    history = [user("old"), call("c1"), response("c1", "x" * 4000), model("found it"), user("next")]
+    _, kept = ContextBuilder(token_budget=entry_tokens(history[-1]) + 20, full_tool_groups=0).build(history)
+    call_ids = {p["function_call"]["id"] for e in kept for p in e["parts"] if "function_call" in p}
+    response_ids = {p["function_response"]["id"] for e in kept for p in e["parts"] if "function_response" in p}
+    assert response_ids <= call_ids
+
+
+def test_older_tool_payloads_are_truncated():
+    history = [user("a"), call("c1"), response("c1", "x" * 5000), call("c2"), response("c2", "y" * 5000), user("b")]
+    _, kept = ContextBuilder(token_budget=100_000, tool_result_max_chars=100, full_tool_groups=1).build(history)
+    results = [p["function_response"]["response"]["result"] for e in kept for p in e["parts"] if "function_response" in p]
+    assert results[0].startswith("x" * 100) and "[truncated 4900 chars]" in results[0]
+    assert results[1] == "y" * 5000
+
+
+def test_rolling_summary_matches_a_full_rebuild():
+    builder = ContextBuilder(token_budget=200, summary_max_chars=300)
+    rolling = RollingSummary()
+    history = []
+    for i in range(30):
+        history.append((user if i % 2 == 0 else model)(f"message {i} " + "word " * 30))
+        incremental, _ = builder.build(history, rolling)
+        full, _ = builder.build(history)
+        assert incremental == full
+    assert rolling.groups > 0
+
+
+def test_rolling_summary_only_reads_newly_evicted_groups():
+    builder = ContextBuilder(summary_max_chars=10_000)
+    rolling = RollingSummary()
+    groups = [[user(f"turn {i}")] for i in range(5)]
+
+    builder.summarize(groups[:3], rolling)
+    groups[0] = [user("changed after it was summarized")]
+    summary = builder.summarize(groups, rolling)
+    assert "turn 0" in summary and "changed" not in summary
+    assert rolling.groups == 5
+
+
+def test_summary_drops_the_oldest_lines_past_the_cap():
+    builder = ContextBuilder(summary_max_chars=60)
+    summary = builder.summarize([[user(f"turn number {i}")] for i in range(10)])
+    assert len(summary) <= 60
+    assert summary.startswith("- ...")
+    assert summary.endswith("turn number 9")
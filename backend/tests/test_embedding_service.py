@@ -0,0 +1,38 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip("pydantic_settings")
+
+from app.core.config import settings
+from app.services.embedding_service import EmbeddingService
+
+
+@pytest.fixture(autouse=True)
+def column(monkeypatch):
+    monkeypatch.setattr(settings, "EMBEDDING_DIMENSION", 768)
+
+
+def test_backends_must_match_the_column_dimension():
+    EmbeddingService("stub").check_dimension()
+    EmbeddingService("gemini").check_dimension()
+    with pytest.raises(ValueError, match="1024-dimension"):
+        EmbeddingService("local").check_dimension()
+
+
+def test_a_migrated_column_accepts_the_local_backend(monkeypatch):
+    monkeypatch.setattr(settings, "EMBEDDING_DIMENSION", 1024)
+    EmbeddingService("local").check_dimension()
+    with pytest.raises(ValueError):
+        EmbeddingService("stub").check_dimension()
+
+
+def test_unknown_backends_are_rejected():
+    with pytest.raises(ValueError, match="Unknown embedding backend"):
+        EmbeddingService("nope").check_dimension()
+
+
+def test_stub_vectors_fit_the_column():
+    service = EmbeddingService("stub")
+    vector = asyncio.run(service.generate_query_embedding("hello"))
+    assert len(vector) == settings.EMBEDDING_DIMENSION
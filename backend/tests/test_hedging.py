@@ -0,0 +1,114 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("pydantic_settings")
+pytest.importorskip("httpx")
+
+from app.core.config import settings
+from app.services import llm_service as llm_module
+from app.services.key_pool_service import KeyPool, KeyPoolRegistry
+from app.services.provider_health_service import ProviderHealth, ProviderHealthRegistry
+
+PRIMARY = {"name": "Gemini", "provider": "Gemini"}
+BACKUP = {"name": "Groq", "provider": "Groq"}
+SPARE = {"name": "OpenAI", "provider": "OpenAI"}
+
+
+@pytest.fixture
+def service(monkeypatch):
+    monkeypatch.setattr(llm_module.provider_health, "hedge_delay", lambda provider: 0.01)
+    return llm_module.LLMService()
+
+
+def _providers(service, monkeypatch, delays):
+    """Fakes provider calls: each answers with its name after its delay"""
+    calls = []
+
+    async def call_provider(config, messages, prefix):
+        calls.append(config["name"])
+        await asyncio.sleep(delays[config["name"]])
+        return {"from": config["name"]}
+
+    monkeypatch.setattr(service, "_call_provider", call_provider)
+    return calls
+
+
+def test_fast_primary_is_not_hedged(service, monkeypatch):
+    monkeypatch.setattr(settings, "LLM_HEDGE_BUDGET_RATIO", 1.0)
+    calls = _providers(service, monkeypatch, {"Gemini": 0, "Groq": 0})
+
+    data, config, remaining = asyncio.run(service._hedged_call([PRIMARY, BACKUP, SPARE], [], {}))
+    assert data == {"from": "Gemini"} and config is PRIMARY
+    assert calls == ["Gemini"]
+    assert remaining == [BACKUP, SPARE]
+
+
+def test_slow_primary_is_raced_against_the_backup(service, monkeypatch):
+    monkeypatch.setattr(settings, "LLM_HEDGE_BUDGET_RATIO", 1.0)
+    calls = _providers(service, monkeypatch, {"Gemini": 1.0, "Groq": 0})
+
+    data, config, remaining = asyncio.run(service._hedged_call([PRIMARY, BACKUP, SPARE], [], {}))
+    assert data == {"from": "Groq"} and config is BACKUP
+    assert calls == ["Gemini", "Groq"]
+    assert remaining == [SPARE]
+
+
+def test_hedges_stay_within_the_budget(service, monkeypatch):
+    monkeypatch.setattr(settings, "LLM_HEDGE_BUDGET_RATIO", 0.5)
+    calls = _providers(service, monkeypatch, {"Gemini": 0.03, "Groq": 0})
+
+    async def scenario():
+        return [await service._hedged_call([PRIMARY, BACKUP], [], {}) for _ in range(4)]
+
+    winners = [config["name"] for _, config, _ in asyncio.run(scenario())]
+    # Hedges fire only while fired + 1 <= ratio * eligible: on the 2nd and 4th call
+    assert winners == ["Gemini", "Groq", "Gemini", "Groq"]
+    assert calls.count("Groq") == 2
+
+
+def test_hedge_delay_uses_the_latency_percentile(monkeypatch):
+    monkeypatch.setattr(settings, "LLM_HEDGE_PERCENTILE", 95.0)
+    monkeypatch.setattr(settings, "LLM_HEDGE_MIN_DELAY_SECONDS", 0.5)
+    health = ProviderHealth("Gemini")
+    for latency in range(1, 21):
+        health.record_success(float(latency))
+    assert health.latency_percentile(95) == 20.0
+
+    registry = ProviderHealthRegistry()
+    registry._providers["Gemini"] = health
+    assert registry.hedge_delay("Gemini") == 20.0
+    assert registry.hedge_delay("Groq") >= 0.5
+
+
+class SlowClient:
+    """Answers each URL after its delay"""
+    def __init__(self, delays):
+        self.delays = delays
+
+    async def post(self, url, content=None, headers=None, timeout=None):
+        await asyncio.sleep(self.delays[url])
+        return SimpleNamespace(status_code=200, headers={}, json=lambda: {"from": url})
+
+
+def test_cancelled_hedge_loser_releases_its_key(service, monkeypatch):
+    monkeypatch.setattr(settings, "LLM_HEDGE_BUDGET_RATIO", 1.0)
+    pools = KeyPoolRegistry()
+    pools.pools = {"Gemini": KeyPool("Gemini", ["g"], 60, 100_000), "Groq": KeyPool("Groq", ["q"], 60, 100_000)}
+    monkeypatch.setattr(llm_module, "key_pools", pools)
+    client = SlowClient({"gemini-url": 1.0, "groq-url": 0})
+    monkeypatch.setattr(llm_module.http_pool, "client_for", lambda url: client)
+
+    primary = {**PRIMARY, "model": "m", "url": "gemini-url"}
+    backup = {**BACKUP, "model": "m", "url": "groq-url"}
+    prefix = {"version": "v", "tools_json": None, "system_json": "{}"}
+
+    async def scenario():
+        result = await service._hedged_call([primary, backup], [], prefix)
+        await asyncio.sleep(0)  # let the cancelled loser unwind
+        return result
+
+    data, config, _ = asyncio.run(scenario())
+    assert data == {"from": "groq-url"} and config is backup
+    assert [pooled.in_flight for pool in pools.pools.values() for pooled in pool.keys] == [0, 0]
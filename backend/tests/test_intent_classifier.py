@@ -0,0 +1,109 @@
+import asyncio
+import json
+
+import pytest
+
+pytest.importorskip("pydantic_settings")
+
+from app.core.config import settings
+from app.services import intent_classifier as intent_classifier_module
+from app.services.intent_classifier import IntentClassifier, features
+
+
+@pytest.fixture(autouse=True)
+def classifier_settings(monkeypatch, tmp_path):
+    monkeypatch.setattr(settings, "INTENT_LOCAL_ENABLED", True)
+    monkeypatch.setattr(settings, "INTENT_MODEL_PATH", str(tmp_path / "model.json"))
+    monkeypatch.setattr(settings, "INTENT_LOG_ENABLED", False)
+    monkeypatch.setattr(settings, "INTENT_LOG_MAX_BYTES", 5_000_000)
+
+
+def test_features_include_bigrams_and_a_length_bucket():
+    assert features("Hi there") == ["hi", "there", "hi there", "__len_2"]
+
+
+def test_seed_examples_answer_clear_cases(tmp_path):
+    classifier = IntentClassifier(str(tmp_path / "log.jsonl"))
+    assert classifier.predict("search for the latest bitcoin news")[0] == "TASK"
+    assert classifier.predict("thank you so much")[0] == "CHAT"
+
+
+def test_defers_to_the_llm_until_enough_decisions_were_seen(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "INTENT_LOCAL_MIN_EXAMPLES", 2)
+    monkeypatch.setattr(settings, "INTENT_LOCAL_CONFIDENCE", 0.8)
+    classifier = IntentClassifier(str(tmp_path / "log.jsonl"))
+    assert classifier.classify("thanks") is None
+
+    asyncio.run(classifier.record("thanks a lot", "CHAT"))
+    asyncio.run(classifier.record("thanks again", "CHAT"))
+    assert classifier.classify("thanks")["intent"] == "CHAT"
+
+
+def test_decisions_are_not_written_unless_the_log_is_enabled(tmp_path):
+    path = tmp_path / "log.jsonl"
+    classifier = IntentClassifier(str(path))
+    asyncio.run(classifier.record("find flights to paris", "TASK"))
+    assert classifier.logged_examples == 1
+    assert not path.exists()
+
+
+def test_enabled_log_rebuilds_the_model_without_a_snapshot(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "INTENT_LOG_ENABLED", True)
+    path = tmp_path / "log.jsonl"
+    asyncio.run(IntentClassifier(str(path)).record("find flights to paris", "TASK"))
+    assert json.loads(path.read_text()) == {"text": "find flights to paris", "intent": "TASK"}
+
+    (tmp_path / "model.json").unlink()
+    restarted = IntentClassifier(str(path))
+    restarted.train()
+    assert restarted.logged_examples == 1
+
+
+def test_fast_path_opens_and_survives_restarts_under_default_settings(tmp_path):
+    classifier = IntentClassifier(str(tmp_path / "log.jsonl"))
+    assert classifier.classify("thanks for the help") is None
+
+    async def learn():
+        for i in range(settings.INTENT_LOCAL_MIN_EXAMPLES // 2):
+            await classifier.record(f"thanks for the help with item {i}", "CHAT")
+            await classifier.record(f"search the web for item {i}", "TASK")
+
+    asyncio.run(learn())
+    restarted = IntentClassifier(str(tmp_path / "log.jsonl"))
+    assert restarted.classify("thanks for the help")["intent"] == "CHAT"
+    assert restarted.classify("search the web for flights")["intent"] == "TASK"
+    # Only hashed feature counts are saved, no message text
+    assert "thanks" not in (tmp_path / "model.json").read_text()
+    assert not (tmp_path / "log.jsonl").exists()
+
+
+def test_snapshot_is_ignored_when_the_seeds_change(tmp_path, monkeypatch):
+    classifier = IntentClassifier(str(tmp_path / "log.jsonl"))
+    asyncio.run(classifier.record("find flights to paris", "TASK"))
+
+    monkeypatch.setattr(intent_classifier_module, "MODEL_FINGERPRINT", "changed")
+    restarted = IntentClassifier(str(tmp_path / "log.jsonl"))
+    restarted.train()
+    assert restarted.logged_examples == 0
+
+
+def test_log_is_rotated_past_the_size_limit(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "INTENT_LOG_ENABLED", True)
+    monkeypatch.setattr(settings, "INTENT_LOG_MAX_BYTES", 200)
+    path = tmp_path / "log.jsonl"
+    classifier = IntentClassifier(str(path))
+
+    async def record_many():
+        for i in range(30):
+            await classifier.record(f"search for item number {i}", "TASK")
+
+    asyncio.run(record_many())
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["log.jsonl", "log.jsonl.1", "model.json"]
+    assert path.stat().st_size <= 200 + 100
+    assert (tmp_path / "log.jsonl.1").stat().st_size <= 200 + 100
+
+
+def test_unknown_intents_are_ignored(tmp_path):
+    classifier = IntentClassifier(str(tmp_path / "log.jsonl"))
+    asyncio.run(classifier.record("whatever", "UNKNOWN"))
+    assert classifier.logged_examples == 0
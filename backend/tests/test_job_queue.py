@@ -0,0 +1,155 @@
+import asyncio
+
+import pytest
+
+from app.services.job_queue import JobQueue
+
+
+async def _wait_done(job, timeout: float = 1.0):
+    async def poll():
+        while not job.done:
+            await asyncio.sleep(0.001)
+    await asyncio.wait_for(poll(), timeout)
+
+
+def test_job_runs_and_reports_result():
+    async def scenario():
+        queue = JobQueue("test", workers=1)
+
+        async def handler(job):
+            job.update_progress(step=1)
+            return {"answer": job.metadata["x"] * 2}
+
+        job = queue.submit(handler, kind="double", owner_id="user-1", x=21)
+        assert job.status == "queued"
+        await _wait_done(job)
+        await queue.shutdown()
+        return job
+
+    job = asyncio.run(scenario())
+    assert job.status == "succeeded"
+    assert job.result == {"answer": 42}
+    assert job.progress == {"step": 1}
+    assert job.to_dict()["finished_at"] is not None
+
+
+def test_failed_job_records_the_error():
+    async def scenario():
+        queue = JobQueue("test", workers=1)
+
+        async def handler(job):
+            raise ValueError("bad input")
+
+        job = queue.submit(handler, kind="broken")
+        await _wait_done(job)
+        await queue.shutdown()
+        return job
+
+    job = asyncio.run(scenario())
+    assert job.status == "failed"
+    assert job.error == "bad input"
+
+
+def test_submit_raises_when_the_queue_is_full():
+    async def scenario():
+        queue = JobQueue("test", workers=1, max_queued=1)
+        release = asyncio.Event()
+
+        async def handler(job):
+            await release.wait()
+
+        queue.submit(handler, kind="slow")
+        await asyncio.sleep(0)  # the worker takes the first job
+        queue.submit(handler, kind="slow")
+        with pytest.raises(asyncio.QueueFull):
+            queue.submit(handler, kind="slow")
+        release.set()
+        await queue.shutdown()
+
+    asyncio.run(scenario())
+
+
+def test_only_max_finished_jobs_are_kept():
+    async def scenario():
+        queue = JobQueue("test", workers=1, max_finished=2)
+
+        async def handler(job):
+            return None
+
+        jobs = []
+        for _ in range(3):
+            jobs.append(queue.submit(handler, kind="noop"))
+            await _wait_done(jobs[-1])
+        queue.submit(handler, kind="noop")
+        await queue.shutdown()
+        return queue, jobs
+
+    queue, jobs = asyncio.run(scenario())
+    assert queue.get(jobs[0].id) is None
+    assert queue.get(jobs[1].id) is jobs[1]
+    assert queue.get(jobs[2].id) is jobs[2]
+
+
+def test_event_log_is_numbered_and_readable_from_any_offset():
+    async def scenario():
+        queue = JobQueue("test", workers=1)
+
+        async def handler(job):
+            for kind in ("intent", "tool_start", "tool_end", "final"):
+                job.add_event({"type": kind})
+
+        job = queue.submit(handler, kind="events")
+        await _wait_done(job)
+        await queue.shutdown()
+        return job
+
+    job = asyncio.run(scenario())
+    assert [e["seq"] for e in job.events_after(-1)] == [0, 1, 2, 3]
+    assert [e["type"] for e in job.events_after(1)] == ["tool_end", "final"]
+    assert job.events_after(3) == []
+
+
+def test_compaction_keeps_sequence_numbers():
+    async def scenario():
+        queue = JobQueue("test", workers=1)
+
+        async def handler(job):
+            for kind in ("intent", "token", "token", "tool_end", "token", "final"):
+                job.add_event({"type": kind})
+            job.compact_events(lambda event: event["type"] != "token")
+            job.add_event({"type": "late"})
+
+        job = queue.submit(handler, kind="events")
+        await _wait_done(job)
+        await queue.shutdown()
+        return job
+
+    job = asyncio.run(scenario())
+    assert [(e["seq"], e["type"]) for e in job.events_after(-1)] == [
+        (0, "intent"), (3, "tool_end"), (5, "final"), (6, "late"),
+    ]
+    # A client that saw seq 1 (a dropped token) resumes at the next kept event
+    assert [e["seq"] for e in job.events_after(1)] == [3, 5, 6]
+
+
+def test_wait_wakes_on_new_events_and_completion():
+    async def scenario():
+        queue = JobQueue("test", workers=1)
+        release = asyncio.Event()
+
+        async def handler(job):
+            await release.wait()
+            job.add_event({"type": "step"})
+            await asyncio.sleep(0.01)
+
+        job = queue.submit(handler, kind="events")
+        timed_out = not await job.wait(0.01)
+        release.set()
+        woke_on_event = await job.wait(1.0)
+        woke_on_completion = await job.wait(1.0)
+        await queue.shutdown()
+        return timed_out, woke_on_event, woke_on_completion, job
+
+    timed_out, woke_on_event, woke_on_completion, job = asyncio.run(scenario())
+    assert timed_out and woke_on_event and woke_on_completion
+    assert job.done
@@ -0,0 +1,155 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip("pydantic_settings")
+pytest.importorskip("httpx")
+
+from app.core.config import settings
+from app.services import key_pool_service
+from app.services.key_pool_service import KeyPool, KeyPoolRegistry, NoKeyAvailable, TokenBucket, parse_reset_duration
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(key_pool_service.time, "monotonic", clock)
+    return clock
+
+
+@pytest.fixture(autouse=True)
+def reserve(monkeypatch):
+    monkeypatch.setattr(settings, "KEY_POOL_PRIORITY_RESERVE", 0.2)
+
+
+def test_bucket_refills_at_its_per_minute_rate():
+    bucket = TokenBucket(capacity=60, per_minute=60)
+    bucket.updated = 0.0
+    bucket.tokens = 0
+    bucket.refill(30.0)
+    assert bucket.tokens == 30
+    bucket.refill(1000.0)
+    assert bucket.tokens == 60
+
+
+def test_bucket_wait_for_accounts_for_the_reserve():
+    bucket = TokenBucket(capacity=100, per_minute=60)
+    bucket.tokens = 50
+    assert bucket.wait_for(50) == 0
+    # 50 + 20% of 100 must be left: 20 tokens short at 1 token/s
+    assert bucket.wait_for(50, reserve=0.2) == pytest.approx(20.0)
+
+
+def test_least_loaded_key_is_picked(clock):
+    pool = KeyPool("Groq", ["key-a", "key-b"], rpm=30, tpm=8000)
+    first, _ = pool.try_acquire(100)
+    second, _ = pool.try_acquire(100)
+    assert {first, second} == {"key-a", "key-b"}
+
+
+def test_exhausted_pool_reports_the_wait(clock):
+    pool = KeyPool("Groq", ["key-a"], rpm=60, tpm=1000)
+    key, _ = pool.try_acquire(800, priority=True)
+    assert key == "key-a"
+
+    key, wait = pool.try_acquire(800, priority=True)
+    assert key is None
+    # 600 tokens missing at 1000/60 tokens per second
+    assert wait == pytest.approx(36.0)
+
+
+def test_reserve_is_kept_for_priority_requests(clock):
+    pool = KeyPool("Groq", ["key-a"], rpm=30, tpm=1000)
+    key, _ = pool.try_acquire(750)
+    assert key == "key-a"
+
+    key, _ = pool.try_acquire(100)
+    assert key is None
+    key, _ = pool.try_acquire(100, priority=True)
+    assert key == "key-a"
+
+
+def test_release_reconciles_usage_and_rate_limit_headers(clock):
+    pool = KeyPool("Groq", ["key-a"], rpm=30, tpm=8000)
+    key, _ = pool.try_acquire(1000)
+    pool.release(key, 1000, 200, {"x-ratelimit-remaining-requests": "5"}, used_tokens=400)
+
+    stats = pool.stats()[0]
+    assert stats["in_flight"] == 0
+    assert stats["tokens_left"] == 7600
+    assert stats["requests_left"] == 5
+
+
+def test_rate_limited_key_cools_down(clock):
+    pool = KeyPool("Groq", ["key-a", "key-b"], rpm=30, tpm=8000)
+    pool.release("key-a", 0, 429, {"retry-after": "10"})
+    assert pool.available()
+
+    keys = {pool.try_acquire(10)[0] for _ in range(3)}
+    assert keys == {"key-b"}
+
+    clock.now += 10
+    pool.release("key-b", 0, 429, {"x-ratelimit-reset-requests": "1m"})
+    assert pool.try_acquire(10)[0] == "key-a"
+
+
+def test_parse_reset_duration():
+    assert parse_reset_duration("1m2.5s") == pytest.approx(62.5)
+    assert parse_reset_duration("20ms") == pytest.approx(0.02)
+    assert parse_reset_duration("7") == 7.0
+    assert parse_reset_duration(None) is None
+
+
+class FakeResponse:
+    def __init__(self, status_code):
+        self.status_code = status_code
+
+
+def _registry(monkeypatch, answers):
+    registry = KeyPoolRegistry()
+    registry.pools = {provider: KeyPool(provider, [f"{provider}-key"], 30, 8000) for provider in answers}
+    sent = []
+
+    async def post_json(provider, url, payload, priority=True):
+        sent.append((provider, payload["model"]))
+        answer = answers[provider]
+        if isinstance(answer, Exception):
+            raise answer
+        return FakeResponse(answer)
+
+    monkeypatch.setattr(registry, "post_json", post_json)
+    return registry, sent
+
+
+ROUTES = [("Groq", "https://groq", "groq-model"), ("Gemini", "https://gemini", "gemini-model"),
+          ("OpenAI", "https://openai", "openai-model")]
+
+
+def test_post_chat_fails_over_on_rate_limits_and_missing_keys(monkeypatch):
+    registry, sent = _registry(monkeypatch, {"Groq": 429, "Gemini": NoKeyAvailable("empty"), "OpenAI": 200})
+    response = asyncio.run(registry.post_chat(ROUTES, {"messages": []}))
+    assert response.status_code == 200
+    assert sent == [("Groq", "groq-model"), ("Gemini", "gemini-model"), ("OpenAI", "openai-model")]
+
+
+def test_post_chat_skips_unconfigured_providers(monkeypatch):
+    registry, sent = _registry(monkeypatch, {"OpenAI": 200})
+    asyncio.run(registry.post_chat(ROUTES, {"messages": []}))
+    assert sent == [("OpenAI", "openai-model")]
+
+
+def test_post_chat_returns_the_last_error_or_raises(monkeypatch):
+    registry, _ = _registry(monkeypatch, {"Groq": 503, "Gemini": 500})
+    assert asyncio.run(registry.post_chat(ROUTES, {})).status_code == 500
+
+    registry, _ = _registry(monkeypatch, {"Groq": NoKeyAvailable("empty")})
+    with pytest.raises(NoKeyAvailable):
+        asyncio.run(registry.post_chat(ROUTES, {}))
@@ -0,0 +1,65 @@
+import json
+
+import pytest
+
+pytest.importorskip("pydantic_settings")
+pytest.importorskip("httpx")
+
+from app.services.llm_service import LLMService
+
+GROQ = {"name": "Groq", "provider": "Groq", "model": "llama"}
+OPENAI = {"name": "OpenAI", "provider": "OpenAI", "model": "gpt"}
+
+
+def _tools(description="Searches the web"):
+    return [{"function_declarations": [{
+        "name": "google_search",
+        "description": description,
+        "parameters": {"type": "object", "properties": {"query": {"type": "string"}}},
+    }]}]
+
+
+def test_prefix_is_compiled_once_per_declaration_set():
+    service = LLMService()
+    tools = _tools()
+    prefix = service._compile_prefix(tools)
+
+    assert service._compile_prefix(tools) is prefix
+    assert prefix["tools"][0]["function"]["name"] == "google_search"
+
+    changed = service._compile_prefix(_tools("Searches the web for news"))
+    assert changed is not prefix and changed["version"] != prefix["version"]
+    # An equal declaration set compiles to the same version
+    assert service._compile_prefix(_tools())["version"] == prefix["version"]
+
+    service.system_instruction += " Be brief."
+    assert service._compile_prefix(tools)["version"] != prefix["version"]
+
+
+def test_payload_splices_the_prefix_in_verbatim():
+    service = LLMService()
+    prefix = service._compile_prefix(_tools())
+    first = service._encode_payload(GROQ, [{"role": "user", "content": "hi"}], prefix)
+    second = service._encode_payload(GROQ, [{"role": "user", "content": "something else"}], prefix)
+
+    body = json.loads(first)
+    assert body["model"] == "llama" and body["temperature"] == 0.0
+    assert body["tools"] == prefix["tools"]
+    assert body["messages"] == [{"role": "system", "content": service.system_instruction},
+                                {"role": "user", "content": "hi"}]
+    assert "prompt_cache_key" not in body and "stream" not in body
+
+    # Everything up to the per-call messages is byte-identical
+    shared = first.index(b'{"role": "user"')
+    assert first[:shared] == second[:shared]
+
+
+def test_openai_requests_carry_the_prefix_version_as_cache_key():
+    service = LLMService()
+    prefix = service._compile_prefix(None)
+    body = json.loads(service._encode_payload(OPENAI, [], prefix, stream=True))
+
+    assert body["prompt_cache_key"] == prefix["version"]
+    assert body["stream"] is True
+    assert "tools" not in body
+    assert body["messages"] == [{"role": "system", "content": service.system_instruction}]
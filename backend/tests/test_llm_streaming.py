@@ -0,0 +1,92 @@
+import asyncio
+import json
+from contextlib import asynccontextmanager
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("pydantic_settings")
+pytest.importorskip("httpx")
+
+from app.services import llm_service as llm_module
+from app.services.key_pool_service import KeyPool, KeyPoolRegistry
+from app.services.provider_health_service import ProviderHealthRegistry
+
+PRIMARY = {"name": "Gemini", "provider": "Gemini", "model": "m", "url": "gemini-url"}
+BACKUP = {"name": "Groq", "provider": "Groq", "model": "m", "url": "groq-url"}
+
+
+def sse(*deltas):
+    lines = [f"data: {json.dumps({'choices': [{'delta': delta}]})}" for delta in deltas]
+    return lines + ["", "data: [DONE]"]
+
+
+class StreamingClient:
+    """Streams the scripted SSE lines (or fails with the scripted status) per URL"""
+    def __init__(self, replies):
+        self.replies, self.urls = replies, []
+
+    @asynccontextmanager
+    async def stream(self, method, url, content=None, headers=None, timeout=None):
+        self.urls.append(url)
+        status, lines = self.replies[url]
+
+        async def aiter_lines():
+            for line in lines:
+                await asyncio.sleep(0)
+                yield line
+
+        async def aread():
+            return b"unavailable"
+
+        yield SimpleNamespace(status_code=status, headers={}, aiter_lines=aiter_lines, aread=aread)
+
+
+@pytest.fixture
+def service(monkeypatch):
+    pools = KeyPoolRegistry()
+    pools.pools = {"Gemini": KeyPool("Gemini", ["g"], 60, 100_000), "Groq": KeyPool("Groq", ["q"], 60, 100_000)}
+    monkeypatch.setattr(llm_module, "key_pools", pools)
+    monkeypatch.setattr(llm_module, "provider_health", ProviderHealthRegistry())
+    service = llm_module.LLMService()
+    monkeypatch.setattr(service, "_provider_configs", lambda: [PRIMARY, BACKUP])
+    service.pools = pools
+    return service
+
+
+def _stream(service, monkeypatch, replies, message="hi"):
+    client = StreamingClient(replies)
+    monkeypatch.setattr(llm_module.http_pool, "client_for", lambda url: client)
+
+    async def collect():
+        return [event async for event in service.stream_raw_response(message, use_cache=False)]
+    return asyncio.run(collect()), client
+
+
+def test_tokens_stream_and_tool_call_deltas_are_reassembled(service, monkeypatch):
+    events, _ = _stream(service, monkeypatch, {"gemini-url": (200, sse(
+        {"content": "Let me "},
+        {"content": "check."},
+        {"tool_calls": [{"index": 0, "id": "c1", "function": {"name": "google_", "arguments": '{"query"'}}]},
+        {"tool_calls": [{"index": 0, "function": {"name": "search", "arguments": ': "btc"}'}}]},
+    ))})
+
+    assert [e["text"] for e in events if e["type"] == "token"] == ["Let me ", "check."]
+    assert events[-1]["type"] == "response"
+    message = events[-1]["response"]["choices"][0]["message"]
+    assert message["content"] == "Let me check."
+    assert message["tool_calls"] == [
+        {"id": "c1", "type": "function", "function": {"name": "google_search", "arguments": '{"query": "btc"}'}}
+    ]
+    assert [key.in_flight for pool in service.pools.pools.values() for key in pool.keys] == [0, 0]
+
+
+def test_a_provider_failing_before_any_token_falls_back(service, monkeypatch):
+    events, client = _stream(service, monkeypatch, {
+        "gemini-url": (503, []),
+        "groq-url": (200, sse({"content": "Hello"})),
+    })
+
+    assert client.urls == ["gemini-url", "groq-url"]
+    assert [e["type"] for e in events] == ["token", "response"]
+    assert events[-1]["response"]["choices"][0]["message"] == {"role": "assistant", "content": "Hello"}
@@ -0,0 +1,138 @@
+import asyncio
+import json
+
+import pytest
+
+pytest.importorskip("pydantic_settings")
+pytest.importorskip("app.services.plan_cache_service")
+
+from app.core.config import settings
+from app.services import planner_service as planner_module
+from app.services.plan_cache_service import PlanCache, context_dependent, normalize
+
+PLAN = {"reasoning": "r", "steps": ["browse https://a.com", "summarize it"]}
+
+
+@pytest.fixture
+def tool_version(monkeypatch):
+    version = {"value": "v1"}
+    monkeypatch.setattr(PlanCache, "version", property(lambda self: version["value"]))
+    return version
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch, tool_version):
+    monkeypatch.setattr(settings, "PLAN_CACHE_ENABLED", True)
+    monkeypatch.setattr(settings, "PLAN_CACHE_SIMILARITY", 0.8)
+    monkeypatch.setattr(settings, "PLAN_CACHE_HISTORY_TURNS", 4)
+    return PlanCache(str(tmp_path / "templates.json"))
+
+
+def test_normalize_replaces_slots_with_placeholders():
+    structure, slots = normalize("Summarize https://a.com and mail bob@x.io 3 times")
+    assert structure == "summarize <url> and mail <email> <num> times"
+    assert slots == [("url", "https://a.com"), ("email", "bob@x.io"), ("num", "3")]
+
+
+def test_short_and_anaphoric_requests_depend_on_context():
+    assert context_dependent("yes, send it")
+    assert context_dependent("do that")
+    assert not context_dependent("summarize https://a.com for me")
+
+
+def test_exact_hit_is_scoped_to_user_and_history(cache):
+    request = "summarize https://a.com for me"
+    history = [{"role": "user", "parts": [{"text": "earlier turn"}]}]
+    cache.set(request, PLAN, user_id="alice", history=history)
+
+    assert cache.get(request, "alice", history)["source"] == "exact"
+    assert cache.get(request, "bob", history) is None
+    assert cache.get(request, "alice", None) is None
+
+
+def test_contextual_requests_are_never_cached(cache):
+    cache.set("yes, send it", PLAN, user_id="alice")
+    assert cache.get("yes, send it", "alice") is None
+    assert len(cache.entries) == 0
+
+
+def test_changing_the_tool_set_invalidates_entries(cache, tool_version):
+    cache.set("summarize https://a.com for me", PLAN, user_id="alice")
+    tool_version["value"] = "v2"
+    assert cache.get("summarize https://a.com for me", "alice") is None
+
+
+def test_only_validated_plans_can_be_promoted(cache):
+    request = "summarize https://a.com for me"
+    with pytest.raises(KeyError):
+        cache.promote(request, "summary", "alice")
+
+    cache.set(request, PLAN, user_id="alice")
+    with pytest.raises(ValueError):
+        cache.promote(request, "summary", "alice")
+
+    cache.mark_validated(request, "alice")
+    assert cache.promote(request, "summary", "alice")["name"] == "summary"
+
+
+def test_templates_are_refilled_and_private_to_their_owner(cache):
+    history = [{"role": "user", "parts": [{"text": "hi"}]}]
+    request = "summarize https://a.com for me"
+    cache.set(request, PLAN, user_id="alice", history=history)
+    cache.mark_validated(request, "alice", history)
+    cache.promote(request, "summary", "alice")
+
+    hit = cache.get("summarize https://b.com for me", "alice")
+    assert hit["source"] == "template:summary"
+    assert hit["plan"]["steps"] == ["browse https://b.com", "summarize it"]
+    assert cache.get("summarize https://b.com for me", "bob") is None
+    assert [t["name"] for t in cache.list_templates("alice")] == ["summary"]
+    assert cache.list_templates("bob") == []
+
+
+def test_templates_persist_and_turn_stale(cache, tool_version, tmp_path):
+    request = "summarize https://a.com for me"
+    cache.set(request, PLAN, user_id="alice")
+    cache.mark_validated(request, "alice")
+    cache.promote(request, "summary", "alice")
+
+    reloaded = PlanCache(str(tmp_path / "templates.json"))
+    assert reloaded.list_templates("alice")[0]["stale"] is False
+    tool_version["value"] = "v2"
+    assert reloaded.list_templates("alice")[0]["stale"] is True
+    assert reloaded.get("summarize https://b.com for me", "alice") is None
+
+    assert reloaded.delete_template("summary", "alice")
+    assert not reloaded.delete_template("summary", "alice")
+
+
+@pytest.fixture
+def planner(cache, monkeypatch):
+    async def request(payload):
+        return {"choices": [{"message": {"content": json.dumps(PLAN)}}]}
+
+    monkeypatch.setattr(planner_module, "plan_cache", cache)
+    monkeypatch.setattr(planner_module.planner_service, "_request", request)
+    return planner_module.planner_service
+
+
+def test_planner_caches_plans_under_the_resolved_intent(cache, planner):
+    request = "compare https://a.com with the docs"
+    asyncio.run(planner.generate_plan(request, user_id="alice", intent="HYBRID"))
+    assert cache.get(request, "alice")["intent"] == "HYBRID"
+
+
+def test_speculative_plans_wait_for_the_intent(cache, planner):
+    request = "compare https://b.com with the docs"
+
+    async def scenario():
+        intent = asyncio.get_running_loop().create_future()
+        task = asyncio.create_task(planner.generate_plan(request, user_id="alice", intent=intent))
+        await asyncio.sleep(0.01)
+        cached_early = cache.get(request, "alice")
+        intent.set_result("HYBRID")
+        await task
+        return cached_early
+
+    assert asyncio.run(scenario()) is None
+    assert cache.get(request, "alice")["intent"] == "HYBRID"
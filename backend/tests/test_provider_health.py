@@ -0,0 +1,104 @@
+import pytest
+
+pytest.importorskip("pydantic_settings")
+
+from app.core.config import settings
+from app.services.provider_health_service import ProviderHealth, ProviderHealthRegistry, parse_retry_after
+
+
+@pytest.fixture(autouse=True)
+def breaker_settings(monkeypatch):
+    monkeypatch.setattr(settings, "LLM_BREAKER_FAILURE_THRESHOLD", 3)
+    monkeypatch.setattr(settings, "LLM_BREAKER_OPEN_SECONDS", 30.0)
+    monkeypatch.setattr(settings, "LLM_HEALTH_EWMA_ALPHA", 0.3)
+
+
+def test_circuit_opens_after_consecutive_failures():
+    health = ProviderHealth("Groq")
+    for _ in range(2):
+        health.record_failure(now=0.0)
+    assert health.state == ProviderHealth.CLOSED
+
+    health.record_failure(now=0.0)
+    assert health.state == ProviderHealth.OPEN
+    assert not health.is_available(10.0)
+    assert health.is_available(30.0)
+
+
+def test_a_success_resets_the_failure_count():
+    health = ProviderHealth("Groq")
+    health.record_failure(now=0.0)
+    health.record_failure(now=0.0)
+    health.record_success(0.5)
+    health.record_failure(now=0.0)
+    assert health.state == ProviderHealth.CLOSED
+
+
+def test_half_open_allows_a_single_probe():
+    health = ProviderHealth("Groq")
+    health.record_failure(now=0.0, retry_after=5.0)
+    assert health.state == ProviderHealth.OPEN
+
+    assert health.acquire(5.0)
+    assert health.state == ProviderHealth.HALF_OPEN
+    assert not health.acquire(5.1)
+
+    health.record_success(0.2)
+    assert health.state == ProviderHealth.CLOSED
+    assert health.acquire(5.2)
+
+
+def test_failed_probe_reopens_the_circuit():
+    health = ProviderHealth("Groq")
+    health.record_failure(now=0.0, retry_after=5.0)
+    assert health.acquire(5.0)
+
+    health.record_failure(now=5.0)
+    assert health.state == ProviderHealth.OPEN
+    assert health.open_until == 35.0
+
+
+def test_released_probe_frees_the_slot():
+    health = ProviderHealth("Groq")
+    health.record_failure(now=0.0, retry_after=1.0)
+    assert health.acquire(1.0)
+    health.release_probe()
+    assert health.acquire(1.1)
+
+
+def test_registry_skips_open_providers_and_falls_back_to_the_soonest():
+    registry = ProviderHealthRegistry()
+    configs = [{"provider": "Gemini"}, {"provider": "Groq"}]
+    for _ in range(3):
+        registry.record_failure("Gemini", status_code=503)
+
+    ordered = registry.order(configs)
+    assert [c["provider"] for c in ordered] == ["Groq"]
+
+    for _ in range(3):
+        registry.record_failure("Groq")
+    ordered = registry.order(configs)
+    assert len(ordered) == 1 and ordered[0]["last_resort"]
+    assert registry.acquire(ordered[0])
+
+
+def test_request_errors_do_not_count_against_the_provider():
+    registry = ProviderHealthRegistry()
+    for _ in range(5):
+        registry.record_failure("Groq", status_code=400)
+    assert registry.snapshot()["Groq"]["state"] == ProviderHealth.CLOSED
+
+
+def test_rate_limit_opens_for_retry_after():
+    registry = ProviderHealthRegistry()
+    registry.record_failure("Groq", status_code=429, retry_after="120")
+    snapshot = registry.snapshot()["Groq"]
+    assert snapshot["state"] == ProviderHealth.OPEN
+    assert snapshot["open_for_s"] > 100
+
+
+def test_parse_retry_after():
+    assert parse_retry_after("12") == 12.0
+    assert parse_retry_after("-3") == 0.0
+    assert parse_retry_after(None) is None
+    assert parse_retry_after("not a date") is None
@@ -0,0 +1,132 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("pydantic_settings")
+pytest.importorskip("supabase")
+
+from app.core.config import settings
+from app.services import session_history_service
+from app.services.session_history_service import SessionHistoryStore, SessionNotFound, session_scope
+
+
+class FakeQuery:
+    def __init__(self, db, table):
+        self.db, self.table, self.filters = db, table, {}
+
+    def select(self, columns):
+        return self
+
+    def eq(self, column, value):
+        self.filters[column] = value
+        return self
+
+    def order(self, column, desc=False):
+        return self
+
+    def limit(self, count):
+        return self
+
+    def insert(self, row):
+        self.db.inserted.append(row)
+        return self
+
+    def update(self, values):
+        return self
+
+    def execute(self):
+        if self.table == "chat_sessions":
+            data = [s for s in self.db.sessions if s["id"] == self.filters.get("id")]
+        else:
+            data = [m for m in self.db.messages if m["session_id"] == self.filters.get("session_id")]
+        return SimpleNamespace(data=data)
+
+
+class FakeSupabase:
+    def __init__(self, sessions=(), messages=()):
+        self.sessions, self.messages, self.inserted = list(sessions), list(messages), []
+
+    def table(self, name):
+        return FakeQuery(self, name)
+
+    def rpc(self, name, params):
+        return FakeQuery(self, name)
+
+
+@pytest.fixture
+def db(monkeypatch):
+    db = FakeSupabase(
+        sessions=[{"id": "s1", "user_id": "alice"}],
+        # Newest first, as the query orders them; the last exchange shares a timestamp
+        messages=[
+            {"session_id": "s1", "text": "answer 2", "sender": "ai", "created_at": "2026-01-01T00:00:02"},
+            {"session_id": "s1", "text": "question 2", "sender": "user", "created_at": "2026-01-01T00:00:02"},
+            {"session_id": "s1", "text": "answer 1", "sender": "ai", "created_at": "2026-01-01T00:00:01"},
+            {"session_id": "s1", "text": "question 1", "sender": "user", "created_at": "2026-01-01T00:00:00"},
+        ],
+    )
+    monkeypatch.setattr(session_history_service, "supabase_client", SimpleNamespace(client=db))
+    monkeypatch.setattr(settings, "SESSION_HISTORY_MAX_MESSAGES", 40)
+    return db
+
+
+def _texts(history):
+    return [(entry["role"], entry["parts"][0]["text"]) for entry in history]
+
+
+def test_persisted_turns_load_in_order_even_with_equal_timestamps(db):
+    history = asyncio.run(SessionHistoryStore().load("s1", "alice"))
+    assert _texts(history) == [
+        ("user", "question 1"), ("model", "answer 1"), ("user", "question 2"), ("model", "answer 2"),
+    ]
+
+
+def test_sessions_of_other_users_are_not_found(db):
+    with pytest.raises(SessionNotFound):
+        asyncio.run(SessionHistoryStore().load("s1", "mallory"))
+
+
+def test_append_writes_through_one_row_at_a_time(db):
+    store = SessionHistoryStore()
+
+    async def scenario():
+        await store.load("s1", "alice")
+        await store.append("s1", "alice", "question 3", "answer 3")
+        return await store.load("s1", "alice")
+
+    history = asyncio.run(scenario())
+    assert _texts(history)[-2:] == [("user", "question 3"), ("model", "answer 3")]
+    assert [(row["text"], row["sender"]) for row in db.inserted] == [("question 3", "user"), ("answer 3", "ai")]
+    assert all("created_at" not in row for row in db.inserted)
+
+
+def test_in_memory_sessions_are_private_to_their_user(db):
+    store = SessionHistoryStore()
+
+    async def scenario():
+        await store.append("telegram_42", "alice", "hi", "hello")
+        return await store.load("telegram_42", "alice"), await store.load("telegram_42", "bob")
+
+    alice, bob = asyncio.run(scenario())
+    assert _texts(alice) == [("user", "hi"), ("model", "hello")]
+    assert bob == []
+    assert db.inserted == []
+
+
+def test_forget_drops_the_session_for_every_user(db):
+    store = SessionHistoryStore()
+
+    async def scenario():
+        await store.append("tmp", "alice", "a", "b")
+        await store.append("tmp", "bob", "c", "d")
+        store.forget("tmp")
+        return await store.load("tmp", "alice"), await store.load("tmp", "bob")
+
+    assert asyncio.run(scenario()) == ([], [])
+
+
+def test_session_scope():
+    assert session_scope("alice", "s1") == "alice/s1"
+    assert session_scope(None, "s1") is None
+    assert session_scope("alice", None) is None
@@ -0,0 +1,99 @@
+import asyncio
+
+import pytest
+
+from app.core.singleflight import SingleFlight
+
+
+def test_concurrent_callers_share_one_call():
+    calls = []
+
+    async def scenario():
+        flights = SingleFlight("test")
+        release = asyncio.Event()
+
+        async def fetch():
+            calls.append(1)
+            await release.wait()
+            return {"value": 42}
+
+        callers = [asyncio.ensure_future(flights.do("key", fetch)) for _ in range(5)]
+        await asyncio.sleep(0)
+        assert len(flights) == 1
+        release.set()
+        results = await asyncio.gather(*callers)
+        await asyncio.sleep(0)
+        return flights, results
+
+    flights, results = asyncio.run(scenario())
+    assert len(calls) == 1
+    assert all(result is results[0] for result in results)
+    assert len(flights) == 0
+
+
+def test_different_keys_do_not_share():
+    calls = []
+
+    async def scenario():
+        flights = SingleFlight("test")
+
+        async def fetch(key):
+            calls.append(key)
+            await asyncio.sleep(0)
+            return key
+
+        return await asyncio.gather(flights.do("a", lambda: fetch("a")), flights.do("b", lambda: fetch("b")))
+
+    assert asyncio.run(scenario()) == ["a", "b"]
+    assert sorted(calls) == ["a", "b"]
+
+
+def test_nothing_is_cached_after_the_call_finishes():
+    calls = []
+
+    async def scenario():
+        flights = SingleFlight("test")
+
+        async def fetch():
+            calls.append(1)
+            return len(calls)
+
+        return [await flights.do("key", fetch), await flights.do("key", fetch)]
+
+    assert asyncio.run(scenario()) == [1, 2]
+
+
+def test_every_caller_receives_the_exception():
+    async def scenario():
+        flights = SingleFlight("test")
+
+        async def fetch():
+            await asyncio.sleep(0)
+            raise ValueError("upstream failed")
+
+        return await asyncio.gather(flights.do("key", fetch), flights.do("key", fetch), return_exceptions=True)
+
+    results = asyncio.run(scenario())
+    assert all(isinstance(result, ValueError) for result in results)
+
+
+def test_a_cancelled_caller_does_not_cancel_the_shared_call():
+    async def scenario():
+        flights = SingleFlight("test")
+        release = asyncio.Event()
+
+        async def fetch():
+            await release.wait()
+            return "done"
+
+        first = asyncio.ensure_future(flights.do("key", fetch))
+        second = asyncio.ensure_future(flights.do("key", fetch))
+        await asyncio.sleep(0)
+        first.cancel()
+        await asyncio.sleep(0)
+        release.set()
+        with pytest.raises(asyncio.CancelledError):
+            await first
+        return await second
+
+    assert asyncio.run(scenario()) == "done"
@@ -0,0 +1,49 @@
+import asyncio
+import io
+
+import pytest
+
+pytest.importorskip("pydantic_settings")
+pytest.importorskip("supabase")
+
+from app.db import supabase_client as supabase_module
+from app.db.supabase_client import supabase_client
+
+
+class FakeResponse:
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    def raise_for_status(self):
+        pass
+
+    async def aiter_bytes(self, chunk_size):
+        for chunk in (b"hello ", b"world"):
+            yield chunk
+
+
+class FakeClient:
+    def __init__(self):
+        self.urls = []
+
+    def stream(self, method, url, headers=None, timeout=None):
+        self.urls.append(url)
+        return FakeResponse()
+
+
+def test_downloads_stream_through_the_shared_pool_with_a_quoted_path(monkeypatch):
+    client = FakeClient()
+    pooled_for = []
+    monkeypatch.setattr(supabase_module.http_pool, "client_for", lambda url: pooled_for.append(url) or client)
+    monkeypatch.setattr(supabase_client, "_client", object())
+    monkeypatch.setattr(supabase_client, "_url", "https://db.example.co")
+    monkeypatch.setattr(supabase_client, "_key", "key")
+
+    destination = io.BytesIO()
+    written = asyncio.run(supabase_client.download_file_to("docs", "user 1/Q1 #2?.pdf", destination))
+
+    assert written == 11 and destination.getvalue() == b"hello world"
+    assert client.urls == pooled_for == ["https://db.example.co/storage/v1/object/docs/user%201/Q1%20%232%3F.pdf"]
@@ -0,0 +1,62 @@
+import pytest
+
+pytest.importorskip("pydantic_settings")
+
+from app.core.config import settings
+from app.services.tool_memo_service import ToolMemo, canonical_args, reads, writes
+
+
+@pytest.fixture
+def memo(monkeypatch):
+    monkeypatch.setattr(settings, "TOOL_MEMO_ENABLED", True)
+    return ToolMemo()
+
+
+def test_canonical_args_ignore_order_and_none():
+    assert canonical_args({"b": 1, "a": None, "c": "x"}) == canonical_args({"c": "x", "b": 1})
+
+
+def test_resources_are_normalized_file_paths():
+    assert reads("read_pdf", {"filename": "./docs/../report.pdf"}) == frozenset({"file:report.pdf"})
+    assert writes("write_file", {"filename": "report.pdf"}) == frozenset({"file:report.pdf"})
+    assert reads("ask_document", {"query": "q"}) == writes("index_agent_files", {})
+
+
+def test_results_are_memoized_per_session(memo):
+    memo.set("user-1/s1", "google_search", {"query": "x"}, "result")
+    assert memo.get("user-1/s1", "google_search", {"query": "x"}) == "result"
+    assert memo.get("user-1/s2", "google_search", {"query": "x"}) is None
+    assert memo.get("user-1/s1", "google_search", {"query": "y"}) is None
+
+
+def test_sessionless_calls_and_tools_without_a_ttl_are_not_memoized(memo):
+    memo.set(None, "google_search", {"query": "x"}, "result")
+    memo.set("s1", "write_file", {"filename": "a.txt"}, "written")
+    assert memo.get(None, "google_search", {"query": "x"}) is None
+    assert memo.get("s1", "write_file", {"filename": "a.txt"}) is None
+
+
+def test_writes_invalidate_reads_of_the_same_file_in_every_session(memo):
+    memo.set("s1", "read_pdf", {"filename": "a.pdf"}, "old a")
+    memo.set("s2", "read_pdf", {"filename": "a.pdf"}, "old a")
+    memo.set("s1", "read_pdf", {"filename": "b.pdf"}, "b")
+
+    assert memo.invalidate("write_file", {"filename": "a.pdf"}) == 2
+    assert memo.get("s1", "read_pdf", {"filename": "a.pdf"}) is None
+    assert memo.get("s1", "read_pdf", {"filename": "b.pdf"}) == "b"
+
+
+def test_cloning_a_repository_invalidates_every_file_read(memo):
+    memo.set("s1", "read_pdf", {"filename": "a.pdf"}, "a")
+    memo.set("s1", "analyze_data", {"filename": "b.csv"}, "b")
+    memo.set("s1", "google_search", {"query": "x"}, "web")
+
+    assert memo.invalidate("clone_repository", {"repo_url": "https://github.com/x/y"}) == 2
+    assert memo.get("s1", "google_search", {"query": "x"}) == "web"
+
+
+def test_clear_session(memo):
+    memo.set("s1", "google_search", {"query": "x"}, "a")
+    memo.set("s2", "google_search", {"query": "x"}, "b")
+    assert memo.clear_session("s1") == 1
+    assert memo.get("s2", "google_search", {"query": "x"}) == "b"
@@ -0,0 +1,68 @@
+import pytest
+
+pytest.importorskip("pydantic_settings")
+
+from app.core.config import settings
+from app.services.context_builder import ContextBuilder
+from app.services.tool_result_store import EXPAND_TOOL_RESULT, ToolResultStore, tool_result_store
+
+
+@pytest.fixture(autouse=True)
+def reference_settings(monkeypatch):
+    monkeypatch.setattr(settings, "TOOL_RESULT_EXPAND_MAX_CHARS", 100)
+    monkeypatch.setattr(settings, "TOOL_RESULT_REFS_ENABLED", True)
+    monkeypatch.setattr(settings, "TOOL_RESULT_REF_MIN_CHARS", 50)
+    monkeypatch.setattr(settings, "TOOL_RESULT_PREVIEW_CHARS", 10)
+
+
+def test_handles_are_content_hashes():
+    store = ToolResultStore()
+    assert store.put("same text") == store.put("same text")
+    assert store.put("same text") != store.put("other text")
+
+
+def test_read_returns_bounded_slices():
+    store = ToolResultStore()
+    handle = store.put("".join(str(i % 10) for i in range(500)))
+    assert store.read(handle, offset=10, length=5) == "01234"
+    assert len(store.read(handle)) == 100
+    assert len(store.read(handle, length=1000)) == 100
+    assert store.read("ref_unknown") is None
+
+
+def _tool_turn(call_id, result):
+    return [
+        {"role": "model", "parts": [{"function_call": {"id": call_id, "name": "google_search", "args": {}}}]},
+        {"role": "function", "parts": [{"function_response": {"id": call_id, "name": "google_search",
+                                                              "response": {"result": result}}}]},
+    ]
+
+
+def _results(history):
+    return [p["function_response"]["response"]["result"] for e in history for p in e["parts"] if "function_response" in p]
+
+
+def test_consumed_results_are_replaced_by_expandable_references():
+    old, new = "a" * 500, "b" * 500
+    history = [{"role": "user", "parts": [{"text": "go"}]}, *_tool_turn("c1", old), *_tool_turn("c2", new)]
+    _, kept = ContextBuilder(token_budget=100_000).build(history, scope="alice/s1")
+
+    referenced, latest = _results(kept)
+    assert latest == new
+    assert EXPAND_TOOL_RESULT in referenced and len(referenced) < len(old)
+    handle = referenced.split("stored as ")[1].split(";")[0]
+    assert tool_result_store.read(handle, "alice/s1", length=100) == "a" * 100
+
+
+def test_results_only_read_back_in_their_own_scope():
+    store = ToolResultStore()
+    handle = store.put("alice's inbox", scope="alice/s1")
+    assert store.read(handle, "alice/s1") == "alice's inbox"
+    assert store.read(handle, "mallory/s1") is None
+    assert store.read(handle) is None
+
+
+def test_references_are_stable_across_iterations():
+    history = [{"role": "user", "parts": [{"text": "go"}]}, *_tool_turn("c1", "a" * 500), *_tool_turn("c2", "b" * 500)]
+    builder = ContextBuilder(token_budget=100_000)
+    assert builder.build(history) == builder.build(history)
@@ -0,0 +1,63 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip("pydantic_settings")
+pytest.importorskip("app.services.tool_router")
+
+from app.core.config import settings
+from app.core.metrics import metrics
+from app.services.tool_router import ToolRouter
+
+DECLARATIONS = [
+    {"name": name, "description": f"{name} tool", "parameters": {"type": "object", "properties": {}}}
+    for name in ("google_search", "expand_tool_result", "browse_url", "create_pdf", "clone_repository",
+                 "open_in_editor", "take_screenshot")
+]
+
+
+@pytest.fixture
+def router(monkeypatch):
+    monkeypatch.setattr(settings, "TOOL_ROUTER_ENABLED", True)
+    monkeypatch.setattr(settings, "TOOL_ROUTER_TOP_K", 1)
+    monkeypatch.setattr(ToolRouter, "declarations", property(lambda self: DECLARATIONS))
+    router = ToolRouter()
+    router.semantic_queries = []
+
+    async def similarities(query):
+        router.semantic_queries.append(query)
+        return {decl["name"]: 1.0 if decl["name"] == "take_screenshot" else 0.0 for decl in DECLARATIONS}
+
+    monkeypatch.setattr(router, "_similarities", similarities)
+    return router
+
+
+def _select(router, message, intent="TASK"):
+    before = metrics.get("tools.router_keyword_only")
+    selected = asyncio.run(router.select(message, intent))
+    return selected, metrics.get("tools.router_keyword_only") - before
+
+
+def test_tool_names_only_match_as_whole_words(router):
+    selected, _ = _select(router, "use create_pdf for this")
+    assert "create_pdf" in selected
+    selected, _ = _select(router, "what do my create_pdfs look like")
+    assert "create_pdf" not in selected
+
+
+def test_keyword_matches_skip_the_semantic_step(router):
+    selected, keyword_only = _select(router, "clone the github repo")
+    assert {"clone_repository", "open_in_editor"} <= selected
+    assert keyword_only == 1 and router.semantic_queries == []
+
+
+def test_tasks_without_keyword_matches_are_ranked_semantically(router):
+    selected, keyword_only = _select(router, "grab an image of the front page")
+    assert "take_screenshot" in selected
+    assert keyword_only == 0 and router.semantic_queries == ["grab an image of the front page"]
+
+
+def test_chat_gets_the_core_tools_and_is_not_counted_as_keyword_routing(router):
+    selected, keyword_only = _select(router, "tell me a joke", intent="CHAT")
+    assert selected == {"google_search", "expand_tool_result"}
+    assert keyword_only == 0 and router.semantic_queries == []
@@ -0,0 +1,90 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip("pydantic_settings")
+pytest.importorskip("app.services.tool_scheduler")
+
+from app.core.config import settings
+from app.services.tool_scheduler import ToolScheduler
+
+
+@pytest.fixture(autouse=True)
+def parallel(monkeypatch):
+    monkeypatch.setattr(settings, "TOOL_PARALLEL_EXECUTION", True)
+    monkeypatch.setattr(settings, "TOOL_DEFAULT_CONCURRENCY", 4)
+
+
+def calls(*names):
+    return [{"name": name, "args": {"n": index}} for index, name in enumerate(names)]
+
+
+def test_reads_share_a_phase_and_writes_run_alone():
+    phases = ToolScheduler().phases(calls("google_search", "browse_url", "write_file", "write_file", "google_search"))
+    assert phases == [[0, 1], [2], [3], [4]]
+
+
+def test_sequential_mode_runs_one_call_per_phase(monkeypatch):
+    monkeypatch.setattr(settings, "TOOL_PARALLEL_EXECUTION", False)
+    assert ToolScheduler().phases(calls("google_search", "google_search")) == [[0], [1]]
+
+
+def _run(scheduler, batch, execute):
+    async def collect():
+        return [event async for event in scheduler.run(batch, execute)]
+    return asyncio.run(collect())
+
+
+def test_reads_in_a_phase_overlap():
+    running, peak = 0, 0
+
+    async def execute(name, args):
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        await asyncio.sleep(0.01)
+        running -= 1
+        return f"{name}:{args['n']}"
+
+    events = _run(ToolScheduler(), calls("google_search", "google_search", "google_search"), execute)
+    assert peak == 3
+    assert sorted(result for kind, _, result in events if kind == "end") == [
+        "google_search:0", "google_search:1", "google_search:2"
+    ]
+
+
+def test_a_write_waits_for_the_reads_before_it():
+    order = []
+
+    async def execute(name, args):
+        order.append(("start", args["n"]))
+        await asyncio.sleep(0.01 if name == "google_search" else 0)
+        order.append(("end", args["n"]))
+        return "ok"
+
+    _run(ToolScheduler(), calls("google_search", "google_search", "write_file"), execute)
+    assert order.index(("start", 2)) > order.index(("end", 0))
+    assert order.index(("start", 2)) > order.index(("end", 1))
+
+
+def test_per_tool_limits_cap_concurrency():
+    running, peak = 0, 0
+
+    async def execute(name, args):
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        await asyncio.sleep(0.01)
+        running -= 1
+        return "ok"
+
+    _run(ToolScheduler(), calls(*["reason_over_mission"] * 3), execute)
+    assert peak == 1
+
+
+def test_exceptions_become_error_results():
+    async def execute(name, args):
+        raise RuntimeError("boom")
+
+    events = _run(ToolScheduler(), calls("google_search"), execute)
+    assert events == [("start", 0, None), ("end", 0, "Error executing tool: boom")]